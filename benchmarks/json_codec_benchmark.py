@@ -0,0 +1,82 @@
+"""
+Compare the json codecs of GraphAdminClient on a mails page like the ones returned by list_all_user_mails
+(999 messages with their bodies). Run it from the root of the repository, e.g.:
+
+    python -m benchmarks.json_codec_benchmark --page-size 999 --body-size 20000 --repeat 10
+"""
+import argparse
+import random
+import string
+import time
+from msgraph_async.common.codec import CODECS, get_codec
+from msgraph_async.common.page_parser import PageParser
+
+
+def build_page(page_size: int, body_size: int) -> dict:
+    rnd = random.Random(0)
+
+    def text(size):
+        return "".join(rnd.choice(string.ascii_letters + " ") for _ in range(size))
+
+    return {
+        "@odata.context": "https://graph.microsoft.com/v1.0/$metadata#users('uid')/messages",
+        "value": [{
+            "id": text(150),
+            "createdDateTime": "2021-01-01T00:00:00Z",
+            "receivedDateTime": "2021-01-01T00:00:00Z",
+            "subject": text(60),
+            "bodyPreview": text(255),
+            "isRead": bool(index % 2),
+            "body": {"contentType": "html", "content": f"<html><body>{text(body_size)}</body></html>"},
+            "from": {"emailAddress": {"name": text(20), "address": "a@b.com"}},
+            "toRecipients": [{"emailAddress": {"name": text(20), "address": "c@d.com"}} for _ in range(3)],
+        } for index in range(page_size)],
+        "@odata.nextLink": "https://graph.microsoft.com/v1.0/users/uid/messages?$skip=999",
+    }
+
+
+def measure(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def parse_streamed(data: bytes, chunk_size: int = 64 * 1024):
+    parser = PageParser()
+    for index in range(0, len(data), chunk_size):
+        parser.feed(data[index:index + chunk_size])
+    parser.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-size", type=int, default=999)
+    parser.add_argument("--body-size", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    page = build_page(args.page_size, args.body_size)
+    data = get_codec("json").dumps(page)
+    print(f"page of {args.page_size} messages, {len(data) / 1024 / 1024:.1f} MiB (best of {args.repeat})")
+    print(f"{'codec':<10}{'decode page':>15}{'encode page':>15}")
+
+    baseline = None
+    for name in CODECS:
+        codec = get_codec(name)
+        if codec.name != name:
+            print(f"{name:<10}{'not installed':>15}")
+            continue
+        decode = measure(lambda: codec.loads(data), args.repeat)
+        encode = measure(lambda: codec.dumps(page), args.repeat)
+        baseline = baseline or decode
+        print(f"{name:<10}{decode * 1000:>12.1f} ms{encode * 1000:>12.1f} ms   x{baseline / decode:.1f} decode speedup")
+
+    streamed = measure(lambda: parse_streamed(data), args.repeat)
+    print(f"{'streamed':<10}{streamed * 1000:>12.1f} ms   (stream_items=True, incremental json module parsing)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,9 @@
+import os
+import copy
+import math
 import base64
+import asyncio
+import inspect
 import urllib
 import urllib.parse
 import logging
@@ -8,40 +13,134 @@ from base64 import b64encode
 from msgraph_async.common.constants import *
 from msgraph_async.common.exceptions import *
 from msgraph_async.common.odata_query import *
+from msgraph_async.common.batch import *
+from msgraph_async.common.retry import *
+from msgraph_async.common.rate_limiter import *
+from msgraph_async.common.codec import JsonCodec, get_codec
+from msgraph_async.common.token_cache import TokenCache
+from msgraph_async.common.partitions import *
+from msgraph_async.common.delta_state import *
+from msgraph_async.client.coalescer import GetCoalescer
+from msgraph_async.client.paginator import Paginator, Page, merge_pages
+from msgraph_async.client.delta import DeltaSync
+from msgraph_async.client.drive_walker import walk_tree, FOLDER_KEY
+from msgraph_async.common.page_parser import PageParser
+from msgraph_async.common.quick_xor_hash import quick_xor_hash_file
+from msgraph_async.client.streaming import DownloadStream, PositionalFile, DEFAULT_CHUNK_SIZE, DEFAULT_PART_SIZE, \
+    DEFAULT_PAGE_CHUNK_SIZE
+from msgraph_async.client.upload import ChunkSource, validate_chunk_size, DEFAULT_UPLOAD_CHUNK_SIZE
 from datetime import datetime, timedelta
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from typing import List
 
 from functools import wraps
 
+DEFAULT_EXPECTED_STATUSES = (HTTPStatus.OK, HTTPStatus.NO_CONTENT, HTTPStatus.CREATED, HTTPStatus.ACCEPTED)
+REDIRECT_STATUSES = (HTTPStatus.MOVED_PERMANENTLY, HTTPStatus.FOUND, HTTPStatus.SEE_OTHER,
+                     HTTPStatus.TEMPORARY_REDIRECT, HTTPStatus.PERMANENT_REDIRECT)
+# most bytes of an unexpected streamed response that are read into its exception
+MAX_ERROR_BODY_SIZE = 64 * 1024
+# delays between resumes of an upload when the client has no retry policy
+DEFAULT_RESUME_POLICY = RetryPolicy()
+
+
+async def _authorize(client, kwargs: dict):
+    token = kwargs.get("token")
+    if not token and kwargs.get("tenant_id"):
+        token = kwargs["token"] = await client.get_tenant_token(kwargs["tenant_id"], kwargs.get("app_id"))
+    if not token:
+        token = client._token
+    if not token:
+        raise Exception('Token is not managed so you must explicitly provide it')
+
+    kwargs["_req_headers"]: dict = client._build_auth_header(token)
+    kwargs["_req_headers"].update({"Content-type": "application/json"})
+    if kwargs.get("extra_headers"):
+        kwargs["_req_headers"].update(kwargs["extra_headers"])
+
 
 def authorized(func):
+    """
+    Resolve the token of the call into request headers, the token is taken from (by priority):
+    'token' key-word argument, the token of 'tenant_id' key-word argument (see manage_tenant_tokens) or the
+    token managed by manage_token
+    """
+    if inspect.isasyncgenfunction(func):
+        @wraps(func)
+        async def actual_generator(*args, **kwargs):
+            await _authorize(args[0], kwargs)
+            async for item in func(*args, **kwargs):
+                yield item
+
+        return actual_generator
+
     @wraps(func)
-    def actual(*args, **kwargs):
-        client: GraphAdminClient = args[0]
-        if not client._token and not kwargs.get("token"):
-            raise Exception('Token is not managed so you must explicitly provide it')
-
-        token = kwargs["token"] if kwargs.get("token") else client._token
-        kwargs["_req_headers"]: dict = client._build_auth_header(token)
-        kwargs["_req_headers"].update({"Content-type": "application/json"})
-        if kwargs.get("extra_headers"):
-            kwargs["_req_headers"].update(kwargs["extra_headers"])
-        return func(*args, **kwargs)
+    async def actual(*args, **kwargs):
+        await _authorize(args[0], kwargs)
+        return await func(*args, **kwargs)
 
     return actual
 
 
 class GraphAdminClient:
 
-    def __init__(self, enable_logging=False, mocked_graph_url=None):
-        self._session = None
+    def __init__(self, enable_logging=False, mocked_graph_url=None, auto_batch=False,
+                 auto_batch_delay_sec: float = 0.005, auto_batch_max_size: int = MAX_BATCH_REQUESTS,
+                 session: aiohttp.ClientSession = None, connector: aiohttp.BaseConnector = None,
+                 connection_limit: int = 100, connection_limit_per_host: int = 0, dns_cache_ttl_sec: int = 10,
+                 keepalive_timeout_sec: float = 15, retry_policy: RetryPolicy = None,
+                 rate_limiter: AdaptiveRateLimiter = None, json_codec: typing.Union[str, JsonCodec] = None):
+        """
+        :param enable_logging: log errors and token refreshes
+        :param mocked_graph_url: send all requests to this base url instead of Microsoft Graph
+        :param auto_batch: hold GET requests for up to auto_batch_delay_sec and send up to auto_batch_max_size of
+        them (per token) as a single $batch call, each caller still gets its own result
+        :param session: a session to send all requests with, it can be shared between clients and is not closed by
+        the client
+        :param connector: a connector (i.e. connection pool) for the client's own session, it can be shared between
+        clients (see create_connector) and is not closed by the client
+        :param connection_limit: total connections limit of the client's own connection pool (0 means no limit),
+        ignored if session or connector are provided
+        :param connection_limit_per_host: connections limit per host of the client's own connection pool
+        :param dns_cache_ttl_sec: how long resolved addresses are cached by the client's own connection pool
+        :param keepalive_timeout_sec: how long idle connections are kept open by the client's own connection pool
+        :param retry_policy: retry throttled and failed requests according to this policy (honoring Retry-After),
+        by default requests are not retried
+        :param rate_limiter: limit concurrent requests per tenant (and optionally per mailbox) with a window that
+        adapts to throttling responses, it can be shared between clients
+        :param json_codec: codec (or codec name, e.g. 'orjson') that serializes request bodies and parses response
+        bodies, by default the json module is used
+        """
+        if auto_batch_delay_sec < 0:
+            raise ValueError("auto batch delay must not be negative")
+        if auto_batch_max_size < 1 or auto_batch_max_size > MAX_BATCH_REQUESTS:
+            raise ValueError(f"auto batch max size must be between 1 and {MAX_BATCH_REQUESTS}")
+        self._session = session
+        self._owns_session = session is None
+        self._connector = connector
+        self._connector_options = {
+            "limit": connection_limit,
+            "limit_per_host": connection_limit_per_host,
+            "ttl_dns_cache": dns_cache_ttl_sec,
+            "keepalive_timeout": keepalive_timeout_sec,
+        }
+        self._retry_policy = retry_policy
+        self._retry_budget = retry_policy.create_budget() if retry_policy else None
+        self._rate_limiter = rate_limiter
+        self._json_codec = get_codec(json_codec)
         self._token = None
+        self._token_cache = TokenCache(self.acquire_token_by_tenant_id, enable_logging=enable_logging)
         self._managed = False
         self._token_refresh_interval_sec = 3300
         self._scheduler = AsyncIOScheduler()
         self._enable_logging = enable_logging
+        if isinstance(json_codec, str) and self._json_codec.name != json_codec:
+            self._log(logging.WARNING, f"json codec '{json_codec}' is not installed, falling back to the json module")
         self._mocked_graph_url = mocked_graph_url
+        self._auto_batch = auto_batch
+        self._auto_batch_delay_sec = auto_batch_delay_sec
+        self._auto_batch_max_size = auto_batch_max_size
+        self._coalescer = None
 
     @property
     def token_refresh_interval_sec(self):
@@ -53,6 +152,48 @@ class GraphAdminClient:
             raise ValueError("refresh interval must be between 60 and 3600 seconds")
         self._token_refresh_interval_sec = value
 
+    @property
+    def token_refresh_ahead_sec(self):
+        return self._token_cache.refresh_ahead_sec
+
+    @token_refresh_ahead_sec.setter
+    def token_refresh_ahead_sec(self, value):
+        if value < 0 or value > 3000:
+            raise ValueError("refresh ahead must be between 0 and 3000 seconds")
+        self._token_cache.refresh_ahead_sec = value
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @staticmethod
+    def create_connector(connection_limit: int = 100, connection_limit_per_host: int = 0,
+                         dns_cache_ttl_sec: int = 10, keepalive_timeout_sec: float = 15) -> aiohttp.TCPConnector:
+        """
+        Create a connection pool that can be shared between several clients (e.g. one client per tenant),
+        so TLS connections to Graph are reused across all of them.
+        The connector is not closed by the clients, close it when all of them are closed.
+        Must be called from a running event loop.
+        """
+        return aiohttp.TCPConnector(limit=connection_limit, limit_per_host=connection_limit_per_host,
+                                    ttl_dns_cache=dns_cache_ttl_sec, keepalive_timeout=keepalive_timeout_sec)
+
+    async def close(self):
+        """
+        Send any held request, stop token management and close the client's own session.
+        A session or connector that were passed to the client are left open.
+        """
+        if self._coalescer:
+            await self._coalescer.flush_all()
+        if self._scheduler.running:
+            self._scheduler.shutdown(wait=False)
+        self._managed = False
+        if self._session and self._owns_session:
+            await self._session.close()
+            self._session = None
+
     @property
     def is_managed(self):
         return self._managed
@@ -61,18 +202,19 @@ class GraphAdminClient:
     def token(self):
         return self._token
 
+    @property
+    def _graph_base_url(self):
+        return self._mocked_graph_url or GRAPH_BASE_URL
+
     def _build_url(self, version, resources: typing.List[typing.Tuple], **kwargs):
-        if self._mocked_graph_url:
-            url = self._mocked_graph_url + version
-        else:
-            url = GRAPH_BASE_URL + version
+        url = self._graph_base_url + version
         for resource, resource_id in resources:
             url += resource
             if resource_id:
                 url += f"/{resource_id}"
 
         odata_query: ODataQuery = kwargs.get("odata_query")
-        if odata_query:
+        if odata_query and not odata_query.is_empty:
             url += str(odata_query)
 
         if kwargs.get("_value_query_param"):
@@ -80,6 +222,22 @@ class GraphAdminClient:
 
         return url
 
+    @staticmethod
+    def _split_graph_url(url: str):
+        """
+        Split an absolute graph url (e.g. one built by _build_url or a nextLink) into its api version and the
+        url relative to that version, as expected by $batch sub-requests
+        """
+        parts = urllib.parse.urlsplit(url)
+        for version in (V1_EP, BETA_EP):
+            index = parts.path.find(version + "/")
+            if index != -1:
+                relative = parts.path[index + len(version):]
+                if parts.query:
+                    relative += "?" + parts.query
+                return version, urllib.parse.quote(relative, safe="/?&=$,'()@:!*+;%~")
+        raise GraphClientException(f"url is not a graph api url: {url}")
+
     @staticmethod
     def _build_auth_header(token: str):
         if token.lower().startswith("bearer"):
@@ -127,28 +285,246 @@ class GraphAdminClient:
         self._token = content['access_token']
         self._log(logging.INFO, "token has been refreshed")
 
-    async def _request(self, method, url, headers: dict = None, data: dict or str = None,
-                       expected_statuses: List[HTTPStatus] = None, timeout: int or float = 60):
+    def _should_coalesce(self, method, url, data):
+        if not self._auto_batch or method != "GET" or data is not None:
+            return False
+        if not url.startswith(self._graph_base_url):
+            return False
+        # binary content is base64 encoded (or redirected) by $batch, so it's always fetched directly
+        path = urllib.parse.urlsplit(url).path
+        return not (path.endswith("/$value") or path.endswith("/content"))
+
+    def _get_coalescer(self) -> GetCoalescer:
+        if not self._coalescer:
+            self._coalescer = GetCoalescer(self._send_coalesced_single, self._send_coalesced_batch,
+                                           self._auto_batch_delay_sec, self._auto_batch_max_size)
+        return self._coalescer
+
+    async def _send_coalesced_single(self, entry):
+        url, headers, expected_statuses, timeout = entry
+        return await self._send("GET", url, headers, None, expected_statuses, timeout)
+
+    async def _send_coalesced_batch(self, key, entries):
+        version, _ = key
+        body_requests = []
+        urls = []
+        for index, (url, headers, _, _) in enumerate(entries):
+            request_id = str(index + 1)
+            _, relative_url = self._split_graph_url(url)
+            body_request = {"id": request_id, "method": "GET", "url": relative_url}
+            sub_headers = {name: value for name, value in (headers or {}).items()
+                           if name.lower() not in ("authorization", "content-type")}
+            if sub_headers:
+                body_request["headers"] = sub_headers
+            body_requests.append(body_request)
+            urls.append((request_id, url))
+
+        headers = entries[0][1]
+        batch_url = self._build_url(version, [(BATCH, None)])
+        timeout = max(entry[3] for entry in entries)
+        body = self._json_codec.dumps({"requests": body_requests})
+        res, status = await self._send("POST", batch_url, headers, body, (HTTPStatus.OK,), timeout, len(entries))
+        results = self._parse_batch_response(urls, [entry[2] for entry in entries], res)
+        self._report_batch_throttling(headers, urls, results)
+        return results
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        self._owns_session = True
+        if self._connector:
+            return aiohttp.ClientSession(connector=self._connector, connector_owner=False)
+        return aiohttp.ClientSession(connector=aiohttp.TCPConnector(**self._connector_options))
+
+    async def _send(self, method, url, headers: dict, data: dict or str, expected_statuses: List[HTTPStatus],
+                    timeout: int or float, weight: int = 1):
+        return await self._limited(
+            url, headers, lambda: self._send_once(method, url, headers, data, expected_statuses, timeout), weight)
+
+    async def _limited(self, url, headers: dict, send: typing.Callable, weight: int = 1):
+        """Send under the rate limiter, a request takes 'weight' slots (e.g. one per sub-request of a $batch)"""
+        if not self._rate_limiter:
+            return await send()
+
+        keys = self._rate_limiter.get_keys(headers, url)
+        await self._rate_limiter.acquire(keys, weight)
+        try:
+            res, status = await send()
+            self._rate_limiter.on_response(keys, status)
+            return res, status
+        except BaseHttpError as e:
+            self._rate_limiter.on_response(keys, e.status, RetryPolicy.get_retry_after(e.response_headers))
+            raise e
+        finally:
+            self._rate_limiter.release(keys, weight)
+
+    async def _send_once(self, method, url, headers: dict, data: dict or str, expected_statuses: List[HTTPStatus],
+                         timeout: int or float):
         if not self._session:
-            self._session = aiohttp.ClientSession()
-        if not expected_statuses:
-            expected_statuses = (HTTPStatus.OK, HTTPStatus.NO_CONTENT, HTTPStatus.CREATED, HTTPStatus.ACCEPTED)
+            self._session = self._create_session()
+        async with self._session.request(method, url, headers=headers, data=data, timeout=timeout) as resp:
+            status = resp.status
+            resp_headers = resp.headers
+            r = await self._read_body(resp)
+
+        if status in expected_statuses:
+            return r, status
+        else:
+            raise status2exception.get(status, UnknownError)(status, url, r, resp_headers)
+
+    async def _read_body(self, resp: aiohttp.ClientResponse):
+        body = await resp.read()
+        if resp.headers.get('Content-Type') and 'application/json' in resp.headers['Content-Type']:
+            return self._json_codec.loads(body) if body.strip() else None
+        return body
+
+    async def _read_error_body(self, resp: aiohttp.ClientResponse):
+        """The body of an unexpected streamed response, up to MAX_ERROR_BODY_SIZE (it may be a whole file)"""
+        body = bytearray()
+        while len(body) < MAX_ERROR_BODY_SIZE:
+            chunk = await resp.content.read(MAX_ERROR_BODY_SIZE - len(body))
+            if not chunk:
+                break
+            body.extend(chunk)
+        if resp.headers.get('Content-Type') and 'application/json' in resp.headers['Content-Type']:
+            try:
+                return self._json_codec.loads(bytes(body)) if body.strip() else None
+            except ValueError:
+                pass
+        return bytes(body)
+
+    async def _open_stream_once(self, url, headers: dict, expected_statuses: List[HTTPStatus],
+                                timeout: int or float, chunk_size: int):
+        if not self._session:
+            self._session = self._create_session()
+        # the timeout applies to connecting and to every read, so big bodies can take as long as they need
+        stream_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+        resp = await self._session.request("GET", url, headers=headers, timeout=stream_timeout, allow_redirects=False)
         try:
-            async with self._session.request(method, url, headers=headers, data=data, timeout=timeout) as resp:
-                status = resp.status
-                resp_headers = resp.headers
-                if resp.headers.get('Content-Type') and 'application/json' in resp.headers['Content-Type']:
-                    r: dict = await resp.json()
-                else:
-                    r: bytes = await resp.read()
+            if resp.status in REDIRECT_STATUSES and resp.headers.get("Location"):
+                # download urls are pre-authenticated, so the token is not sent to the download host
+                location = resp.headers["Location"]
+                resp.release()
+                resp = await self._session.request("GET", location, timeout=stream_timeout)
+            if resp.status in expected_statuses:
+                return DownloadStream(resp, chunk_size), resp.status
+            raise status2exception.get(resp.status, UnknownError)(
+                resp.status, url, await self._read_error_body(resp), resp.headers)
+        except BaseException:
+            # the rest of the body is not read, the connection is closed rather than drained
+            resp.close()
+            raise
+
+    async def _open_stream(self, url, headers: dict, expected_statuses: List[HTTPStatus] = None,
+                           timeout: int or float = 60, chunk_size: int = DEFAULT_CHUNK_SIZE) -> DownloadStream:
+        if not expected_statuses:
+            expected_statuses = (HTTPStatus.OK, HTTPStatus.PARTIAL_CONTENT)
+        stream, status = await self._retrying("GET", lambda: self._limited(
+            url, headers, lambda: self._open_stream_once(url, headers, expected_statuses, timeout, chunk_size)))
+        return stream
+
+    def _get_retry_delay(self, method, exception: Exception, attempt: int, retry_unsafe: bool):
+        if not self._retry_policy:
+            return None
+        return self._retry_policy.get_retry_delay(method, exception, attempt, self._retry_budget, retry_unsafe)
+
+    async def _request(self, method, url, headers: dict = None, data: dict or str = None,
+                       expected_statuses: List[HTTPStatus] = None, timeout: int or float = 60,
+                       retry_unsafe: bool = False, weight: int = 1):
+        if not expected_statuses:
+            expected_statuses = DEFAULT_EXPECTED_STATUSES
+
+        async def attempt_request():
+            if self._should_coalesce(method, url, data):
+                version, _ = self._split_graph_url(url)
+                key = (version, (headers or {}).get("authorization"))
+                return await self._get_coalescer().submit(key, (url, headers, expected_statuses, timeout))
+            return await self._send(method, url, headers, data, expected_statuses, timeout, weight)
+
+        return await self._retrying(method, attempt_request, retry_unsafe)
+
+    async def _retrying(self, method, send: typing.Callable, retry_unsafe: bool = False):
+        if self._retry_budget:
+            self._retry_budget.record_request()
+        attempt = 0
+        while True:
+            try:
+                return await send()
+            except Exception as e:
+                delay = self._get_retry_delay(method, e, attempt, retry_unsafe)
+                if delay is None:
+                    self._log(logging.ERROR, f"exception while making a request: {str(e)}")
+                    raise e
+                attempt += 1
+                self._log(logging.WARNING, f"retrying request in {delay:.2f} seconds (retry {attempt}): {str(e)}")
+                await asyncio.sleep(delay)
+
+    def _build_batch_body(self, requests: List[BatchRequest]):
+        if not requests:
+            raise GraphClientException("batch must contain at least one request")
+        if len(requests) > MAX_BATCH_REQUESTS:
+            raise GraphClientException(
+                f"too many requests in batch ({len(requests)}), maximum is {MAX_BATCH_REQUESTS}")
+        if len({request.version for request in requests}) > 1:
+            raise GraphClientException("all requests in batch must target the same api version")
+
+        body_requests = []
+        urls = []
+        known_ids = set()
+        for index, request in enumerate(requests):
+            request_id = request.request_id or str(index + 1)
+            if request_id in known_ids:
+                raise GraphClientException(f"duplicate request id in batch: '{request_id}'")
+            for dependency in request.depends_on or []:
+                if dependency not in known_ids:
+                    raise GraphClientException(
+                        f"request '{request_id}' depends on '{dependency}' which is not an earlier request in batch")
+            known_ids.add(request_id)
+
+            url = self._build_url(request.version, request.resources, **request.url_kwargs)
+            _, relative_url = self._split_graph_url(url)
+            body_request = {"id": request_id, "method": request.method, "url": relative_url}
+            headers = dict(request.headers or {})
+            if request.body is not None:
+                headers.setdefault("Content-Type", "application/json")
+                body_request["body"] = request.body
+            if headers:
+                body_request["headers"] = headers
+            if request.depends_on:
+                body_request["dependsOn"] = request.depends_on
+            body_requests.append(body_request)
+            urls.append((request_id, url))
+
+        return {"requests": body_requests}, urls
+
+    def _report_batch_throttling(self, headers: dict, urls: List[typing.Tuple], results: List):
+        # sub-requests are throttled individually, so their responses also feed the rate limiter
+        if not self._rate_limiter:
+            return
+        for (_, url), result in zip(urls, results):
+            status = result.status if isinstance(result, BaseHttpError) else result[1]
+            retry_after = RetryPolicy.get_retry_after(result.response_headers) \
+                if isinstance(result, BaseHttpError) else None
+            self._rate_limiter.on_response(self._rate_limiter.get_keys(headers, url), status, retry_after)
 
-            if status in expected_statuses:
-                return r, status
+    @staticmethod
+    def _parse_batch_response(urls: List[typing.Tuple], expected_statuses: List, res: dict):
+        responses = {response["id"]: response for response in res.get("responses", [])}
+        results = []
+        for (request_id, url), expected in zip(urls, expected_statuses):
+            response = responses.get(request_id)
+            if response is None:
+                raise GraphClientException(f"missing response for batch request '{request_id}'")
+            status = response["status"]
+            headers = response.get("headers") or {}
+            body = response.get("body")
+            content_type = headers.get("Content-Type") or headers.get("content-type") or ""
+            if isinstance(body, str) and "application/json" not in content_type:
+                # non-json bodies are base64 encoded by the batch endpoint
+                body = base64.b64decode(body)
+            if status in (expected or DEFAULT_EXPECTED_STATUSES):
+                results.append((body, status))
             else:
-                raise status2exception.get(status, UnknownError)(status, url, r, resp_headers)
-        except Exception as e:
-            self._log(logging.ERROR, f"exception while making a request: {str(e)}")
-            raise e
+                results.append(status2exception.get(status, UnknownError)(status, url, body, headers))
+        return results
 
     async def acquire_token_by_tenant_id(self, app_id, app_secret, tenant_id, timeout: int or float = 60):
         """
@@ -171,7 +547,7 @@ class GraphAdminClient:
         else:
             base_url = GRAPH_CONSENT_URL
         url = f"{base_url}/{tenant_id}/oauth2/v2.0/token"
-        content, status = await self._request("POST", url, data=req_body, timeout=timeout)
+        content, status = await self._request("POST", url, data=req_body, timeout=timeout, retry_unsafe=True)
         return content, status
 
     async def acquire_token_by_refresh_token(self, app_id, app_secret, refresh_token):
@@ -194,7 +570,7 @@ class GraphAdminClient:
         else:
             base_url = GRAPH_CONSENT_URL
         url = f"{base_url}/common/oauth2/v2.0/token"
-        content, status = await self._request("POST", url, data=req_body)
+        content, status = await self._request("POST", url, data=req_body, retry_unsafe=True)
         return content, status
 
     async def manage_token(self, app_id, app_secret, tenant_id):
@@ -220,6 +596,53 @@ class GraphAdminClient:
             self._log(logging.ERROR, f"exception while trying to set manage token: {str(e)}")
             raise GraphClientException(e)
 
+    def manage_tenant_tokens(self, app_id, app_secret):
+        """
+        Let the client keep valid tokens of every tenant that consented to the application.
+        Tokens are cached per (app_id, tenant_id) and acquired lazily: on first use, and again on first use
+        within token_refresh_ahead_sec of their expiry. Concurrent calls share a single token request.
+        After calling this, any call can be made with tenant_id="..." key-word argument instead of a token
+        (and app_id="..." if more than one application is managed).
+        :param app_id: Also called client id, the identifier of your application in Azure
+        :param app_secret: Secret of your application in Azure
+        """
+        self._token_cache.add_app(app_id, app_secret)
+
+    async def get_tenant_token(self, tenant_id, app_id=None) -> str:
+        """
+        Get a valid token of a tenant, from cache if possible (see manage_tenant_tokens)
+        :param tenant_id: Id of the tenant you're asking access to its' resources
+        :param app_id: the application to use, may be omitted if only one application is managed
+        :return: access token
+        """
+        if not app_id:
+            app_ids = self._token_cache.app_ids
+            if len(app_ids) != 1:
+                raise GraphClientException(
+                    f"app id must be specified when {len(app_ids)} applications have managed tenant tokens")
+            app_id = app_ids[0]
+        return await self._token_cache.get_token(app_id, tenant_id)
+
+    @authorized
+    async def batch(self, requests: List[BatchRequest], **kwargs):
+        """
+        Send up to MAX_BATCH_REQUESTS sub-requests in a single $batch round trip
+        :param requests: list of BatchRequest, all of them must target the same api version.
+        use BatchRequest.depends_on in order to make a sub-request wait for earlier ones
+        :return: list aligned with requests, each item is either (response, status) of the sub-request or the
+        exception (BaseHttpError subclass) that the sub-request would have raised if it was sent on its own
+        """
+        body, urls = self._build_batch_body(requests)
+        url = self._build_url(requests[0].version, [(BATCH, None)])
+        retry_unsafe = kwargs.get("retry_unsafe") or all(request.method in IDEMPOTENT_METHODS for request in requests)
+        # every sub-request counts against the service limits, so the call takes a rate limiter slot for each
+        res, status = await self._request("POST", url, kwargs["_req_headers"], self._json_codec.dumps(body),
+                                          expected_statuses=(HTTPStatus.OK,), retry_unsafe=retry_unsafe,
+                                          weight=len(requests))
+        results = self._parse_batch_response(urls, [request.expected_statuses for request in requests], res)
+        self._report_batch_throttling(kwargs["_req_headers"], urls, results)
+        return results
+
     @authorized
     async def get_user(self, user_id, **kwargs):
         """
@@ -247,16 +670,145 @@ class GraphAdminClient:
         return res, status
 
     @authorized
-    async def list_all_users(self, **kwargs) -> typing.AsyncGenerator[dict, None]:
-        res, status = await self.list_users_bulk(**kwargs)
-        next_url = res.get(NEXT_KEY)
-        for user in res["value"]:
-            yield user
-        while next_url:
-            res, status = await self.list_more(next_url, **kwargs)
-            next_url = res.get(NEXT_KEY)
-            for user in res["value"]:
-                yield user
+    async def stream_page(self, url, page: dict = None, **kwargs) -> typing.AsyncGenerator[dict, None]:
+        """
+        Yield the items of a single collection page (e.g. a nextLink) while the page is being received, instead of
+        reading and parsing the whole page first
+        :param url: url of the page
+        :param page: if given, filled with the other keys of the page (nextLink, deltaLink...) after its last item
+        """
+        async for item in self._stream_page(url, kwargs, {} if page is None else page):
+            yield item
+
+    async def _stream_page(self, url, kwargs: dict, page: dict):
+        expected_statuses = kwargs.get("expected_statuses") or (HTTPStatus.OK,)
+        stream = await self._open_stream(url, kwargs["_req_headers"], expected_statuses, kwargs.get("timeout", 60),
+                                         DEFAULT_PAGE_CHUNK_SIZE)
+        parser = PageParser(codec=self._json_codec)
+        try:
+            async for chunk in stream:
+                for item in parser.feed(chunk):
+                    yield item
+            for item in parser.close():
+                yield item
+        finally:
+            stream.close()
+        page.update(parser.metadata)
+
+    def _paginate(self, url, kwargs: dict, require_delta_link: bool = False) -> Paginator:
+        """
+        Paginator of the pages starting at url (or at the 'cursor' key-word argument, to resume a previous listing).
+        The call is authorized again for every page, so tenant tokens (see manage_tenant_tokens) are refreshed along
+        long listings.
+        """
+        async def get_page(page_url):
+            page_kwargs = dict(kwargs)
+            await _authorize(self, page_kwargs)
+            res, status = await self._request("GET", page_url, page_kwargs["_req_headers"],
+                                              expected_statuses=kwargs.get("expected_statuses"))
+            return Page(res["value"], page_url, {key: value for key, value in res.items() if key != "value"})
+
+        async def stream_page(page_url, metadata: dict):
+            page_kwargs = dict(kwargs)
+            await _authorize(self, page_kwargs)
+            async for item in self._stream_page(page_url, page_kwargs, metadata):
+                yield item
+
+        return Paginator(kwargs.get("cursor") or url, get_page, stream_page, kwargs.get("max_items"),
+                         kwargs.get("max_pages"), kwargs.get("prefetch") or 0, kwargs.get("stream_items", False),
+                         require_delta_link)
+
+    def _delta_sync(self, resources: typing.List[typing.Tuple], store: DeltaStateStore, key: str,
+                    kwargs: dict) -> DeltaSync:
+        """
+        Sync cycle of the delta query of resources, the state is keyed by the tenant too when 'tenant_id' is given
+        """
+        if kwargs.get("tenant_id"):
+            key = f"{kwargs['tenant_id']}:{key}"
+        url = self._build_url(V1_EP, resources + [(DELTA, None)], **kwargs)
+        # a sync cycle reads all the pages, so it ends with a deltaLink to save
+        delta_kwargs = {key: value for key, value in kwargs.items() if key not in ("cursor", "max_items", "max_pages")}
+        return DeltaSync(lambda link: self._paginate(link, delta_kwargs, require_delta_link=True), url, store, key)
+
+    def list_all_users(self, **kwargs) -> Paginator:
+        url = self._build_url(V1_EP, [(USERS, None)], **kwargs)
+        return self._paginate(url, kwargs)
+
+    def sync_users(self, store: DeltaStateStore, key: str = "users", **kwargs) -> DeltaSync:
+        """
+        Sync users with a delta query (/users/delta): iterating the returned sync yields the users that changed since
+        the previous sync whose state was saved in store under key (all users on the first sync), and saves the
+        state of the next sync. The 'odata_query' key-word argument (e.g. $select) applies to the first sync only,
+        later syncs keep the query of the saved state.
+        :param store: where the state of the sync is persisted, e.g. SqliteDeltaStateStore
+        """
+        return self._delta_sync([(USERS, None)], store, key, kwargs)
+
+    async def _count(self, resources: typing.List[typing.Tuple], kwargs: dict, advanced_query: bool = False) -> int:
+        """
+        Count the items of a collection, as filtered by the 'odata_query' key-word argument
+        :param advanced_query: send the request as an advanced directory query (required for directory objects)
+        """
+        query = copy.copy(kwargs.get("odata_query")) or ODataQuery()
+        query.count = True
+        query.top = 1
+        query.select = ["id"]
+        headers = dict(kwargs["_req_headers"])
+        if advanced_query:
+            headers[CONSISTENCY_LEVEL_HEADER] = "eventual"
+        url = self._build_url(V1_EP, resources, odata_query=query)
+        res, status = await self._request("GET", url, headers, expected_statuses=kwargs.get("expected_statuses"))
+        return res[COUNT_KEY]
+
+    @authorized
+    async def count_users(self, **kwargs) -> int:
+        """
+        Count the users of the tenant (as filtered by the 'odata_query' key-word argument), the count is eventually
+        consistent
+        """
+        return await self._count([(USERS, None)], kwargs, advanced_query=True)
+
+    async def _list_partitioned(self, resource: str, attribute: str, prefixes: List[str], concurrency: int,
+                                verify_count: bool, kwargs: dict) -> typing.AsyncGenerator[dict, None]:
+        """
+        Read the partitions of a directory listing (startswith(attribute, prefix) for every prefix) concurrently
+        """
+        partition_kwargs = {key: value for key, value in kwargs.items()
+                            if key not in ("cursor", "max_items", "max_pages", "stream_items")}
+        paginators = []
+        for query in build_prefix_partitions(kwargs.get("odata_query"), attribute, prefixes):
+            partition_kwargs["odata_query"] = query
+            url = self._build_url(V1_EP, [(resource, None)], **partition_kwargs)
+            paginators.append(self._paginate(url, dict(partition_kwargs)))
+
+        count = 0
+        async for page in merge_pages(paginators, concurrency, buffer_pages=concurrency):
+            count += len(page)
+            for item in page:
+                yield item
+
+        if verify_count:
+            page_kwargs = dict(kwargs)
+            await _authorize(self, page_kwargs)
+            expected = await self._count([(resource, None)], page_kwargs, advanced_query=True)
+            if expected != count:
+                self._log(logging.WARNING, f"partitioned listing of {resource} read {count} items, "
+                                           f"while $count reported {expected}")
+
+    def list_all_users_partitioned(self, prefixes: List[str] = None, concurrency: int = 8,
+                                   verify_count: bool = False, **kwargs) -> typing.AsyncGenerator[dict, None]:
+        """
+        List all users by reading disjoint partitions of them concurrently, instead of a single chain of pages.
+        Users are partitioned by the first character of their userPrincipalName, and the items of all partitions
+        are merged into a single stream (in no particular order).
+        :param prefixes: partition prefixes, all users must start with one of them (USER_PARTITION_PREFIXES by
+        default), a filter given in 'odata_query' is applied within every partition
+        :param concurrency: how many partitions are read at the same time
+        :param verify_count: compare the number of listed users with $count (eventually consistent) and log a warning
+        if they differ
+        """
+        return self._list_partitioned(USERS, "userPrincipalName", prefixes or USER_PARTITION_PREFIXES, concurrency,
+                                      verify_count, kwargs)
 
     @authorized
     async def create_subscription(
@@ -300,7 +852,8 @@ class GraphAdminClient:
         if latest_supported_tls_version:
             body["latestSupportedTlsVersion"] = latest_supported_tls_version
 
-        res, status = await self._request("POST", url, kwargs["_req_headers"], json.dumps(body), kwargs.get("expected_statuses"))
+        res, status = await self._request("POST", url, kwargs["_req_headers"], self._json_codec.dumps(body), kwargs.get("expected_statuses"),
+                                          retry_unsafe=kwargs.get("retry_unsafe", False))
         return res, status
 
     @authorized
@@ -316,8 +869,8 @@ class GraphAdminClient:
             "expirationDateTime": expiration_date_time
         }
 
-        res, status = await self._request("PATCH", url, kwargs["_req_headers"], json.dumps(body),
-                                          kwargs.get("expected_statuses"))
+        res, status = await self._request("PATCH", url, kwargs["_req_headers"], self._json_codec.dumps(body),
+                                          kwargs.get("expected_statuses"), retry_unsafe=kwargs.get("retry_unsafe", False))
         return res, status
 
     @authorized
@@ -331,6 +884,11 @@ class GraphAdminClient:
             "DELETE", url, kwargs["_req_headers"], expected_statuses=kwargs.get("expected_statuses"))
         return res, status
 
+    def list_all_subscriptions(self, **kwargs) -> Paginator:
+        """:return: paginator of the subscriptions of the application"""
+        url = self._build_url(V1_EP, [(SUBSCRIPTIONS, None)], **kwargs)
+        return self._paginate(url, kwargs)
+
     @authorized
     async def list_user_mails_bulk(self, user_id, **kwargs):
         url = self._build_url(V1_EP, [(USERS, user_id), (MAILS, None)], **kwargs)
@@ -338,18 +896,108 @@ class GraphAdminClient:
                                           expected_statuses=kwargs.get("expected_statuses"))
         return res, status
 
+    def list_all_user_mails(self, user_id, **kwargs) -> Paginator:
+        url = self._build_url(V1_EP, [(USERS, user_id), (MAILS, None)], **kwargs)
+        return self._paginate(url, kwargs)
+
     @authorized
-    async def list_all_user_mails(self, user_id, **kwargs) -> typing.AsyncGenerator[dict, None]:
-        res, status = await self.list_user_mails_bulk(user_id, **kwargs)
-        next_url = res.get(NEXT_KEY)
-        for mail in res["value"]:
-            yield mail
-        while next_url:
-            res, status = await self.list_more(next_url, **kwargs)
-            next_url = res.get(NEXT_KEY)
-            for mail in res["value"]:
+    async def count_user_mails(self, user_id, **kwargs) -> int:
+        """
+        Count the mails of a user (as filtered by the 'odata_query' key-word argument)
+        """
+        return await self._count([(USERS, user_id), (MAILS, None)], kwargs)
+
+    async def _get_mail_received_bound(self, user_id, order: Order, kwargs: dict) -> typing.Optional[datetime]:
+        query = ODataQuery()
+        query.top = 1
+        query.select = [RECEIVED_DATE_TIME]
+        query.order_by = OrderBy(RECEIVED_DATE_TIME, order)
+        url = self._build_url(V1_EP, [(USERS, user_id), (MAILS, None)], odata_query=query)
+        res, status = await self._request("GET", url, kwargs["_req_headers"],
+                                          expected_statuses=kwargs.get("expected_statuses"))
+        mails = [mail for mail in res["value"] if mail.get(RECEIVED_DATE_TIME)]
+        return parse_graph_datetime(mails[0][RECEIVED_DATE_TIME]) if mails else None
+
+    async def _plan_mail_windows(self, user_id, window: TimeWindow, max_window_items: int, min_window: timedelta,
+                                 concurrency: int, kwargs: dict) -> typing.List[TimeWindow]:
+        """
+        Split window until every part holds at most max_window_items mails (by $count), or is as short as min_window
+        """
+        slots = asyncio.Semaphore(concurrency)
+
+        async def plan(current: TimeWindow) -> typing.List[TimeWindow]:
+            query = with_constrains(kwargs.get("odata_query"), current.get_constrains(RECEIVED_DATE_TIME), prepend=True)
+            async with slots:
+                count = await self._count([(USERS, user_id), (MAILS, None)], dict(kwargs, odata_query=query))
+            if not count and not (current.open_start or current.open_end):
+                return []
+            if count <= max_window_items or current.duration <= min_window:
+                return [current]
+            parts = current.split(min(math.ceil(count / max_window_items), MAX_WINDOW_SPLIT), min_window)
+            if len(parts) == 1:
+                return parts
+            planned = await asyncio.gather(*(plan(part) for part in parts))
+            return [part for parts_of_part in planned for part in parts_of_part]
+
+        return await plan(window)
+
+    async def _list_mails_sharded(self, user_id, start: datetime, end: datetime, max_window_items: int,
+                                  min_window: timedelta, concurrency: int, ordered: bool, kwargs: dict):
+        planning_kwargs = dict(kwargs)
+        await _authorize(self, planning_kwargs)
+        open_start, open_end = start is None, end is None
+        if open_start:
+            start = await self._get_mail_received_bound(user_id, Order.asc, planning_kwargs)
+        if open_end:
+            end = await self._get_mail_received_bound(user_id, Order.desc, planning_kwargs)
+            end = end + timedelta(seconds=1) if end else None
+        if start is None or end is None:
+            # empty mailbox
+            return
+        start, end = as_utc(start), as_utc(end)
+        end = max(end, start + timedelta(seconds=1))
+
+        window = TimeWindow(start, end, open_start, open_end)
+        windows = await self._plan_mail_windows(
+            user_id, window, max_window_items, min_window, concurrency, planning_kwargs)
+        self._log(logging.INFO, f"listing mails of {user_id} in {len(windows)} windows")
+
+        window_kwargs = {key: value for key, value in kwargs.items()
+                         if key not in ("cursor", "max_items", "max_pages", "stream_items")}
+        paginators = []
+        for current in windows:
+            query = with_constrains(kwargs.get("odata_query"), current.get_constrains(RECEIVED_DATE_TIME), prepend=True)
+            if ordered:
+                query.order_by = OrderBy(RECEIVED_DATE_TIME, Order.asc)
+            window_kwargs["odata_query"] = query
+            url = self._build_url(V1_EP, [(USERS, user_id), (MAILS, None)], **window_kwargs)
+            paginators.append(self._paginate(url, dict(window_kwargs)))
+
+        async for page in merge_pages(paginators, concurrency, ordered, buffer_pages=1 if ordered else concurrency):
+            for mail in page:
                 yield mail
 
+    def list_all_user_mails_sharded(self, user_id, start: datetime = None, end: datetime = None,
+                                    max_window_items: int = 10000, min_window_sec: float = 60, concurrency: int = 4,
+                                    ordered: bool = False, **kwargs) -> typing.AsyncGenerator[dict, None]:
+        """
+        List all mails of a (large) mailbox by reading windows of their receivedDateTime concurrently, instead of a
+        single chain of pages.
+        Windows are sized adaptively: a window whose $count exceeds max_window_items is split into shorter windows
+        (down to min_window_sec), so busy periods get more windows than quiet ones.
+        :param start: list mails received from this time on (by default, since the first mail)
+        :param end: list mails received before this time (by default, up to the last mail)
+        :param concurrency: how many requests (counting windows, then reading them) are sent at the same time for
+        the mailbox
+        :param ordered: yield mails by the order they were received, else in no particular order
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be positive")
+        if max_window_items < 1:
+            raise ValueError("max window items must be positive")
+        return self._list_mails_sharded(user_id, start, end, max_window_items, timedelta(seconds=min_window_sec),
+                                        concurrency, ordered, kwargs)
+
     @authorized
     async def get_mail(self, user_id, message_id, as_mime=False, **kwargs):
         if as_mime:
@@ -359,15 +1007,30 @@ class GraphAdminClient:
                                           expected_statuses=kwargs.get("expected_statuses"))
         return res, status
 
+    @authorized
+    async def stream_mail_mime(self, user_id, message_id, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                               **kwargs) -> DownloadStream:
+        """
+        Open the MIME content of a mail as a stream (see stream_drive_item_content)
+        """
+        url = self._build_url(V1_EP, [(USERS, user_id), (MAILS, message_id)], _value_query_param=True)
+        return await self._open_stream(url, kwargs["_req_headers"], kwargs.get("expected_statuses"),
+                                       kwargs.get("timeout", 60), chunk_size)
+
     @authorized
     async def send_mail(self, mail: dict, headers: dict = None, attachments: dict = None, **kwargs):
         """
         Send an email
         :param mail: A dictionary containing the attributes about the email. from, to, and body_content are required.
         subject, cc, bcc, body_type, and save_to_sent_items. cc and bcc are lists of string emails like to.
-        :param attachments: A list of dictionaries, each requiring name, contentType, and contentBytes as a
-        base64 string
+        :param attachments: A list of dictionaries, each requiring name, contentType, and either contentBytes as a
+        base64 string or content as bytes, file path, binary file or async iterable of bytes (with size).
+        If the attachments are larger than MAX_INLINE_ATTACHMENT_SIZE, the mail is created as a draft, its attachments
+        are streamed into it through upload sessions and then it is sent. A sent draft is always saved to sent items,
+        so save_to_sent_items=False with such attachments raises GraphClientException (before anything is created)
         :param headers: A dictionary of mail headers to be converted to microsoft.graph.internetMessageHeader
+        :param retry_unsafe: (key-word argument) allow the client's retry policy to retry sending this mail, which
+        may send it twice if the failure happened after Graph accepted it
         :return: None if the operation was successful, else - raises GraphClientException with info
         """
 
@@ -420,38 +1083,131 @@ class GraphAdminClient:
                 message['message']["internetMessageHeaders"].append(header)
 
         if attachments:
-            for attachment in attachments:
-                attachment['@odata.type'] = "#microsoft.graph.fileAttachment"
-            message["message"]["attachments"] = attachments
+            if sum(self._get_attachment_size(attachment) for attachment in attachments) > MAX_INLINE_ATTACHMENT_SIZE:
+                if not message.get("saveToSentItems", True):
+                    raise GraphClientException(
+                        f"mails with attachments over {MAX_INLINE_ATTACHMENT_SIZE} bytes are sent as drafts, "
+                        f"which are always saved to sent items")
+                return await self._send_mail_as_draft(mail['from'], message["message"], attachments, **kwargs)
+            message["message"]["attachments"] = [await self._to_inline_attachment(attachment)
+                                                 for attachment in attachments]
 
         url = self._build_url(V1_EP, [(USERS, mail['from']), (SENDMAIL, None)], **kwargs)
         res, status = await self._request("POST", url, kwargs["_req_headers"],
-                                          data=json.dumps(message),
-                                          expected_statuses=(HTTPStatus.ACCEPTED,))
+                                          data=self._json_codec.dumps(message),
+                                          expected_statuses=(HTTPStatus.ACCEPTED,),
+                                          retry_unsafe=kwargs.get("retry_unsafe", False))
         return res, status
 
-    @authorized
-    async def list_drive_changes(self, state_link: str, **kwargs):
+    @staticmethod
+    def _get_attachment_size(attachment: dict) -> int:
+        if "content" not in attachment:
+            return len(attachment["contentBytes"]) * 3 // 4
+        return ChunkSource(attachment["content"], attachment.get("size")).size
+
+    @staticmethod
+    async def _read_source(source: ChunkSource) -> bytes:
+        await source.open()
+        try:
+            return await source.read(0, source.size)
+        finally:
+            await source.close()
+
+    async def _to_inline_attachment(self, attachment: dict) -> dict:
+        attachment['@odata.type'] = "#microsoft.graph.fileAttachment"
+        if "content" in attachment:
+            content = await self._read_source(ChunkSource(attachment.pop("content"), attachment.pop("size", None)))
+            attachment["contentBytes"] = base64.b64encode(content).decode()
+        return attachment
+
+    async def _send_mail_as_draft(self, user_id, message: dict, attachments: List[dict], **kwargs):
+        url = self._build_url(V1_EP, [(USERS, user_id), (MAILS, None)])
+        draft, status = await self._request("POST", url, kwargs["_req_headers"], data=self._json_codec.dumps(message),
+                                            expected_statuses=(HTTPStatus.CREATED,),
+                                            retry_unsafe=kwargs.get("retry_unsafe", False))
+        try:
+            for attachment in attachments:
+                content = attachment["content"] if "content" in attachment \
+                    else base64.b64decode(attachment["contentBytes"])
+                await self.add_attachment_to_mail(
+                    user_id, draft["id"], attachment["name"], content, size=attachment.get("size"),
+                    content_type=attachment.get("contentType"), **kwargs)
+        except Exception as e:
+            self._log(logging.ERROR, f"exception while adding attachments to draft, deleting it: {str(e)}")
+            try:
+                await self.delete_mail(user_id, draft["id"], **kwargs)
+            except Exception as delete_error:
+                # the attachment error is the one raised, the draft is left behind
+                self._log(logging.ERROR, f"exception while deleting draft {draft['id']}: {str(delete_error)}")
+            raise
+
+        url = self._build_url(V1_EP, [(USERS, user_id), (MAILS, draft["id"]), (SEND, None)])
+        return await self._request("POST", url, kwargs["_req_headers"], expected_statuses=(HTTPStatus.ACCEPTED,),
+                                   retry_unsafe=kwargs.get("retry_unsafe", False))
+
+    def list_drive_changes(self, state_link: str, **kwargs) -> Paginator:
         """
 
         :param state_link: deltaLink or nextLink, returned from previous calls
-        :return: list of drive items changes since state_link was issued
+        :return: paginator of drive items changes since state_link was issued, its delta_link is available once all
+        the changes were read (a missing deltaLink raises GraphClientException)
         """
-        res, status = await self._request("GET", state_link, kwargs["_req_headers"],
-                                          expected_statuses=kwargs.get("expected_statuses"))
-        next_url = res.get(NEXT_KEY)
-        delta_url = res.get(DELTA_KEY)
-        for drive_item in res["value"]:
-            yield drive_item
-        while next_url:
-            res, status = await self.list_more(next_url, **kwargs)
-            next_url = res.get(NEXT_KEY)
-            delta_url = res.get(DELTA_KEY)
-            for drive_item in res["value"]:
-                yield drive_item
-        if not delta_url:
-            raise GraphClientException("missing deltaLink after iterating through all drive items")
-        yield delta_url
+        return self._paginate(state_link, kwargs, require_delta_link=True)
+
+    def _get_drive_root_url(self, resource, id: str) -> str:
+        """Url of the root folder of a user, site or group drive, or of a drive by its id (resource DRIVES)"""
+        supported_drive_resources = [USERS, SITES, GROUPS, DRIVES]
+        if resource not in supported_drive_resources:
+            raise GraphClientException(
+                f"drive root is only available for the resources: {supported_drive_resources}")
+        if resource == DRIVES:
+            return self._build_url(V1_EP, [(DRIVES, id), (DRIVE_ROOT, None)])
+        return self._build_url(V1_EP, [(resource, id), (DRIVE, None), (DRIVE_ROOT, None)])
+
+    def list_drive_item_children(self, resource, id: str, item_id: str = None, **kwargs) -> Paginator:
+        """
+        :param resource: USERS, SITES or GROUPS (the drive of that resource) or DRIVES (a drive by its id)
+        :param item_id: id of the folder, None for the root folder of the drive
+        :return: paginator of the folder's children
+        """
+        supported_drive_resources = [USERS, SITES, GROUPS, DRIVES]
+        if resource not in supported_drive_resources:
+            raise GraphClientException(
+                f"listing children is only available for the resources: {supported_drive_resources}")
+        resources = [(DRIVES, id)] if resource == DRIVES else [(resource, id), (DRIVE, None)]
+        resources += [(DRIVE_ROOT, None)] if item_id is None else [("/items", item_id)]
+        url = self._build_url(V1_EP, resources + [("/children", None)], **kwargs)
+        return self._paginate(url, kwargs)
+
+    def walk_drive(self, resource, id: str, item_id: str = None, concurrency: int = 8, max_depth: int = None,
+                   on_error: typing.Callable[[typing.Optional[str], Exception], None] = None,
+                   **kwargs) -> typing.AsyncGenerator[dict, None]:
+        """
+        Walk a drive (or a folder of it) breadth-first, listing up to 'concurrency' folders at a time, and yield all
+        of its items (folders included) as they are discovered.
+        An 'odata_query' key-word argument with $select (e.g. ["id", "name", "size", "file"]) keeps the pages of
+        large inventories small, 'id' and 'folder' are always selected since the walk depends on them.
+        :param resource: USERS, SITES or GROUPS (the drive of that resource) or DRIVES (a drive by its id)
+        :param item_id: id of the folder to walk, None for the whole drive
+        :param max_depth: don't list folders deeper than this (the children of the walked folder are of depth 1)
+        :param on_error: function (folder id, exception) called when listing a folder fails (e.g. 403 on a folder
+        that isn't shared with the caller), that folder is then skipped and the walk goes on. By default the first
+        failure ends the walk
+        """
+        odata_query = kwargs.get("odata_query")
+        if odata_query and odata_query.select:
+            odata_query = copy.copy(odata_query)
+            odata_query.select = list(odata_query.select) + \
+                [key for key in ("id", FOLDER_KEY) if key not in odata_query.select]
+        folder_kwargs = {key: value for key, value in kwargs.items() if key not in ("cursor", "max_items", "max_pages")}
+        folder_kwargs["odata_query"] = odata_query
+
+        def list_children(folder_id):
+            return self.list_drive_item_children(resource, id, folder_id, **folder_kwargs)
+
+        # fail on an unsupported resource now rather than once the walk is iterated
+        self._get_drive_root_url(resource, id)
+        return walk_tree(item_id, list_children, concurrency, max_depth, on_error=on_error)
 
     @authorized
     async def get_latest_delta_link(self, resource, id: str, **kwargs) -> str:
@@ -462,28 +1218,97 @@ class GraphAdminClient:
         :param kwargs:
         :return:
         """
-        supported_drive_resources = [USERS, SITES, GROUPS]
-        if resource not in supported_drive_resources:
-            raise GraphClientException(
-                f"getting delta url only available for the resources: {supported_drive_resources}")
-        drive_delta_url = self._build_url(V1_EP, [(resource, id), (DRIVE, None), ("/root", None)]) + "/delta?token=latest"
+        drive_delta_url = self._get_drive_root_url(resource, id) + DELTA + "?token=latest"
+
+        changes = self.list_drive_changes(drive_delta_url, **kwargs)
+        async for _ in changes.pages():
+            pass
+        return changes.delta_link
+
+    async def _get_drive_item_version(self, resource, id: str, drive_item_id: str, kwargs: dict) -> dict:
+        """The size, cTag and hashes of a drive item (see _is_unchanged)"""
+        query = ODataQuery()
+        query.select = ["id", "size", CTAG_KEY, "file"]
+        url = self._build_url(V1_EP, [(resource, id), (DRIVE, None), ("/items", drive_item_id)], odata_query=query)
+        res, status = await self._request("GET", url, kwargs["_req_headers"])
+        return res
 
-        last_value = None
-        async for value in self.list_drive_changes(drive_delta_url, **kwargs):
-            last_value = value
-        return last_value
+    @staticmethod
+    def _is_unchanged(item: dict, local_quick_xor_hash: str = None, local_ctag: str = None) -> bool:
+        """Whether a local copy (by its quickXorHash or the cTag it was downloaded at) matches the drive item"""
+        if local_ctag and item.get(CTAG_KEY) == local_ctag:
+            return True
+        remote_hash = item.get("file", {}).get("hashes", {}).get(QUICK_XOR_HASH_KEY)
+        return bool(local_quick_xor_hash and remote_hash == local_quick_xor_hash)
 
     @authorized
-    async def get_drive_item_content(self, resource, id: str, drive_item_id: str, **kwargs):
+    async def get_drive_item_content(self, resource, id: str, drive_item_id: str, local_quick_xor_hash: str = None,
+                                     local_ctag: str = None, **kwargs):
+        """
+        :param local_quick_xor_hash: quickXorHash of a local copy of the item (see QuickXorHash)
+        :param local_ctag: cTag of the item when the local copy was downloaded
+        :return: the content and status, or (None, HTTPStatus.NOT_MODIFIED) without downloading the content when
+        the local copy matches the item (by local_quick_xor_hash or local_ctag)
+        """
         supported_drive_resources = [USERS, SITES, GROUPS]
         if resource not in supported_drive_resources:
             raise GraphClientException(
                 f"getting drive file content only available for the resources: {supported_drive_resources}")
+        if local_quick_xor_hash or local_ctag:
+            item = await self._get_drive_item_version(resource, id, drive_item_id, kwargs)
+            if self._is_unchanged(item, local_quick_xor_hash, local_ctag):
+                return None, HTTPStatus.NOT_MODIFIED
         url = self._build_url(V1_EP, [(resource, id), (DRIVE, None), ("/items", drive_item_id), ("/content", None)])
         res, status = await self._request("GET", url, kwargs["_req_headers"],
                                           expected_statuses=kwargs.get("expected_statuses"))
         return res, status
 
+    @authorized
+    async def stream_drive_item_content(self, resource, id: str, drive_item_id: str,
+                                        chunk_size: int = DEFAULT_CHUNK_SIZE, **kwargs) -> DownloadStream:
+        """
+        Open the content of a drive item as a stream, so files larger than memory can be processed chunk by chunk.
+        The redirect to the download url is followed without sending the token to the download host.
+        Usage: async with await client.stream_drive_item_content(USERS, user_id, item_id, token=t) as stream: ...
+        :param resource: USERS, SITES or GROUPS
+        :param id: id of the user/site/group that owns the drive
+        :param drive_item_id: id of the drive item
+        :param chunk_size: size of chunks yielded by the stream
+        :return: DownloadStream, with content_length and etag available up front
+        """
+        supported_drive_resources = [USERS, SITES, GROUPS]
+        if resource not in supported_drive_resources:
+            raise GraphClientException(
+                f"getting drive file content only available for the resources: {supported_drive_resources}")
+        url = self._build_url(V1_EP, [(resource, id), (DRIVE, None), ("/items", drive_item_id), ("/content", None)])
+        return await self._open_stream(url, kwargs["_req_headers"], kwargs.get("expected_statuses"),
+                                       kwargs.get("timeout", 60), chunk_size)
+
+    @authorized
+    async def download_drive_item_content(self, resource, id: str, drive_item_id: str, file: str or typing.BinaryIO,
+                                          chunk_size: int = DEFAULT_CHUNK_SIZE, skip_if_unchanged: bool = False,
+                                          local_ctag: str = None, **kwargs) -> int:
+        """
+        Download the content of a drive item into file (path or binary file object) at constant memory.
+        A path is replaced only once the whole content was downloaded, a failed download leaves it as it was
+        :param skip_if_unchanged: don't download when file is the path of an existing copy of the item, whose size
+        and quickXorHash match the item's metadata (or whose local_ctag matches the item's cTag)
+        :param local_ctag: cTag of the item when file was downloaded
+        :return: number of bytes written, 0 if the download was skipped
+        """
+        if skip_if_unchanged and isinstance(file, str) and os.path.isfile(file):
+            item = await self._get_drive_item_version(resource, id, drive_item_id, kwargs)
+            unchanged = self._is_unchanged(item, local_ctag=local_ctag)
+            if not unchanged and item.get("size") == os.path.getsize(file):
+                local_hash = await asyncio.get_event_loop().run_in_executor(None, quick_xor_hash_file, file)
+                unchanged = self._is_unchanged(item, local_quick_xor_hash=local_hash)
+            if unchanged:
+                self._log(logging.DEBUG, f"skipping download of unchanged drive item {drive_item_id}")
+                return 0
+        stream = await self.stream_drive_item_content(resource, id, drive_item_id, chunk_size, **kwargs)
+        async with stream:
+            return await stream.save(file)
+
     @authorized
     async def get_drive_item(self, drive_id: str, item_id: str, **kwargs):
         url = self._build_url(V1_EP, [(DRIVES, drive_id), ("/items", item_id)])
@@ -491,6 +1316,237 @@ class GraphAdminClient:
                                           expected_statuses=kwargs.get("expected_statuses"))
         return res, status
 
+    async def _download_range(self, download_url: typing.Callable, file: PositionalFile, start: int, end: int,
+                              chunk_size: int, max_part_retries: int, timeout: int or float):
+        loop = asyncio.get_event_loop()
+        offset = start
+        attempt = 0
+        while True:
+            url = await download_url(refresh=False)
+            try:
+                # a single range that covers the whole file may be answered with the whole file
+                expected_statuses = (HTTPStatus.PARTIAL_CONTENT,) if offset or end != file.size - 1 \
+                    else (HTTPStatus.OK, HTTPStatus.PARTIAL_CONTENT)
+                stream = await self._open_stream(url, {"Range": f"bytes={offset}-{end}"}, expected_statuses,
+                                                 timeout, chunk_size)
+                async with stream:
+                    async for chunk in stream:
+                        chunk = chunk[:end + 1 - offset]
+                        await loop.run_in_executor(None, file.write_at, offset, chunk)
+                        offset += len(chunk)
+                        if offset > end:
+                            break
+                if offset > end:
+                    return
+                raise GraphClientException(f"range {start}-{end} ended at {offset} before it was complete")
+            except Exception as e:
+                if attempt >= max_part_retries:
+                    self._log(logging.ERROR, f"exception while downloading range {start}-{end}: {str(e)}")
+                    raise e
+                attempt += 1
+                self._log(logging.WARNING, f"retrying range {offset}-{end} (retry {attempt}): {str(e)}")
+                if isinstance(e, (Unauthorized, Forbidden)):
+                    # download urls are short lived, get a fresh one
+                    await download_url(refresh=True)
+
+    @authorized
+    async def download_drive_item_parallel(self, drive_id: str, item_id: str, file_path: str,
+                                           part_size: int = DEFAULT_PART_SIZE, concurrency: int = 4,
+                                           max_part_retries: int = 3, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                                           **kwargs) -> int:
+        """
+        Download a (large) drive item by splitting it into byte ranges that are fetched concurrently with
+        Range requests from the item's download url, and written into a preallocated file at their offsets.
+        Each failed range is retried on its own, from the last byte it wrote.
+        :param drive_id: id of the drive
+        :param item_id: id of the drive item
+        :param file_path: path of the file to write, it is replaced only once the whole item was downloaded
+        :param part_size: size of each range
+        :param concurrency: maximum number of ranges that are downloaded at the same time
+        :param max_part_retries: how many times each range is retried
+        :return: size of the downloaded item
+        """
+        if part_size <= 0 or concurrency <= 0:
+            raise ValueError("part size and concurrency must be positive")
+        item, status = await self.get_drive_item(drive_id, item_id, **kwargs)
+        if DOWNLOAD_URL_KEY not in item:
+            raise GraphClientException(f"drive item {item_id} has no download url (is it a folder?)")
+        size = item["size"]
+        current_url = {"url": item[DOWNLOAD_URL_KEY]}
+        refresh_lock = asyncio.Lock()
+
+        async def download_url(refresh: bool):
+            if refresh:
+                stale_url = current_url["url"]
+                async with refresh_lock:
+                    if current_url["url"] == stale_url:
+                        fresh_item, _ = await self.get_drive_item(drive_id, item_id, **kwargs)
+                        current_url["url"] = fresh_item[DOWNLOAD_URL_KEY]
+            return current_url["url"]
+
+        loop = asyncio.get_event_loop()
+        file = PositionalFile(file_path, size)
+        await loop.run_in_executor(None, file.open)
+        complete = False
+        try:
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def download_part(start):
+                async with semaphore:
+                    await self._download_range(download_url, file, start, min(start + part_size, size) - 1,
+                                               chunk_size, max_part_retries, kwargs.get("timeout", 60))
+
+            tasks = [asyncio.ensure_future(download_part(start)) for start in range(0, size, part_size)]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            complete = True
+        finally:
+            await loop.run_in_executor(None, file.close, complete)
+        return size
+
+    @authorized
+    async def create_drive_upload_session(self, resource, id: str, parent_item_id: str, file_name: str,
+                                          conflict_behavior: str = "replace", **kwargs):
+        """
+        Create an upload session for a new (or replaced) file in a drive folder
+        :param resource: USERS, SITES or GROUPS
+        :param id: id of the user/site/group that owns the drive
+        :param parent_item_id: id of the folder to upload into ('root' for the drive root)
+        :param file_name: name of the uploaded file
+        :param conflict_behavior: replace, rename or fail
+        :return: upload session (with uploadUrl, which can be persisted in order to resume the upload later)
+        """
+        supported_drive_resources = [USERS, SITES, GROUPS]
+        if resource not in supported_drive_resources:
+            raise GraphClientException(
+                f"uploading drive files only available for the resources: {supported_drive_resources}")
+        item_path = f"{parent_item_id}:/{urllib.parse.quote(file_name)}:"
+        url = self._build_url(
+            V1_EP, [(resource, id), (DRIVE, None), ("/items", item_path), (CREATE_UPLOAD_SESSION, None)])
+        body = {"item": {"@microsoft.graph.conflictBehavior": conflict_behavior}}
+        return await self._request("POST", url, kwargs["_req_headers"], self._json_codec.dumps(body),
+                                   kwargs.get("expected_statuses"), retry_unsafe=True)
+
+    async def _get_upload_offset(self, upload_url: str, size: int) -> int:
+        res, status = await self._request("GET", upload_url, expected_statuses=(HTTPStatus.OK,))
+        ranges = res.get("nextExpectedRanges")
+        return int(ranges[0].split("-")[0]) if ranges else size
+
+    def _get_resume_delay(self, exception: Exception, attempt: int) -> float:
+        policy = self._retry_policy or DEFAULT_RESUME_POLICY
+        delay = None
+        if isinstance(exception, BaseHttpError):
+            delay = policy.get_retry_after(exception.response_headers)
+        return min(delay, policy.max_retry_after_sec) if delay is not None else policy.get_backoff(attempt)
+
+    async def upload_to_session(self, upload_url: str, source, size: int = None,
+                                chunk_size: int = DEFAULT_UPLOAD_CHUNK_SIZE, offset: int = None,
+                                max_chunk_retries: int = 5, timeout: int or float = 60):
+        """
+        Upload a source into an upload session (of a drive item or of a mail attachment) chunk by chunk.
+        Fragments must be uploaded in order, so uploads are pipelined by reading the next chunk while the current
+        one is sent. After a failure the upload resumes from the session's nextExpectedRanges (after the Retry-After or
+        backoff of the client's retry policy, which doesn't retry fragments itself, or of a default RetryPolicy), so at
+        most two chunks are held in memory and nothing that was acknowledged is sent again.
+        A last fragment that is answered with 202 and no expected ranges is checked against the session, which
+        either asks for the missing ranges or no longer exists (the upload is complete, and that response is
+        returned).
+        The upload url is pre-authenticated, so no token is needed.
+        :param upload_url: uploadUrl of the session, e.g. from create_drive_upload_session
+        :param source: file path, binary file object, bytes or async iterable of bytes (then size is required)
+        :param size: total size of the upload, defaults to the size of the file / bytes
+        :param chunk_size: multiple of 320 KiB, up to 60 MiB
+        :param offset: where to start from, by default it's taken from the session (i.e. resuming an upload)
+        :param max_chunk_retries: how many consecutive failures are resumed from before giving up
+        :return: the created item (e.g. drive item), as returned by the last fragment
+        """
+        validate_chunk_size(chunk_size)
+        source = source if isinstance(source, ChunkSource) else ChunkSource(source, size)
+        size = source.size
+        await source.open()
+        try:
+            if offset is None:
+                offset = await self._get_upload_offset(upload_url, size)
+            retries = 0
+            next_read = asyncio.ensure_future(source.read(offset, min(chunk_size, size - offset)))
+            while True:
+                chunk = await next_read
+                if not chunk:
+                    raise GraphClientException(f"upload source ended at {offset} before reaching size {size}")
+                end = offset + len(chunk) - 1
+                next_read = asyncio.ensure_future(source.read(end + 1, min(chunk_size, size - end - 1))) \
+                    if end + 1 < size else None
+                try:
+                    # fragments are sent without the retry policy, a failed fragment is resumed from the session
+                    res, status = await self._send(
+                        "PUT", upload_url, {"Content-Range": f"bytes {offset}-{end}/{size}"}, chunk,
+                        (HTTPStatus.OK, HTTPStatus.CREATED, HTTPStatus.ACCEPTED), timeout)
+                except Exception as e:
+                    if retries >= max_chunk_retries or isinstance(e, NotFound):
+                        raise e
+                    delay = self._get_resume_delay(e, retries)
+                    retries += 1
+                    self._log(logging.WARNING, f"resuming upload in {delay:.2f} seconds after failure "
+                                               f"(retry {retries}): {str(e)}")
+                    if next_read:
+                        await next_read
+                    await asyncio.sleep(delay)
+                    next_offset = await self._get_upload_offset(upload_url, size)
+                else:
+                    retries = 0
+                    # drive sessions answer intermediate fragments with 202 and attachment sessions with 200,
+                    # either way the session is done once it no longer expects ranges
+                    ranges = res.get("nextExpectedRanges") if isinstance(res, dict) else None
+                    if ranges is None and status in (HTTPStatus.OK, HTTPStatus.CREATED):
+                        return res
+                    if not ranges and end + 1 >= size:
+                        # an accepted last fragment that doesn't say what's missing, so ask the session
+                        try:
+                            next_offset = await self._get_upload_offset(upload_url, size)
+                        except NotFound:
+                            return res
+                        if next_offset >= size:
+                            return res
+                    else:
+                        next_offset = int(ranges[0].split("-")[0]) if ranges else end + 1
+                    if next_offset == end + 1 and next_read:
+                        source.release_before(next_offset)
+                        offset = next_offset
+                        continue
+                    if next_read:
+                        await next_read
+
+                source.release_before(next_offset)
+                offset = next_offset
+                next_read = asyncio.ensure_future(source.read(offset, min(chunk_size, size - offset)))
+        finally:
+            await source.close()
+
+    @authorized
+    async def upload_drive_item(self, resource, id: str, parent_item_id: str, file_name: str, source,
+                                size: int = None, chunk_size: int = DEFAULT_UPLOAD_CHUNK_SIZE,
+                                conflict_behavior: str = "replace", max_chunk_retries: int = 5, **kwargs):
+        """
+        Upload a (large) file into a drive folder through an upload session, see upload_to_session.
+        In order to resume an upload after a crash, persist the uploadUrl of create_drive_upload_session
+        and call upload_to_session with it.
+        :param source: file path, binary file object, bytes or async iterable of bytes (then size is required)
+        :return: the uploaded drive item
+        """
+        validate_chunk_size(chunk_size)
+        source = ChunkSource(source, size)
+        if source.size == 0:
+            raise GraphClientException("upload sessions don't support empty files")
+        session, status = await self.create_drive_upload_session(
+            resource, id, parent_item_id, file_name, conflict_behavior, **kwargs)
+        return await self.upload_to_session(session["uploadUrl"], source, chunk_size=chunk_size, offset=0,
+                                            max_chunk_retries=max_chunk_retries, timeout=kwargs.get("timeout", 60))
+
     @authorized
     async def get_user_drive_item(self, user_id: str, item_id: str, **kwargs):
         url = self._build_url(V1_EP, [(USERS, user_id), (DRIVE, None), ("/items", item_id)])
@@ -505,17 +1561,9 @@ class GraphAdminClient:
                                           expected_statuses=kwargs.get("expected_statuses"))
         return res, status
 
-    @authorized
-    async def list_all_sites(self, **kwargs) -> typing.AsyncGenerator[dict, None]:
-        res, status = await self.list_sites_bulk(**kwargs)
-        next_url = res.get(NEXT_KEY)
-        for site in res["value"]:
-            yield site
-        while next_url:
-            res, status = await self.list_more(next_url, **kwargs)
-            next_url = res.get(NEXT_KEY)
-            for site in res["value"]:
-                yield site
+    def list_all_sites(self, **kwargs) -> Paginator:
+        url = self._build_url(V1_EP, [(SITES, None)], **kwargs)
+        return self._paginate(url, kwargs)
 
     @authorized
     async def list_groups_bulk(self, **kwargs):
@@ -524,17 +1572,32 @@ class GraphAdminClient:
                                           expected_statuses=kwargs.get("expected_statuses"))
         return res, status
 
+    def list_all_groups(self, **kwargs) -> Paginator:
+        url = self._build_url(V1_EP, [(GROUPS, None)], **kwargs)
+        return self._paginate(url, kwargs)
+
+    def sync_groups(self, store: DeltaStateStore, key: str = "groups", **kwargs) -> DeltaSync:
+        """
+        Sync groups with a delta query (/groups/delta), see sync_users
+        """
+        return self._delta_sync([(GROUPS, None)], store, key, kwargs)
+
     @authorized
-    async def list_all_groups(self, **kwargs) -> typing.AsyncGenerator[dict, None]:
-        res, status = await self.list_groups_bulk(**kwargs)
-        next_url = res.get(NEXT_KEY)
-        for group in res["value"]:
-            yield group
-        while next_url:
-            res, status = await self.list_more(next_url, **kwargs)
-            next_url = res.get(NEXT_KEY)
-            for group in res["value"]:
-                yield group
+    async def count_groups(self, **kwargs) -> int:
+        """
+        Count the groups of the tenant (as filtered by the 'odata_query' key-word argument), the count is eventually
+        consistent
+        """
+        return await self._count([(GROUPS, None)], kwargs, advanced_query=True)
+
+    def list_all_groups_partitioned(self, prefixes: List[str] = None, concurrency: int = 8,
+                                    verify_count: bool = False, **kwargs) -> typing.AsyncGenerator[dict, None]:
+        """
+        List all groups by reading disjoint partitions of them concurrently (see list_all_users_partitioned).
+        Groups are partitioned by the first character of their mailNickname (GROUP_PARTITION_PREFIXES by default).
+        """
+        return self._list_partitioned(GROUPS, "mailNickname", prefixes or GROUP_PARTITION_PREFIXES, concurrency,
+                                      verify_count, kwargs)
 
     @authorized
     async def get_site(self, site_id, **kwargs):
@@ -570,9 +1633,10 @@ class GraphAdminClient:
             "extensionName": extension_name
         }
         data.update(extension_data or {})
-        data = json.dumps(data)
+        data = self._json_codec.dumps(data)
         return await self._request(
-            "POST", url, kwargs["_req_headers"], expected_statuses=kwargs.get("expected_statuses"), data=data)
+            "POST", url, kwargs["_req_headers"], expected_statuses=kwargs.get("expected_statuses"), data=data,
+            retry_unsafe=kwargs.get("retry_unsafe", False))
 
     @authorized
     async def delete_extension_from_message(self, user_id, message_id, extension_name, **kwargs):
@@ -580,29 +1644,13 @@ class GraphAdminClient:
         return await self._request(
             "DELETE", url, kwargs["_req_headers"], expected_statuses=kwargs.get("expected_statuses"))
 
-    @authorized
-    async def list_recent_files(self, resource: str, resource_id: str, **kwargs):
+    def list_recent_files(self, resource: str, resource_id: str, **kwargs) -> Paginator:
         supported_drive_resources = [USERS, SITES, GROUPS]
         if resource not in supported_drive_resources:
             raise GraphClientException(
                 f"list recent files only available for the resources: {supported_drive_resources}")
         url = self._build_url(V1_EP, [(resource, resource_id), (DRIVE, None), ("/recent", None)], **kwargs)
-        res, status = await self._request(
-            "GET", url, kwargs["_req_headers"], expected_statuses=kwargs.get("expected_statuses"))
-
-        next_url = res.get(NEXT_KEY)
-        delta_url = res.get(DELTA_KEY)
-        for drive_item in res["value"]:
-            yield drive_item
-        while next_url:
-            res, status = await self.list_more(next_url, **kwargs)
-            next_url = res.get(NEXT_KEY)
-            delta_url = res.get(DELTA_KEY)
-            for drive_item in res["value"]:
-                yield drive_item
-        if not delta_url:
-            raise GraphClientException("missing deltaLink after iterating through all recent drive items")
-        yield delta_url
+        return self._paginate(url, kwargs)
 
     @authorized
     async def list_mail_folders_bulk(self, user_id, **kwargs):
@@ -610,17 +1658,18 @@ class GraphAdminClient:
         return await self._request(
             "GET", url, kwargs["_req_headers"], expected_statuses=kwargs.get("expected_statuses"))
 
-    @authorized
-    async def list_all_mail_folders(self, user_id, **kwargs) -> typing.AsyncGenerator[dict, None]:
-        res, status = await self.list_mail_folders_bulk(user_id, **kwargs)
-        next_url = res.get(NEXT_KEY)
-        for mail_folder in res["value"]:
-            yield mail_folder
-        while next_url:
-            res, status = await self.list_more(next_url, **kwargs)
-            next_url = res.get(NEXT_KEY)
-            for mail_folder in res["value"]:
-                yield mail_folder
+    def list_all_mail_folders(self, user_id, **kwargs) -> Paginator:
+        url = self._build_url(V1_EP, [(USERS, user_id), (MAIL_FOLDERS, None)], **kwargs)
+        return self._paginate(url, kwargs)
+
+    def sync_mail_folder_messages(self, user_id, folder_id, store: DeltaStateStore, key: str = None,
+                                  **kwargs) -> DeltaSync:
+        """
+        Sync the mails of a mail folder with a delta query (/mailFolders/{id}/messages/delta), see sync_users
+        :param key: key of the sync state in store, by default derived from the user and folder ids
+        """
+        key = key or f"users/{user_id}/mailFolders/{folder_id}/messages"
+        return self._delta_sync([(USERS, user_id), (MAIL_FOLDERS, folder_id), (MAILS, None)], store, key, kwargs)
 
     @authorized
     async def get_mail_folder(self, user_id, folder_id, **kwargs):
@@ -641,16 +1690,53 @@ class GraphAdminClient:
             "DELETE", url, kwargs["_req_headers"], expected_statuses=kwargs.get("expected_statuses"))
 
     @authorized
-    async def add_attachment_to_mail(self, user_id, message_id, attachment_name, content: bytes, **kwargs):
+    async def create_attachment_upload_session(self, user_id, message_id, attachment_name, size: int,
+                                               content_type: str = None, **kwargs):
+        """
+        Create an upload session for a file attachment of a mail (e.g. a draft)
+        :return: upload session (with uploadUrl)
+        """
+        url = self._build_url(
+            V1_EP, [(USERS, user_id), (MAILS, message_id), (ATTACHMENTS, None), (CREATE_UPLOAD_SESSION, None)])
+        attachment_item = {"attachmentType": "file", "name": attachment_name, "size": size}
+        if content_type:
+            attachment_item["contentType"] = content_type
+        body = {"AttachmentItem": attachment_item}
+        return await self._request("POST", url, kwargs["_req_headers"], self._json_codec.dumps(body),
+                                   kwargs.get("expected_statuses"), retry_unsafe=True)
+
+    @authorized
+    async def add_attachment_to_mail(self, user_id, message_id, attachment_name, content, size: int = None,
+                                     content_type: str = None, chunk_size: int = DEFAULT_UPLOAD_CHUNK_SIZE, **kwargs):
+        """
+        Add a file attachment to a mail.
+        Attachments larger than MAX_INLINE_ATTACHMENT_SIZE are streamed through an upload session, chunk by chunk.
+        :param content: bytes, file path, binary file or async iterable of bytes (then size is required)
+        :param size: size of content, defaults to the size of the bytes / file
+        :param content_type: mime type of the attachment
+        """
+        source = ChunkSource(content, size)
+        if source.size > MAX_INLINE_ATTACHMENT_SIZE:
+            session, status = await self.create_attachment_upload_session(
+                user_id, message_id, attachment_name, source.size, content_type, **kwargs)
+            res = await self.upload_to_session(session["uploadUrl"], source, chunk_size=chunk_size, offset=0,
+                                               timeout=kwargs.get("timeout", 60))
+            return res, HTTPStatus.CREATED
+
         url = self._build_url(V1_EP, [(USERS, user_id), (MAILS, message_id), (ATTACHMENTS, None)], **kwargs)
+        if not isinstance(content, (bytes, bytearray)):
+            content = await self._read_source(source)
         b64_str_content = base64.b64encode(content).decode()
         body = {
             "@odata.type": "#microsoft.graph.fileAttachment",
             "name": attachment_name,
             "contentBytes": b64_str_content
         }
+        if content_type:
+            body["contentType"] = content_type
         return await self._request(
-            "POST", url, kwargs["_req_headers"], data=json.dumps(body), expected_statuses=kwargs.get("expected_statuses"))
+            "POST", url, kwargs["_req_headers"], data=self._json_codec.dumps(body),
+            expected_statuses=kwargs.get("expected_statuses"), retry_unsafe=kwargs.get("retry_unsafe", False))
 
     @authorized
     async def delete_mail(self, user_id, message_id, **kwargs):
@@ -663,7 +1749,8 @@ class GraphAdminClient:
         url = self._build_url(V1_EP, [(USERS, user_id), (MAILS, message_id), (MOVE_MAIL, None)], **kwargs)
         body = {"destinationId": destination_folder_id}
         return await self._request(
-            "POST", url, kwargs["_req_headers"], json.dumps(body), expected_statuses=kwargs.get("expected_statuses"))
+            "POST", url, kwargs["_req_headers"], self._json_codec.dumps(body),
+            expected_statuses=kwargs.get("expected_statuses"), retry_unsafe=kwargs.get("retry_unsafe", False))
 
     @authorized
     async def get_user_purpose(self, user_id, **kwargs):
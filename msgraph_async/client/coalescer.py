@@ -0,0 +1,74 @@
+import asyncio
+import typing
+
+
+class GetCoalescer:
+    """
+    Holds GET requests for up to max_delay_sec and groups up to max_batch_size of them (per key, e.g. per api version
+    and token) into a single $batch call.
+    Every caller awaits its own future and gets its own result or exception, exactly as if it was sent on its own.
+    :param send_single: coroutine function that sends one entry, used when only one request is pending for a key
+    :param send_batch: coroutine function that sends (key, entries) as one batch and returns a list aligned with
+    entries, each item is either a result or an exception instance
+    """
+    def __init__(self, send_single: typing.Callable, send_batch: typing.Callable, max_delay_sec: float,
+                 max_batch_size: int):
+        self._send_single = send_single
+        self._send_batch = send_batch
+        self._max_delay_sec = max_delay_sec
+        self._max_batch_size = max_batch_size
+        self._pending = {}
+        self._timers = {}
+        self._tasks = set()
+
+    def submit(self, key, entry) -> asyncio.Future:
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(key, [])
+        pending.append((entry, future))
+        if len(pending) >= self._max_batch_size:
+            self._flush(key)
+        elif len(pending) == 1:
+            self._timers[key] = loop.call_later(self._max_delay_sec, self._flush, key)
+        return future
+
+    def _flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        pending = self._pending.pop(key, None)
+        if pending:
+            task = asyncio.ensure_future(self._dispatch(key, pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, key, pending: typing.List[typing.Tuple]):
+        pending = [(entry, future) for entry, future in pending if not future.done()]
+        if not pending:
+            return
+        entries = [entry for entry, _ in pending]
+        try:
+            if len(entries) == 1:
+                results = [await self._send_single(entries[0])]
+            else:
+                results = await self._send_batch(key, entries)
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(pending, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def flush_all(self):
+        """Send everything that is currently held and wait for all in-flight batches"""
+        for key in list(self._pending):
+            self._flush(key)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
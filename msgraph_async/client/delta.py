@@ -0,0 +1,59 @@
+import typing
+from msgraph_async.common.delta_state import DeltaStateStore
+from msgraph_async.client.paginator import Paginator, Page
+
+
+class DeltaSync:
+    """
+    A single sync cycle of a delta query (e.g. /users/delta).
+    It reads the changes since the link saved in 'store' under 'key', or the full state of the resource on the first
+    sync. The link of the next unread page is saved after every page (so a long sync resumes where it stopped),
+    and the new deltaLink is saved once all the changes were read.
+    Deleted items are yielded as well, marked by the '@removed' key.
+    :param paginate: function (url) -> Paginator
+    :param initial_url: delta url of the first sync
+    """
+    def __init__(self, paginate: typing.Callable[[str], Paginator], initial_url: str, store: DeltaStateStore,
+                 key: str):
+        self._paginate = paginate
+        self._initial_url = initial_url
+        self._store = store
+        self._key = key
+        self._delta_link = None
+        self._is_initial = None
+
+    @property
+    def key(self) -> str:
+        return self._key
+
+    @property
+    def delta_link(self) -> typing.Optional[str]:
+        """The new deltaLink, available once all the changes were read"""
+        return self._delta_link
+
+    @property
+    def is_initial(self) -> typing.Optional[bool]:
+        """Whether this sync reads the full state of the resource (no link was saved), known once it started"""
+        return self._is_initial
+
+    async def reset(self):
+        """Forget the saved link, so the next sync reads the full state again"""
+        await self._store.delete(self._key)
+
+    async def pages(self) -> typing.AsyncGenerator[Page, None]:
+        link = await self._store.get(self._key)
+        self._is_initial = link is None
+        paginator = self._paginate(link or self._initial_url)
+        async for page in paginator.pages():
+            yield page
+            if page.next_link:
+                await self._store.set(self._key, page.next_link)
+        # a paginator that was stopped early (e.g. by max_pages) has no deltaLink, the saved link is kept
+        if paginator.cursor is None and paginator.delta_link:
+            self._delta_link = paginator.delta_link
+            await self._store.set(self._key, self._delta_link)
+
+    async def __aiter__(self) -> typing.AsyncIterator[dict]:
+        async for page in self.pages():
+            for item in page:
+                yield item
@@ -0,0 +1,231 @@
+import heapq
+import asyncio
+import logging
+import typing
+from collections import deque
+from msgraph_async.common.constants import USERS, SITES, GROUPS, DRIVES, DELTA
+from msgraph_async.common.exceptions import GraphClientException, Gone, NotFound
+from msgraph_async.common.delta_state import DeltaStateStore
+
+INITIAL_SYNC_LATEST = "latest"
+INITIAL_SYNC_FULL = "full"
+
+
+class TrackedDrive:
+
+    def __init__(self, resource: str, id: str):
+        self.resource = resource
+        self.id = id
+        self.idle_polls = 0
+        self.failed_polls = 0
+        self.due_at = 0.0
+        self.version = 0
+        self.polling = False
+        self.notified = False
+
+    @property
+    def key(self) -> str:
+        return f"{self.resource.strip('/')}/{self.id}"
+
+
+class DriveDeltaScheduler:
+    """
+    Tracks the changes of many drives, by polling their delta concurrently (up to 'concurrency' drives at a time).
+    The delta link of every drive is kept in 'store', keyed by e.g. 'users/{id}' (and by the tenant too when 'tenant_id'
+    is given).
+    Drives are polled round-robin, by the time they became due. A drive whose poll found no changes is backed off
+    exponentially (from poll_interval_sec up to max_idle_interval_sec), and a drive flagged by notify() (e.g. by a
+    change notification) is polled before any other drive, regardless of its back off.
+    The changes of all drives are yielded as a single stream of (drive key, drive item) by changes(). A page of
+    changes is acknowledged (and the drive's link advanced) only after the consumer took all of its items and asked
+    for the next one, a page the consumer stopped in the middle of is read again on the next poll of its drive, so
+    changes are delivered at least once.
+    :param client: GraphAdminClient
+    :param initial_sync: for a drive without a saved link, 'latest' tracks changes from now on, 'full' yields all
+    of its items first
+    :param kwargs: key-word arguments of every call (e.g. token, tenant_id or odata_query)
+    """
+    def __init__(self, client, store: DeltaStateStore, concurrency: int = 16, poll_interval_sec: float = 60,
+                 max_idle_interval_sec: float = 3600, initial_sync: str = INITIAL_SYNC_LATEST,
+                 buffer_pages: int = 16, **kwargs):
+        if concurrency < 1:
+            raise ValueError("concurrency must be positive")
+        if not 0 < poll_interval_sec <= max_idle_interval_sec:
+            raise ValueError("intervals must satisfy 0 < poll interval <= max idle interval")
+        if initial_sync not in (INITIAL_SYNC_LATEST, INITIAL_SYNC_FULL):
+            raise ValueError(f"initial sync must be '{INITIAL_SYNC_LATEST}' or '{INITIAL_SYNC_FULL}'")
+        self._client = client
+        self._store = store
+        self._concurrency = concurrency
+        self._poll_interval_sec = poll_interval_sec
+        self._max_idle_interval_sec = max_idle_interval_sec
+        self._initial_sync = initial_sync
+        self._kwargs = kwargs
+        self._key_prefix = f"{kwargs['tenant_id']}:" if kwargs.get("tenant_id") else ""
+        self._drives = {}
+        self._due = []
+        self._notified = deque()
+        self._changed = asyncio.Event()
+        self._pages = asyncio.Queue(maxsize=buffer_pages)
+        self._workers = []
+
+    @property
+    def drive_keys(self) -> typing.List[str]:
+        return list(self._drives)
+
+    def _log(self, level, msg):
+        self._client._log(level, msg)
+
+    def _store_key(self, drive: TrackedDrive) -> str:
+        return self._key_prefix + drive.key
+
+    def _schedule(self, drive: TrackedDrive, delay: float):
+        drive.version += 1
+        drive.due_at = asyncio.get_event_loop().time() + delay
+        heapq.heappush(self._due, (drive.due_at, drive.version, drive.key))
+        self._changed.set()
+
+    def add_drive(self, resource: str, id: str) -> str:
+        """
+        Track the drive of a user, site or group, or a drive by its id (resource DRIVES)
+        :return: the key of the drive
+        """
+        if resource not in (USERS, SITES, GROUPS, DRIVES):
+            raise GraphClientException(f"drive resource must be one of: {[USERS, SITES, GROUPS, DRIVES]}")
+        drive = TrackedDrive(resource, id)
+        if drive.key not in self._drives:
+            self._drives[drive.key] = drive
+            self._schedule(drive, 0)
+        return drive.key
+
+    def remove_drive(self, key: str):
+        """Stop tracking a drive, its saved link is kept"""
+        drive = self._drives.pop(key, None)
+        if drive:
+            drive.version += 1
+
+    def notify(self, key: str):
+        """Poll a drive as soon as possible, e.g. when a change notification was received for it"""
+        drive = self._drives.get(key)
+        if drive and not drive.notified:
+            drive.notified = True
+            self._notified.append(key)
+            self._changed.set()
+
+    def _take_due_drive(self) -> typing.Tuple[typing.Optional[TrackedDrive], typing.Optional[float]]:
+        """The next drive to poll (if any), else how long until the next drive is due"""
+        while self._notified:
+            drive = self._drives.get(self._notified.popleft())
+            if drive and drive.notified and not drive.polling:
+                return drive, None
+        now = asyncio.get_event_loop().time()
+        while self._due:
+            due_at, version, key = self._due[0]
+            drive = self._drives.get(key)
+            if not drive or drive.version != version or drive.polling:
+                heapq.heappop(self._due)
+                continue
+            if due_at > now:
+                return None, due_at - now
+            heapq.heappop(self._due)
+            return drive, None
+        return None, None
+
+    async def _next_drive(self) -> TrackedDrive:
+        while True:
+            drive, wait_sec = self._take_due_drive()
+            if drive:
+                drive.polling = True
+                drive.notified = False
+                return drive
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), wait_sec)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _get_link(self, drive: TrackedDrive) -> typing.Optional[str]:
+        link = await self._store.get(self._store_key(drive))
+        if link:
+            return link
+        if self._initial_sync == INITIAL_SYNC_FULL:
+            return self._client._get_drive_root_url(drive.resource, drive.id) + DELTA
+        link = await self._client.get_latest_delta_link(drive.resource, drive.id, **self._kwargs)
+        await self._store.set(self._store_key(drive), link)
+        return None
+
+    async def _poll(self, drive: TrackedDrive) -> int:
+        """Read the changes of a drive since its saved link, returns the number of changes"""
+        link = await self._get_link(drive)
+        if not link:
+            return 0
+        changes = self._client.list_drive_changes(link, **self._kwargs)
+        count = 0
+        async for page in changes.pages():
+            if page:
+                acknowledged = asyncio.get_event_loop().create_future()
+                await self._pages.put((drive.key, page, acknowledged))
+                if not await acknowledged:
+                    # the consumer stopped in the middle of the page, the saved link is kept so it's read again
+                    return count
+                count += len(page)
+            if page.next_link:
+                await self._store.set(self._store_key(drive), page.next_link)
+        if changes.cursor is None and changes.delta_link:
+            await self._store.set(self._store_key(drive), changes.delta_link)
+        return count
+
+    async def _work(self):
+        while True:
+            drive = await self._next_drive()
+            try:
+                count = await self._poll(drive)
+                drive.failed_polls = 0
+                drive.idle_polls = 0 if count else drive.idle_polls + 1
+            except (Gone, NotFound) as e:
+                # the delta link expired (or was reset), the drive is synced again according to initial_sync
+                self._log(logging.WARNING, f"delta link of drive {drive.key} is no longer valid, resetting it: {e}")
+                await self._store.delete(self._store_key(drive))
+                drive.failed_polls += 1
+            except Exception as e:
+                self._log(logging.ERROR, f"exception while polling drive {drive.key}: {str(e)}")
+                drive.failed_polls += 1
+            finally:
+                drive.polling = False
+            if drive.key in self._drives:
+                backoff = 2 ** min(max(drive.idle_polls, drive.failed_polls, 1) - 1, 32)
+                self._schedule(drive, min(self._poll_interval_sec * backoff, self._max_idle_interval_sec))
+                if drive.notified:
+                    self._notified.append(drive.key)
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.ensure_future(self._work()) for _ in range(self._concurrency)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def changes(self) -> typing.AsyncGenerator[typing.Tuple[str, dict], None]:
+        """Start polling (if not started yet) and yield the changes of all drives as (drive key, drive item)"""
+        self.start()
+        while True:
+            key, page, acknowledged = await self._pages.get()
+            consumed = False
+            try:
+                for item in page:
+                    yield key, item
+                consumed = True
+            finally:
+                # a page is acknowledged once the consumer asks for the item after its last one
+                if not acknowledged.done():
+                    acknowledged.set_result(consumed)
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
@@ -0,0 +1,66 @@
+import asyncio
+import typing
+from msgraph_async.client.paginator import Paginator
+
+FOLDER_KEY = "folder"
+
+
+async def walk_tree(root_id: typing.Optional[str], list_children: typing.Callable[[typing.Optional[str]], Paginator],
+                    concurrency: int = 8, max_depth: int = None, buffer_pages: int = 16,
+                    on_error: typing.Callable[[typing.Optional[str], Exception], None] = None
+                    ) -> typing.AsyncGenerator[dict, None]:
+    """
+    Walk a drive tree breadth-first, listing up to 'concurrency' folders at a time, and yield its items (folders
+    included) as soon as their page is read. Items of the same folder are yielded in order, items of different
+    folders are interleaved.
+    :param root_id: id of the folder to walk, None for the root of the drive
+    :param list_children: function (folder id, None for the root) -> Paginator of the folder's children
+    :param max_depth: don't list folders deeper than this (the children of the root are of depth 1)
+    :param buffer_pages: how many pages of items are buffered ahead of the consumer
+    :param on_error: function (folder id, exception) called when listing a folder fails, the rest of that folder is
+    then skipped and the walk goes on. Without it, the first failure ends the walk with its exception
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be positive")
+    if max_depth is not None and max_depth < 1:
+        raise ValueError("max depth must be positive")
+    folders = asyncio.Queue()
+    pages = asyncio.Queue(maxsize=buffer_pages)
+    pending = 1
+    folders.put_nowait((root_id, 1))
+
+    async def work():
+        nonlocal pending
+        while True:
+            folder_id, depth = await folders.get()
+            try:
+                async for page in list_children(folder_id).pages():
+                    if max_depth is None or depth < max_depth:
+                        for item in page:
+                            if FOLDER_KEY in item and item[FOLDER_KEY].get("childCount", 1):
+                                pending += 1
+                                folders.put_nowait((item["id"], depth + 1))
+                    await pages.put((page, None, folder_id))
+            except Exception as e:
+                await pages.put((None, e, folder_id))
+            pending -= 1
+            if not pending:
+                await pages.put((None, None, None))
+
+    workers = [asyncio.ensure_future(work()) for _ in range(concurrency)]
+    try:
+        while True:
+            page, exception, folder_id = await pages.get()
+            if exception:
+                if on_error is None:
+                    raise exception
+                on_error(folder_id, exception)
+                continue
+            if page is None:
+                return
+            for item in page:
+                yield item
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
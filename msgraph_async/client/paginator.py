@@ -0,0 +1,247 @@
+import asyncio
+import typing
+from msgraph_async.common.constants import NEXT_KEY, DELTA_KEY
+from msgraph_async.common.exceptions import GraphClientException
+
+
+class Page(list):
+    """
+    The items of a single page, along with the url it was read from and the other keys of the page
+    (e.g. its nextLink and deltaLink)
+    """
+    def __init__(self, items: typing.Iterable, url: str, metadata: dict):
+        super().__init__(items)
+        self.url = url
+        self.metadata = metadata
+
+    @property
+    def next_link(self) -> typing.Optional[str]:
+        return self.metadata.get(NEXT_KEY)
+
+    @property
+    def delta_link(self) -> typing.Optional[str]:
+        return self.metadata.get(DELTA_KEY)
+
+
+class Paginator:
+    """
+    The pages of a list operation, following their nextLinks.
+    Iterating it (async for item in paginator) yields items, pages() yields whole pages (see Page).
+    'cursor' is the url of the next page to read, it is a plain string that can be persisted and passed back as the
+    'cursor' key-word argument of the same list operation to resume it (e.g. after a crash). A page whose items were
+    only partly consumed is not considered read, so resuming from a cursor may yield some items again.
+    Iterating the same paginator again continues from its cursor.
+    :param get_page: coroutine function (url) -> Page
+    :param stream_page: async generator function (url, metadata: dict) -> items, that fills metadata with the other
+    keys of the page after its last item (used when stream_items is set)
+    :param max_items: stop after this many items
+    :param max_pages: stop after this many pages
+    :param prefetch: read up to this many pages ahead of the consumer in the background
+    :param stream_items: parse every page while it is received when iterating items (ignored when prefetching)
+    :param require_delta_link: raise if the last page has no deltaLink
+    """
+    def __init__(self, url: str, get_page: typing.Callable, stream_page: typing.Callable = None,
+                 max_items: int = None, max_pages: int = None, prefetch: int = 0, stream_items: bool = False,
+                 require_delta_link: bool = False):
+        if max_items is not None and max_items < 0:
+            raise ValueError("max items must not be negative")
+        if max_pages is not None and max_pages < 0:
+            raise ValueError("max pages must not be negative")
+        if prefetch < 0:
+            raise ValueError("prefetch must not be negative")
+        self._cursor = url
+        self._get_page = get_page
+        self._stream_page = stream_page
+        self._max_items = max_items
+        self._max_pages = max_pages
+        self._prefetch = prefetch
+        self._stream_items = stream_items
+        self._require_delta_link = require_delta_link
+        self._items_count = 0
+        self._pages_count = 0
+        self._metadata = {}
+
+    @property
+    def cursor(self) -> typing.Optional[str]:
+        """Url of the next page to read, None once all pages were read"""
+        return self._cursor
+
+    @property
+    def metadata(self) -> dict:
+        """The keys of the last read page, other than its items"""
+        return self._metadata
+
+    @property
+    def delta_link(self) -> typing.Optional[str]:
+        """The deltaLink of the last page, available once all pages were read"""
+        return self._metadata.get(DELTA_KEY)
+
+    @property
+    def items_count(self) -> int:
+        return self._items_count
+
+    @property
+    def pages_count(self) -> int:
+        return self._pages_count
+
+    @property
+    def _items_limit_reached(self) -> bool:
+        return self._max_items is not None and self._items_count >= self._max_items
+
+    @property
+    def _limit_reached(self) -> bool:
+        return self._items_limit_reached or (self._max_pages is not None and self._pages_count >= self._max_pages)
+
+    def _page_done(self, metadata: dict):
+        self._metadata = metadata
+        self._cursor = metadata.get(NEXT_KEY)
+        if not self._cursor and self._require_delta_link and not metadata.get(DELTA_KEY):
+            raise GraphClientException("missing deltaLink after iterating through all pages")
+
+    async def _prefetch_pages(self, url: str, pages: asyncio.Queue):
+        try:
+            fetched = self._pages_count
+            while url and (self._max_pages is None or fetched < self._max_pages):
+                page = await self._get_page(url)
+                fetched += 1
+                await pages.put((page, None))
+                url = page.next_link
+            await pages.put(None)
+        except Exception as e:
+            await pages.put((None, e))
+
+    async def _read_pages(self) -> typing.AsyncGenerator[Page, None]:
+        if not self._prefetch:
+            while self._cursor and not self._limit_reached:
+                page = await self._get_page(self._cursor)
+                self._pages_count += 1
+                yield page
+            return
+
+        if not self._cursor or self._limit_reached:
+            return
+        pages = asyncio.Queue(maxsize=self._prefetch)
+        task = asyncio.ensure_future(self._prefetch_pages(self._cursor, pages))
+        try:
+            while not self._limit_reached:
+                entry = await pages.get()
+                if entry is None:
+                    return
+                page, exception = entry
+                if exception:
+                    raise exception
+                self._pages_count += 1
+                yield page
+        finally:
+            task.cancel()
+
+    async def pages(self) -> typing.AsyncGenerator[Page, None]:
+        """Yield whole pages, the last one is cut to max_items"""
+        pages = self._read_pages()
+        try:
+            async for page in pages:
+                remaining = None if self._max_items is None else self._max_items - self._items_count
+                partial = remaining is not None and len(page) > remaining
+                if partial:
+                    del page[remaining:]
+                self._items_count += len(page)
+                yield page
+                if partial:
+                    return
+                self._page_done(page.metadata)
+        finally:
+            await pages.aclose()
+
+    def __aiter__(self) -> typing.AsyncIterator:
+        if self._stream_items and self._stream_page and not self._prefetch:
+            return self._stream_items_of_pages()
+        return self._items_of_pages()
+
+    async def _items_of_pages(self):
+        pages = self._read_pages()
+        try:
+            async for page in pages:
+                for item in page:
+                    if self._items_limit_reached:
+                        return
+                    self._items_count += 1
+                    yield item
+                self._page_done(page.metadata)
+        finally:
+            await pages.aclose()
+
+    async def _stream_items_of_pages(self):
+        while self._cursor and not self._limit_reached:
+            metadata = {}
+            items = self._stream_page(self._cursor, metadata)
+            self._pages_count += 1
+            try:
+                async for item in items:
+                    if self._items_limit_reached:
+                        return
+                    self._items_count += 1
+                    yield item
+            finally:
+                await items.aclose()
+            self._page_done(metadata)
+
+
+async def merge_pages(paginators: typing.List[Paginator], concurrency: int = 8, ordered: bool = False,
+                      buffer_pages: int = 1) -> typing.AsyncGenerator[Page, None]:
+    """
+    Read the pages of several paginators (e.g. partitions of the same listing) concurrently, and yield them as a
+    single stream of pages.
+    :param concurrency: how many paginators are read at the same time
+    :param ordered: yield all the pages of each paginator before those of the next one (by the order of
+    paginators), else pages are yielded as soon as they are read
+    :param buffer_pages: how many pages are buffered (per paginator, if ordered) ahead of the consumer
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be positive")
+    slots = asyncio.Semaphore(concurrency)
+    shared = asyncio.Queue(maxsize=buffer_pages)
+    queues = [asyncio.Queue(maxsize=buffer_pages) if ordered else shared for _ in paginators]
+    tasks = []
+
+    async def read(paginator: Paginator, queue: asyncio.Queue):
+        try:
+            async for page in paginator.pages():
+                await queue.put((page, None))
+            await queue.put((None, None))
+        except Exception as e:
+            await queue.put((None, e))
+        finally:
+            slots.release()
+
+    async def start():
+        # paginators are started by their order, so the first unfinished one (that the ordered consumer waits for)
+        # always holds a slot
+        for paginator, queue in zip(paginators, queues):
+            await slots.acquire()
+            tasks.append(asyncio.ensure_future(read(paginator, queue)))
+
+    starter = asyncio.ensure_future(start())
+    try:
+        if ordered:
+            for queue in queues:
+                while True:
+                    page, exception = await queue.get()
+                    if exception:
+                        raise exception
+                    if page is None:
+                        break
+                    yield page
+        else:
+            remaining = len(paginators)
+            while remaining:
+                page, exception = await shared.get()
+                if exception:
+                    raise exception
+                if page is None:
+                    remaining -= 1
+                    continue
+                yield page
+    finally:
+        starter.cancel()
+        for task in tasks:
+            task.cancel()
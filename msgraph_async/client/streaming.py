@@ -0,0 +1,145 @@
+import os
+import uuid
+import asyncio
+import typing
+import threading
+import aiohttp
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_PART_SIZE = 10 * 1024 * 1024
+DEFAULT_PAGE_CHUNK_SIZE = 64 * 1024
+
+
+def get_temp_path(path: str) -> str:
+    """A unique path next to 'path' (on the same file system), to write a file before it replaces 'path'"""
+    directory, name = os.path.split(os.fspath(path))
+    return os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}.part")
+
+
+def finish_temp_file(temp_path: str, path: str, complete: bool):
+    """Move a complete temp file to its final path, or remove an incomplete one"""
+    if complete:
+        os.replace(temp_path, path)
+    else:
+        try:
+            os.unlink(temp_path)
+        except FileNotFoundError:
+            pass
+
+
+class PositionalFile:
+    """
+    A file that is preallocated to its final size and written at explicit offsets, so several ranges of it
+    can be written concurrently (with os.pwrite where available, else with a lock around seek and write).
+    It is written into a temp file next to path, which replaces path only once it's closed as complete.
+    """
+    def __init__(self, path: str, size: int):
+        self._path = path
+        self._temp_path = None
+        self._size = size
+        self._fp = None
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def open(self):
+        self._temp_path = get_temp_path(self._path)
+        self._fp = open(self._temp_path, "xb+")
+        self._fp.truncate(self._size)
+
+    def write_at(self, offset: int, data: bytes):
+        if hasattr(os, "pwrite"):
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(self._fp.fileno(), view, offset)
+                view = view[written:]
+                offset += written
+        else:
+            with self._lock:
+                self._fp.seek(offset)
+                self._fp.write(data)
+
+    def close(self, complete: bool = False):
+        """Close the file, it replaces path if it's complete and is removed otherwise"""
+        if self._fp:
+            self._fp.close()
+            self._fp = None
+            finish_temp_file(self._temp_path, self._path, complete)
+
+
+class DownloadStream:
+    """
+    A response body that is read chunk by chunk instead of being buffered in memory.
+    Status, content length, etag and content type are available as soon as the stream is opened, the body can then
+    be iterated (async for chunk in stream) or saved into a file with save().
+    The stream must be closed when done, either with close() or by using it as async context manager.
+    """
+    def __init__(self, response: aiohttp.ClientResponse, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self._response = response
+        self._chunk_size = chunk_size
+
+    @property
+    def status(self) -> int:
+        return self._response.status
+
+    @property
+    def headers(self):
+        return self._response.headers
+
+    @property
+    def url(self) -> str:
+        return str(self._response.url)
+
+    @property
+    def content_length(self) -> typing.Optional[int]:
+        return self._response.content_length
+
+    @property
+    def content_type(self) -> str:
+        return self._response.content_type
+
+    @property
+    def etag(self) -> typing.Optional[str]:
+        return self._response.headers.get("ETag")
+
+    def __aiter__(self) -> typing.AsyncIterator[bytes]:
+        return self._response.content.iter_chunked(self._chunk_size).__aiter__()
+
+    async def save(self, file: str or typing.BinaryIO) -> int:
+        """
+        Write the body into file (path or binary file object), holding a single chunk in memory at a time.
+        A path is written through a temp file next to it, so it's replaced only by a complete body
+        :return: number of bytes written
+        """
+        loop = asyncio.get_event_loop()
+        if isinstance(file, (str, os.PathLike)):
+            temp_path = get_temp_path(file)
+            fp = await loop.run_in_executor(None, open, temp_path, "xb")
+            complete = False
+            try:
+                written = await self._write(fp)
+                complete = True
+                return written
+            finally:
+                await loop.run_in_executor(None, fp.close)
+                await loop.run_in_executor(None, finish_temp_file, temp_path, file, complete)
+        return await self._write(file)
+
+    async def _write(self, fp: typing.BinaryIO) -> int:
+        loop = asyncio.get_event_loop()
+        written = 0
+        async for chunk in self:
+            await loop.run_in_executor(None, fp.write, chunk)
+            written += len(chunk)
+        return written
+
+    def close(self):
+        self._response.release()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,340 @@
+import re
+import copy
+import time
+import heapq
+import random
+import asyncio
+import logging
+import typing
+from datetime import datetime, timezone
+from msgraph_async.common.constants import SubscriptionResources, SUBSCRIPTIONS, MAX_BATCH_REQUESTS, V1_EP, BETA_EP
+from msgraph_async.common.exceptions import NotFound
+from msgraph_async.common.batch import BatchRequest
+from msgraph_async.common.partitions import parse_graph_datetime
+from msgraph_async.common.subscription_store import SubscriptionRecord, SubscriptionStore
+
+
+class SubscriptionSpec:
+    """A subscription that should exist: its resource, the user it is of (if any) and its change type"""
+    def __init__(self, resource: SubscriptionResources, user_id: str = None, change_type: str = "created"):
+        self.resource = resource
+        self.user_id = user_id
+        self.change_type = change_type
+
+    def __repr__(self):
+        return f"SubscriptionSpec({self.resource.name}, {self.user_id}, {self.change_type})"
+
+    @property
+    def resource_path(self) -> str:
+        return self.resource.value if self.resource.resource_data_included else self.resource.value.format(self.user_id)
+
+    @property
+    def key(self) -> typing.Tuple[str, str]:
+        return subscription_key(self.resource_path, self.change_type)
+
+
+def subscription_key(resource_path: str, change_type: str) -> typing.Tuple[str, str]:
+    """
+    Identity of a subscription by its resource and change type, so the resources returned by the service (which may
+    be written as users/{id} rather than users('{id}') or differ in case) match the requested ones
+    """
+    resource_path = re.sub(r"\('([^']*)'\)", r"/\1", resource_path.strip("/")).lower()
+    return resource_path, ",".join(sorted(part.strip().lower() for part in change_type.split(",")))
+
+
+class ProvisioningSummary:
+    """The outcome of SubscriptionManager.provision"""
+    def __init__(self):
+        self.existing = 0
+        self.created = []
+        self.deleted = []
+        self.failed = []
+
+    def __repr__(self):
+        return (f"ProvisioningSummary(existing={self.existing}, created={len(self.created)}, "
+                f"deleted={len(self.deleted)}, failed={len(self.failed)})")
+
+
+class SubscriptionManager:
+    """
+    Keeps many subscriptions alive, by renewing each of them ahead of its expiration.
+    The subscriptions are kept in 'store' and renewed by the order of their expiration: each one is renewed
+    renew_ahead_sec before it expires, minus a random delay of up to spread_sec (so subscriptions that were created
+    together don't all come due at the same moment). The renewals that are due together are sent as $batch calls
+    of up to MAX_BATCH_REQUESTS PATCHes each, up to 'concurrency' calls at a time.
+    A subscription that no longer exists (404) is created again with the same arguments and replaces the lost one
+    in the store, other failures are retried every retry_interval_sec.
+    :param client: GraphAdminClient
+    :param plain_certificate: encryption certificate, required to create again subscriptions that include resource
+    data
+    :param kwargs: key-word arguments of every call (e.g. token or tenant_id)
+    """
+    def __init__(self, client, store: SubscriptionStore, renew_ahead_sec: float = 3600, spread_sec: float = 600,
+                 retry_interval_sec: float = 60, concurrency: int = 4, plain_certificate: str = None, **kwargs):
+        if concurrency < 1:
+            raise ValueError("concurrency must be positive")
+        if renew_ahead_sec < 0 or spread_sec < 0 or retry_interval_sec <= 0:
+            raise ValueError("renew ahead and spread must not be negative, retry interval must be positive")
+        self._client = client
+        self._store = store
+        self._renew_ahead_sec = renew_ahead_sec
+        self._spread_sec = spread_sec
+        self._retry_interval_sec = retry_interval_sec
+        self._concurrency = concurrency
+        self._plain_certificate = plain_certificate
+        self._kwargs = kwargs
+        self._records = {}
+        self._due_at = {}
+        self._due = []
+        self._changed = asyncio.Event()
+        self._task = None
+
+    @property
+    def subscriptions(self) -> typing.List[SubscriptionRecord]:
+        return list(self._records.values())
+
+    def _log(self, level, msg):
+        self._client._log(level, msg)
+
+    def _schedule(self, record: SubscriptionRecord, due_at: float = None):
+        if due_at is None:
+            spread = min(self._spread_sec, record.minutes_to_expiration * 60 / 4)
+            due_at = record.expiration.timestamp() - self._renew_ahead_sec - random.uniform(0, spread)
+            # short lived subscriptions (e.g. chats) are renewed half way through their lifetime at the latest
+            due_at = max(due_at, record.expiration.timestamp() - record.minutes_to_expiration * 60 / 2)
+        self._records[record.id] = record
+        self._due_at[record.id] = due_at
+        heapq.heappush(self._due, (due_at, record.id))
+        self._changed.set()
+
+    def _unschedule(self, subscription_id: str):
+        self._records.pop(subscription_id, None)
+        self._due_at.pop(subscription_id, None)
+
+    async def load(self) -> int:
+        """Schedule the renewal of all the subscriptions in store, returns their number"""
+        records = await self._store.list()
+        for record in records:
+            self._schedule(record)
+        return len(records)
+
+    async def track(self, record: SubscriptionRecord):
+        """Save a subscription that was created elsewhere and keep it alive"""
+        await self._store.set(record)
+        self._schedule(record)
+
+    def _to_record(self, res: dict, record: SubscriptionRecord) -> SubscriptionRecord:
+        return SubscriptionRecord(res["id"], record.resource, record.change_type, record.notification_url,
+                                  record.minutes_to_expiration, parse_graph_datetime(res["expirationDateTime"]),
+                                  record.user_id, record.client_state, record.life_cycle_url,
+                                  record.latest_supported_tls_version)
+
+    async def _create(self, record: SubscriptionRecord) -> SubscriptionRecord:
+        res, status = await self._client.create_subscription(
+            record.change_type, record.notification_url, record.resource, record.minutes_to_expiration,
+            client_state=record.client_state, latest_supported_tls_version=record.latest_supported_tls_version,
+            user_id=record.user_id, life_cycle_url=record.life_cycle_url, plain_certificate=self._plain_certificate,
+            **self._kwargs)
+        return self._to_record(res, record)
+
+    async def create(self, change_type: str, notification_url: str, resource: SubscriptionResources,
+                     minutes_to_expiration: int, user_id: str = None, client_state: str = None,
+                     life_cycle_url: str = None, latest_supported_tls_version: str = None) -> SubscriptionRecord:
+        """Create a subscription (see create_subscription of the client) and keep it alive"""
+        requested = SubscriptionRecord(None, resource, change_type, notification_url, minutes_to_expiration,
+                                       datetime.now(timezone.utc), user_id, client_state, life_cycle_url,
+                                       latest_supported_tls_version)
+        record = await self._create(requested)
+        await self.track(record)
+        return record
+
+    async def delete(self, subscription_id: str):
+        """Delete a subscription and stop renewing it"""
+        record = self._records.get(subscription_id) or await self._store.get(subscription_id)
+        self._unschedule(subscription_id)
+        if record:
+            try:
+                await self._client.delete_subscription(subscription_id, record.resource, **self._kwargs)
+            except NotFound:
+                pass
+        await self._store.delete(subscription_id)
+
+    async def provision(self, desired: typing.Iterable[SubscriptionSpec], notification_url: str,
+                        minutes_to_expiration: int, client_state: str = None, life_cycle_url: str = None,
+                        delete_orphans: bool = True, concurrency: int = 16) -> ProvisioningSummary:
+        """
+        Make the subscriptions of notification_url match 'desired' (e.g. Mailbox of every user of a tenant), so
+        running it again (e.g. after a crash) doesn't create duplicates.
+        The existing subscriptions are listed and compared with desired by (resource, change type): the missing ones
+        are created (up to 'concurrency' at a time), and unless delete_orphans is False, subscriptions of
+        notification_url that are not desired are deleted (in $batch calls). All the desired subscriptions are then
+        kept alive by the manager.
+        :return: ProvisioningSummary, whose 'failed' holds (spec or subscription id, exception) of the failed operations
+        """
+        summary = ProvisioningSummary()
+        specs = {}
+        for spec in desired:
+            specs.setdefault(spec.key, spec)
+        orphans = []
+        async for subscription in self._client.list_all_subscriptions(**self._kwargs):
+            if subscription.get("notificationUrl") != notification_url:
+                continue
+            key = subscription_key(subscription["resource"], subscription["changeType"])
+            spec = specs.pop(key, None)
+            if spec is None:
+                orphans.append(subscription["id"])
+                continue
+            summary.existing += 1
+            if subscription["id"] not in self._records:
+                await self.track(SubscriptionRecord(
+                    subscription["id"], spec.resource, spec.change_type, notification_url, minutes_to_expiration,
+                    parse_graph_datetime(subscription["expirationDateTime"]), spec.user_id, client_state,
+                    life_cycle_url))
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def create(spec: SubscriptionSpec):
+            async with semaphore:
+                try:
+                    record = await self.create(spec.change_type, notification_url, spec.resource,
+                                               minutes_to_expiration, spec.user_id, client_state, life_cycle_url)
+                    summary.created.append(record.id)
+                except Exception as e:
+                    self._log(logging.ERROR, f"exception while creating subscription {spec}: {str(e)}")
+                    summary.failed.append((spec, e))
+
+        await asyncio.gather(*[create(spec) for spec in specs.values()])
+        if delete_orphans:
+            await self._delete_subscriptions(orphans, summary)
+        self._log(logging.INFO, f"provisioned subscriptions of {notification_url}: {summary}")
+        return summary
+
+    async def _delete_subscriptions(self, subscription_ids: typing.List[str], summary: ProvisioningSummary):
+        for index in range(0, len(subscription_ids), MAX_BATCH_REQUESTS):
+            chunk = subscription_ids[index:index + MAX_BATCH_REQUESTS]
+            requests = [BatchRequest("DELETE", [(SUBSCRIPTIONS, subscription_id)]) for subscription_id in chunk]
+            try:
+                results = await self._client.batch(requests, retry_unsafe=True, **self._kwargs)
+            except Exception as e:
+                results = [e] * len(chunk)
+            for subscription_id, result in zip(chunk, results):
+                if isinstance(result, Exception) and not isinstance(result, NotFound):
+                    self._log(logging.ERROR, f"exception while deleting subscription {subscription_id}: {str(result)}")
+                    summary.failed.append((subscription_id, result))
+                    continue
+                self._unschedule(subscription_id)
+                await self._store.delete(subscription_id)
+                summary.deleted.append(subscription_id)
+
+    async def _recreate(self, record: SubscriptionRecord):
+        try:
+            new_record = await self._create(record)
+        except Exception as e:
+            self._log(logging.ERROR, f"exception while creating again subscription {record.id}: {str(e)}")
+            self._schedule(record, time.time() + self._retry_interval_sec)
+            return
+        self._log(logging.WARNING, f"subscription {record.id} was lost and created again as {new_record.id}")
+        self._unschedule(record.id)
+        await self._store.delete(record.id)
+        await self.track(new_record)
+
+    async def _renew_batch(self, records: typing.List[SubscriptionRecord], version: str):
+        expirations = [self._client._get_msgraph_time_format(record.minutes_to_expiration) for record in records]
+        requests = [BatchRequest("PATCH", [(SUBSCRIPTIONS, record.id)], version=version,
+                                 body={"expirationDateTime": expiration})
+                    for record, expiration in zip(records, expirations)]
+        try:
+            # the new expiration is absolute, so renewals are safe to retry
+            results = await self._client.batch(requests, retry_unsafe=True, **self._kwargs)
+        except Exception as e:
+            self._log(logging.ERROR, f"exception while renewing {len(records)} subscriptions: {str(e)}")
+            results = [e] * len(records)
+        for record, expiration, result in zip(records, expirations, results):
+            if isinstance(result, NotFound):
+                await self._recreate(record)
+            elif isinstance(result, Exception):
+                self._log(logging.WARNING, f"failed renewing subscription {record.id}: {str(result)}")
+                self._schedule(record, time.time() + self._retry_interval_sec)
+            else:
+                res, status = result
+                renewed = copy.copy(record)
+                renewed.expiration = parse_graph_datetime((res or {}).get("expirationDateTime") or expiration)
+                await self._store.set(renewed)
+                self._schedule(renewed)
+
+    def _pop_due(self, now: float) -> typing.List[SubscriptionRecord]:
+        due = []
+        while self._due and self._due[0][0] <= now:
+            due_at, subscription_id = heapq.heappop(self._due)
+            if self._due_at.get(subscription_id) == due_at:
+                del self._due_at[subscription_id]
+                due.append(self._records[subscription_id])
+        return due
+
+    def _next_due_at(self) -> typing.Optional[float]:
+        while self._due and self._due_at.get(self._due[0][1]) != self._due[0][0]:
+            heapq.heappop(self._due)
+        return self._due[0][0] if self._due else None
+
+    async def renew_due(self) -> int:
+        """Renew the subscriptions that are due now, returns their number"""
+        due = self._pop_due(time.time())
+        semaphore = asyncio.Semaphore(self._concurrency)
+
+        async def renew(records, version):
+            async with semaphore:
+                try:
+                    await self._renew_batch(records, version)
+                except Exception:
+                    # the renewals that were not scheduled again (e.g. the store failed) are retried later
+                    for record in records:
+                        if record.id in self._records and record.id not in self._due_at:
+                            self._schedule(record, time.time() + self._retry_interval_sec)
+                    raise
+
+        batches = []
+        for version in (V1_EP, BETA_EP):
+            records = [record for record in due if (version == BETA_EP) == bool(record.resource.resource_data_included)]
+            batches += [renew(records[index:index + MAX_BATCH_REQUESTS], version)
+                        for index in range(0, len(records), MAX_BATCH_REQUESTS)]
+        await asyncio.gather(*batches)
+        return len(due)
+
+    async def run(self):
+        """
+        Renew subscriptions as they come due, until cancelled.
+        An unexpected failure (e.g. of the store) is logged and the loop goes on after retry_interval_sec
+        """
+        while True:
+            self._changed.clear()
+            try:
+                await self.renew_due()
+            except Exception as e:
+                self._log(logging.ERROR, f"exception while renewing subscriptions: {str(e)}")
+                await asyncio.sleep(self._retry_interval_sec)
+                continue
+            next_due_at = self._next_due_at()
+            timeout = None if next_due_at is None else max(0.0, next_due_at - time.time())
+            # asyncio.wait rather than wait_for, which may swallow a cancellation that comes along with a change
+            changed = asyncio.ensure_future(self._changed.wait())
+            try:
+                await asyncio.wait([changed], timeout=timeout)
+            finally:
+                changed.cancel()
+
+    def start(self):
+        if not self._task:
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
@@ -1,16 +1,29 @@
+import io
 import os
 import json
 import asynctest
+import aiohttp
 import asyncio
+import re
+import tempfile
 import requests
 import urllib
 import urllib.parse
-from aioresponses import aioresponses
-from datetime import datetime, timedelta
-from msgraph_async.client.client import GraphAdminClient
+from aioresponses import aioresponses, CallbackResult
+from yarl import URL
+from datetime import datetime, timedelta, timezone
+from msgraph_async.client.client import GraphAdminClient, MAX_ERROR_BODY_SIZE, DEFAULT_RESUME_POLICY
 from msgraph_async.common.constants import *
 from msgraph_async.common.exceptions import *
 from msgraph_async.common.odata_query import *
+from msgraph_async.common.batch import *
+from msgraph_async.common.retry import *
+from msgraph_async.common.rate_limiter import *
+from msgraph_async.common.delta_state import *
+from msgraph_async.common.quick_xor_hash import quick_xor_hash
+from msgraph_async.common.subscription_store import *
+from msgraph_async.client.subscription_manager import SubscriptionManager, SubscriptionSpec
+from msgraph_async.client.streaming import DownloadStream
 
 
 class TestClient(asynctest.TestCase):
@@ -852,3 +865,811 @@ class TestClient(asynctest.TestCase):
                                                     odata_query=odata_query)
         self.assertEqual(status, HTTPStatus.OK)
         self.assertEqual(len(res['value']), 1)
+
+    @aioresponses()
+    async def test_batch_mocked_graph_url(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        i = self.get_instance(mocked_graph_url=mocked_base_url)
+
+        url = f"{mocked_base_url}/v1.0/$batch"
+        res_dict = {"responses": [
+            {"id": "2", "status": 404, "headers": {"Content-Type": "application/json"}, "body": {"error": "bla"}},
+            {"id": "1", "status": 200, "headers": {"Content-Type": "application/json"}, "body": {"id": "uid1"}},
+        ]}
+        mocked_res.post(url, status=200, payload=res_dict)
+
+        odata_query = ODataQuery()
+        odata_query.select = ["id", "displayName"]
+        requests = [
+            BatchRequest("GET", [(USERS, "uid1")], odata_query=odata_query),
+            BatchRequest("GET", [(USERS, "uid2")], depends_on=["1"]),
+        ]
+        results = await i.batch(requests, token=TestClient._token)
+
+        self.assertEqual(results[0], ({"id": "uid1"}, 200))
+        self.assertIsInstance(results[1], NotFound)
+        self.assertEqual(results[1].request_url, f"{mocked_base_url}/v1.0/users/uid2")
+
+        sent = json.loads(mocked_res.requests[("POST", URL(url))][0].kwargs["data"])
+        self.assertEqual(sent["requests"][0]["url"], "/users/uid1?$select=id,displayName")
+        self.assertEqual(sent["requests"][1]["dependsOn"], ["1"])
+
+    async def test_batch_bad_requests(self):
+        i = self.get_instance()
+
+        with self.assertRaises(GraphClientException):
+            await i.batch([BatchRequest("GET", [(USERS, str(n))]) for n in range(MAX_BATCH_REQUESTS + 1)],
+                          token=TestClient._token)
+
+        with self.assertRaises(GraphClientException):
+            await i.batch([BatchRequest("GET", [(USERS, "uid")], depends_on=["2"]),
+                           BatchRequest("GET", [(USERS, "uid2")])], token=TestClient._token)
+
+        with self.assertRaises(GraphClientException):
+            await i.batch([BatchRequest("GET", [(USERS, "uid")]),
+                           BatchRequest("GET", [(USERS, "uid2")], version=BETA_EP)], token=TestClient._token)
+
+    @aioresponses()
+    async def test_auto_batch_coalesces_concurrent_gets(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        i = GraphAdminClient(mocked_graph_url=mocked_base_url, auto_batch=True, auto_batch_max_size=3)
+
+        url = f"{mocked_base_url}/v1.0/$batch"
+        res_dict = {"responses": [
+            {"id": "1", "status": 200, "headers": {"Content-Type": "application/json"}, "body": {"id": "uid1"}},
+            {"id": "2", "status": 429, "headers": {"Retry-After": "3"}, "body": {"error": "bla"}},
+            {"id": "3", "status": 200, "headers": {"Content-Type": "application/json"}, "body": {"id": "gid"}},
+        ]}
+        mocked_res.post(url, status=200, payload=res_dict)
+        mocked_res.get(f"{mocked_base_url}/v1.0/sites/sid", status=200, payload={"id": "sid"})
+
+        results = await asyncio.gather(
+            i.get_user("uid1", token=TestClient._token),
+            i.get_user("uid2", token=TestClient._token),
+            i.get_group("gid", token=TestClient._token),
+            return_exceptions=True)
+
+        self.assertEqual(results[0], ({"id": "uid1"}, 200))
+        self.assertIsInstance(results[1], TooManyRequests)
+        self.assertEqual(results[1].response_headers["Retry-After"], "3")
+        self.assertEqual(results[2], ({"id": "gid"}, 200))
+        self.assertEqual(len(mocked_res.requests[("POST", URL(url))]), 1)
+
+        # a request that is alone in its window is sent directly
+        res, status = await i.get_site("sid", token=TestClient._token)
+        self.assertEqual(res, {"id": "sid"})
+
+    @aioresponses()
+    async def test_shared_connector_and_context_manager(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        mocked_res.get(f"{mocked_base_url}/v1.0/sites/sid1", status=200, payload={"id": "sid1"})
+        mocked_res.get(f"{mocked_base_url}/v1.0/sites/sid2", status=200, payload={"id": "sid2"})
+        connector = GraphAdminClient.create_connector(connection_limit_per_host=10)
+
+        async with GraphAdminClient(mocked_graph_url=mocked_base_url, connector=connector) as i1, \
+                GraphAdminClient(mocked_graph_url=mocked_base_url, connector=connector) as i2:
+            await i1.get_site("sid1", token=TestClient._token)
+            await i2.get_site("sid2", token=TestClient._token)
+            self.assertIs(i1._session.connector, connector)
+            self.assertIs(i2._session.connector, connector)
+
+        self.assertIsNone(i1._session)
+        self.assertFalse(connector.closed)
+        await connector.close()
+
+    @aioresponses()
+    async def test_retry_policy_honors_retry_after(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        i = GraphAdminClient(mocked_graph_url=mocked_base_url, retry_policy=RetryPolicy(max_retries=2))
+
+        url = f"{mocked_base_url}/v1.0/sites/sid"
+        mocked_res.get(url, status=429, headers={"Retry-After": "0"}, payload={"error": "bla"})
+        mocked_res.get(url, status=200, payload={"id": "sid"})
+        res, status = await i.get_site("sid", token=TestClient._token)
+        self.assertEqual(res, {"id": "sid"})
+
+        # unsafe methods are not retried unless explicitly allowed
+        mail = {"from": "a@b.com", "to": ["c@d.com"], "body_content": "bla"}
+        url = f"{mocked_base_url}/v1.0/users/a@b.com/sendmail"
+        mocked_res.post(url, status=503, headers={"Retry-After": "0"}, payload={"error": "bla"})
+        with self.assertRaises(ServiceUnavailable):
+            await i.send_mail(dict(mail), token=TestClient._token)
+
+        mocked_res.post(url, status=503, headers={"Retry-After": "0"}, payload={"error": "bla"})
+        mocked_res.post(url, status=202, body=b"")
+        res, status = await i.send_mail(dict(mail), token=TestClient._token, retry_unsafe=True)
+        self.assertEqual(status, HTTPStatus.ACCEPTED)
+        await i.close()
+
+    @aioresponses()
+    async def test_rate_limiter_adapts_to_throttling(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        rate_limiter = AdaptiveRateLimiter(initial_concurrency=8)
+        i = GraphAdminClient(mocked_graph_url=mocked_base_url, rate_limiter=rate_limiter)
+
+        url = f"{mocked_base_url}/v1.0/sites/sid"
+        mocked_res.get(url, status=429, headers={"Retry-After": "0"}, payload={"error": "bla"})
+        with self.assertRaises(TooManyRequests):
+            await i.get_site("sid", token="opaque-token")
+        self.assertEqual(rate_limiter.get_limit((get_tenant_key("bearer opaque-token"),)), 4)
+        await i.close()
+
+    @aioresponses()
+    async def test_manage_tenant_tokens_mocked_graph_url(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        i = self.get_instance(mocked_graph_url=mocked_base_url)
+        i.manage_tenant_tokens("app_id", "app_secret")
+
+        mocked_res.post(f"{mocked_base_url}/tid1/oauth2/v2.0/token", status=200,
+                        payload={"access_token": "token1", "expires_in": 3599})
+        mocked_res.post(f"{mocked_base_url}/tid2/oauth2/v2.0/token", status=200,
+                        payload={"access_token": "token2", "expires_in": 3599})
+        url = f"{mocked_base_url}/v1.0/sites/sid"
+        mocked_res.get(url, status=200, payload={"id": "sid"}, repeat=True)
+
+        await asyncio.gather(i.get_site("sid", tenant_id="tid1"), i.get_site("sid", tenant_id="tid1"),
+                             i.get_site("sid", tenant_id="tid2"))
+
+        sent = mocked_res.requests[("GET", URL(url))]
+        self.assertEqual(sorted(call.kwargs["headers"]["authorization"] for call in sent),
+                         ["bearer token1", "bearer token1", "bearer token2"])
+        self.assertEqual(len(mocked_res.requests[("POST", URL(f"{mocked_base_url}/tid1/oauth2/v2.0/token"))]), 1)
+        await i.close()
+
+    @aioresponses()
+    async def test_stream_drive_item_content_mocked_graph_url(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        i = self.get_instance(mocked_graph_url=mocked_base_url)
+
+        url = f"{mocked_base_url}/v1.0/users/uid/drive/items/iid/content"
+        download_url = "http://my-mocked-download-host.com/file"
+        content = os.urandom(10000)
+        mocked_res.get(url, status=302, headers={"Location": download_url}, repeat=True)
+        mocked_res.get(download_url, status=200, body=content, repeat=True,
+                       headers={"ETag": "etag1", "Content-Length": str(len(content))})
+
+        stream = await i.stream_drive_item_content(USERS, "uid", "iid", chunk_size=1024, token=TestClient._token)
+        async with stream:
+            self.assertEqual(stream.etag, "etag1")
+            self.assertEqual(stream.content_length, len(content))
+            chunks = [chunk async for chunk in stream]
+        self.assertTrue(all(len(chunk) <= 1024 for chunk in chunks))
+        self.assertEqual(b"".join(chunks), content)
+
+        # the token is not sent to the download host
+        self.assertNotIn("authorization", mocked_res.requests[("GET", URL(download_url))][0].kwargs.get("headers") or {})
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "downloaded_drive_item")
+            written = await i.download_drive_item_content(USERS, "uid", "iid", file_path, token=TestClient._token)
+            self.assertEqual(written, len(content))
+            with open(file_path, "rb") as fp:
+                self.assertEqual(fp.read(), content)
+        await i.close()
+
+    async def test_download_stream_save_failure_keeps_file(self):
+        class FailingContent:
+            async def _chunks(self):
+                yield b"partial"
+                raise aiohttp.ClientPayloadError("connection lost")
+
+            def iter_chunked(self, chunk_size):
+                return self._chunks()
+
+        class Response:
+            content = FailingContent()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "downloaded")
+            with open(file_path, "wb") as fp:
+                fp.write(b"previous")
+            with self.assertRaises(aiohttp.ClientPayloadError):
+                await DownloadStream(Response()).save(file_path)
+            with open(file_path, "rb") as fp:
+                self.assertEqual(fp.read(), b"previous")
+            self.assertEqual(os.listdir(temp_dir), ["downloaded"])
+
+    @aioresponses()
+    async def test_download_drive_item_parallel_mocked_graph_url(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        i = self.get_instance(mocked_graph_url=mocked_base_url)
+
+        content = os.urandom(10000)
+        download_url = "http://my-mocked-download-host.com/file"
+        mocked_res.get(f"{mocked_base_url}/v1.0/drives/did/items/iid", status=200,
+                       payload={"id": "iid", "size": len(content), DOWNLOAD_URL_KEY: download_url})
+        failed_once = set()
+
+        def serve_range(url, **kwargs):
+            start, end = (int(val) for val in kwargs["headers"]["Range"][len("bytes="):].split("-"))
+            if start == 3000 and start not in failed_once:
+                failed_once.add(start)
+                return CallbackResult(status=500, body=b"error", content_type="text/plain")
+            return CallbackResult(status=206, body=content[start:end + 1])
+
+        mocked_res.get(download_url, callback=serve_range, repeat=True)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "downloaded_drive_item")
+            size = await i.download_drive_item_parallel("did", "iid", file_path, part_size=3000, concurrency=2,
+                                                        token=TestClient._token)
+            self.assertEqual(size, len(content))
+            with open(file_path, "rb") as fp:
+                self.assertEqual(fp.read(), content)
+            self.assertEqual(os.listdir(temp_dir), ["downloaded_drive_item"])
+            self.assertEqual(len(mocked_res.requests[("GET", URL(download_url))]), 5)
+
+            # a failed download leaves the previous file as it was
+            failed_once.clear()
+            mocked_res.get(f"{mocked_base_url}/v1.0/drives/did/items/iid", status=200,
+                           payload={"id": "iid", "size": len(content), DOWNLOAD_URL_KEY: download_url})
+            with open(file_path, "wb") as fp:
+                fp.write(b"previous")
+            with self.assertRaises(InternalServerError):
+                await i.download_drive_item_parallel("did", "iid", file_path, part_size=3000, max_part_retries=0,
+                                                     token=TestClient._token)
+            with open(file_path, "rb") as fp:
+                self.assertEqual(fp.read(), b"previous")
+            self.assertEqual(os.listdir(temp_dir), ["downloaded_drive_item"])
+
+        # a full body answering a ranged request is not read into memory for the error
+        full_url = "http://my-mocked-download-host.com/full"
+        mocked_res.get(full_url, status=200, body=content * 10, content_type="application/octet-stream")
+        with self.assertRaises(UnknownError) as cm:
+            await i._open_stream(full_url, {"Range": "bytes=0-999"}, (HTTPStatus.PARTIAL_CONTENT,))
+        self.assertLessEqual(len(cm.exception.response_content), MAX_ERROR_BODY_SIZE)
+        await i.close()
+
+    @aioresponses()
+    async def test_upload_drive_item_resumes_mocked_graph_url(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        i = self.get_instance(mocked_graph_url=mocked_base_url)
+
+        chunk_size = 320 * 1024
+        content = os.urandom(2 * chunk_size + 1000)
+        upload_url = "http://my-mocked-upload-host.com/session"
+        mocked_res.post(f"{mocked_base_url}/v1.0/users/uid/drive/items/root:/big%20file.bin:/createUploadSession",
+                        status=200, payload={"uploadUrl": upload_url, "nextExpectedRanges": ["0-"]}, repeat=True)
+        received = bytearray()
+        failures = []
+        lost_last_fragments = []
+
+        def upload_fragment(url, **kwargs):
+            start, end = (int(val) for val in kwargs["headers"]["Content-Range"].split(" ")[1].split("/")[0].split("-"))
+            if start == chunk_size and not failures:
+                failures.append(start)
+                return CallbackResult(status=500, body=b"error", content_type="text/plain")
+            if end + 1 == len(content) and lost_last_fragments == [None]:
+                # accepted, but not stored by the session
+                lost_last_fragments[0] = start
+                return CallbackResult(status=202, payload={})
+            self.assertEqual(start, len(received))
+            received.extend(kwargs["data"])
+            if len(received) == len(content):
+                return CallbackResult(status=201, payload={"id": "iid", "size": len(received)})
+            return CallbackResult(status=202, payload={"nextExpectedRanges": [f"{len(received)}-"]})
+
+        def session_status(url, **kwargs):
+            return CallbackResult(status=200, payload={"nextExpectedRanges": [f"{len(received)}-"]})
+
+        mocked_res.put(upload_url, callback=upload_fragment, repeat=True)
+        mocked_res.get(upload_url, callback=session_status, repeat=True)
+
+        item = await i.upload_drive_item(USERS, "uid", "root", "big file.bin", content, chunk_size=chunk_size,
+                                         token=TestClient._token)
+        self.assertEqual(item["size"], len(content))
+        self.assertEqual(bytes(received), content)
+        self.assertEqual(failures, [chunk_size])
+
+        received.clear()
+        lost_last_fragments.append(None)
+        item = await i.upload_drive_item(USERS, "uid", "root", "big file.bin", content, chunk_size=chunk_size,
+                                         token=TestClient._token)
+        self.assertEqual(item["size"], len(content))
+        self.assertEqual(bytes(received), content)
+        self.assertEqual(lost_last_fragments, [2 * chunk_size])
+
+        async def async_source():
+            for index in range(0, len(content), 1000):
+                yield content[index:index + 1000]
+
+        received.clear()
+        item = await i.upload_drive_item(USERS, "uid", "root", "big file.bin", async_source(), size=len(content),
+                                         chunk_size=chunk_size, token=TestClient._token)
+        self.assertEqual(bytes(received), content)
+
+        # a file object is uploaded from its current position
+        received.clear()
+        fp = io.BytesIO(b"header" + content)
+        fp.seek(len(b"header"))
+        item = await i.upload_drive_item(USERS, "uid", "root", "big file.bin", fp, chunk_size=chunk_size,
+                                         token=TestClient._token)
+        self.assertEqual(bytes(received), content)
+        await i.close()
+
+    async def test_upload_resume_delay_without_retry_policy(self):
+        i = self.get_instance()
+        throttled = TooManyRequests(429, "http://upload", None, {"Retry-After": "7"})
+        self.assertEqual(i._get_resume_delay(throttled, 0), 7)
+        failed = InternalServerError(500, "http://upload", None, {})
+        self.assertTrue(0 <= i._get_resume_delay(failed, 2) <= DEFAULT_RESUME_POLICY.backoff_base_sec * 4)
+        await i.close()
+
+    @aioresponses()
+    async def test_send_mail_with_large_attachment_mocked_graph_url(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        i = self.get_instance(mocked_graph_url=mocked_base_url)
+
+        content = os.urandom(2 * MAX_INLINE_ATTACHMENT_SIZE)
+        upload_url = "http://my-mocked-upload-host.com/attachment-session"
+        mocked_res.post(f"{mocked_base_url}/v1.0/users/a@b.com/messages", status=201, payload={"id": "mid"})
+        mocked_res.post(f"{mocked_base_url}/v1.0/users/a@b.com/messages/mid/attachments/createUploadSession",
+                        status=201, payload={"uploadUrl": upload_url})
+        mocked_res.post(f"{mocked_base_url}/v1.0/users/a@b.com/messages/mid/attachments", status=201,
+                        payload={"id": "small"})
+        mocked_res.post(f"{mocked_base_url}/v1.0/users/a@b.com/messages/mid/send", status=202, body=b"")
+        received = bytearray()
+
+        def upload_fragment(url, **kwargs):
+            received.extend(kwargs["data"])
+            if len(received) == len(content):
+                return CallbackResult(status=201, body=b"")
+            return CallbackResult(status=200, payload={"nextExpectedRanges": [f"{len(received)}-"]})
+
+        mocked_res.put(upload_url, callback=upload_fragment, repeat=True)
+
+        mail = {"from": "a@b.com", "to": ["c@d.com"], "body_content": "bla"}
+        attachments = [{"name": "big.bin", "contentType": "application/octet-stream", "content": content},
+                       {"name": "small.txt", "contentType": "text/plain", "contentBytes": "QSB0ZXN0IQ=="}]
+        res, status = await i.send_mail(mail, attachments=attachments, token=TestClient._token)
+
+        self.assertEqual(status, HTTPStatus.ACCEPTED)
+        self.assertEqual(bytes(received), content)
+        session_request = mocked_res.requests[
+            ("POST", URL(f"{mocked_base_url}/v1.0/users/a@b.com/messages/mid/attachments/createUploadSession"))][0]
+        self.assertEqual(json.loads(session_request.kwargs["data"])["AttachmentItem"]["size"], len(content))
+
+        # a sent draft can't skip sent items
+        requests_count = sum(len(calls) for calls in mocked_res.requests.values())
+        mail["save_to_sent_items"] = False
+        with self.assertRaises(GraphClientException):
+            await i.send_mail(mail, attachments=attachments, token=TestClient._token)
+        self.assertEqual(sum(len(calls) for calls in mocked_res.requests.values()), requests_count)
+        await i.close()
+
+    @aioresponses()
+    async def test_list_all_users_stream_items_mocked_graph_url(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        i = self.get_instance(mocked_graph_url=mocked_base_url)
+
+        next_url = f"{mocked_base_url}/v1.0/users?$skiptoken=abc"
+        first_page = {"value": [{"id": str(index)} for index in range(3)], NEXT_KEY: next_url}
+        last_page = {"@odata.context": "users", "value": [{"id": "3"}]}
+        mocked_res.get(f"{mocked_base_url}/v1.0/users", status=200, body=json.dumps(first_page),
+                       content_type="application/json")
+        mocked_res.get(next_url, status=200, body=json.dumps(last_page), content_type="application/json")
+
+        users = [user async for user in i.list_all_users(stream_items=True, token=TestClient._token)]
+        self.assertEqual(users, first_page["value"] + last_page["value"])
+
+        mocked_res.get(next_url, status=200, body=json.dumps(last_page), content_type="application/json")
+        page = {}
+        users = [user async for user in i.stream_page(next_url, page, token=TestClient._token)]
+        self.assertEqual(users, last_page["value"])
+        self.assertEqual(page, {"@odata.context": "users"})
+        await i.close()
+
+    @aioresponses()
+    async def test_json_codec_mocked_graph_url(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        i = GraphAdminClient(enable_logging=True, mocked_graph_url=mocked_base_url, json_codec="orjson")
+
+        move_url = f"{mocked_base_url}/v1.0/users/uid/messages/mid/move"
+        mocked_res.post(move_url, status=201, payload={"id": "moved", "subject": "שלום"})
+        res, status = await i.move_mail("uid", "mid", "fid", token=TestClient._token)
+
+        self.assertEqual(res, {"id": "moved", "subject": "שלום"})
+        sent = mocked_res.requests[("POST", URL(move_url))][0].kwargs["data"]
+        self.assertIsInstance(sent, bytes)
+        self.assertEqual(json.loads(sent), {"destinationId": "fid"})
+        await i.close()
+
+    @aioresponses()
+    async def test_list_all_user_mails_prefetch_mocked_graph_url(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        i = self.get_instance(mocked_graph_url=mocked_base_url)
+
+        url = f"{mocked_base_url}/v1.0/users/uid/messages"
+        events = []
+
+        def get_page(index):
+            def callback(request_url, **kwargs):
+                events.append(f"fetched {index}")
+                payload = {"value": [{"id": f"{index}-{item}"} for item in range(2)]}
+                if index < 2:
+                    payload[NEXT_KEY] = f"{url}?$skip={index + 1}"
+                return CallbackResult(status=200, payload=payload)
+            return callback
+
+        mocked_res.get(url, callback=get_page(0))
+        mocked_res.get(f"{url}?$skip=1", callback=get_page(1))
+        mocked_res.get(f"{url}?$skip=2", callback=get_page(2))
+
+        mails = []
+        async for mail in i.list_all_user_mails("uid", prefetch=1, token=TestClient._token):
+            mails.append(mail["id"])
+            events.append(f"consumed {mail['id']}")
+            await asyncio.sleep(0.01)
+
+        self.assertEqual(mails, ["0-0", "0-1", "1-0", "1-1", "2-0", "2-1"])
+        # the next page is fetched while the consumer is still processing the current one
+        self.assertLess(events.index("fetched 1"), events.index("consumed 0-1"))
+        self.assertLess(events.index("fetched 2"), events.index("consumed 1-1"))
+        await i.close()
+
+    @aioresponses()
+    async def test_list_drive_changes_paginator_mocked_graph_url(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        i = self.get_instance(mocked_graph_url=mocked_base_url)
+
+        delta_url = f"{mocked_base_url}/v1.0/users/uid/drive/root/delta?token=latest"
+        next_url = f"{mocked_base_url}/v1.0/users/uid/drive/root/delta?token=next"
+        new_delta_url = f"{mocked_base_url}/v1.0/users/uid/drive/root/delta?token=new"
+        mocked_res.get(delta_url, status=200, payload={"value": [{"id": "1"}, {"id": "2"}], NEXT_KEY: next_url},
+                       repeat=True)
+        mocked_res.get(next_url, status=200, payload={"value": [{"id": "3"}], DELTA_KEY: new_delta_url}, repeat=True)
+
+        changes = i.list_drive_changes(delta_url, max_pages=1, token=TestClient._token)
+        pages = [page async for page in changes.pages()]
+        self.assertEqual(pages, [[{"id": "1"}, {"id": "2"}]])
+        self.assertEqual(changes.cursor, next_url)
+        self.assertIsNone(changes.delta_link)
+
+        changes = i.list_drive_changes(delta_url, cursor=changes.cursor, token=TestClient._token)
+        self.assertEqual([item async for item in changes], [{"id": "3"}])
+        self.assertEqual(changes.delta_link, new_delta_url)
+        self.assertIsNone(changes.cursor)
+
+        self.assertEqual(await i.get_latest_delta_link(USERS, "uid", token=TestClient._token), new_delta_url)
+        await i.close()
+
+    @aioresponses()
+    async def test_list_all_users_partitioned_mocked_graph_url(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        i = self.get_instance(mocked_graph_url=mocked_base_url)
+        requested_filters = []
+
+        def list_partition(url, **kwargs):
+            if url.query.get("$count"):
+                self.assertEqual(kwargs["headers"][CONSISTENCY_LEVEL_HEADER], "eventual")
+                return CallbackResult(status=200, payload={COUNT_KEY: 4, "value": [{"id": "a1"}]})
+            requested_filters.append(url.query["$filter"])
+            prefix = url.query["$filter"][-3]
+            if url.query.get("$skiptoken"):
+                return CallbackResult(status=200, payload={"value": [{"id": f"{prefix}2"}]})
+            return CallbackResult(status=200, payload={"value": [{"id": f"{prefix}1"}],
+                                                       NEXT_KEY: f"{url}&$skiptoken=x"})
+
+        mocked_res.get(re.compile(rf"^{mocked_base_url}/v1.0/users\?.*$"), callback=list_partition, repeat=True)
+        users = [user["id"] async for user in i.list_all_users_partitioned(
+            prefixes=["a", "b"], concurrency=2, verify_count=True, token=TestClient._token)]
+
+        self.assertEqual(sorted(users), ["a1", "a2", "b1", "b2"])
+        self.assertIn("startswith(userPrincipalName, 'a')", requested_filters)
+        self.assertIn("startswith(userPrincipalName, 'b')", requested_filters)
+        self.assertEqual(await i.count_users(token=TestClient._token), 4)
+        await i.close()
+
+    @aioresponses()
+    async def test_list_all_user_mails_sharded_mocked_graph_url(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        i = self.get_instance(mocked_graph_url=mocked_base_url)
+
+        first = datetime(2021, 1, 1)
+        # a quiet month and a busy day
+        received = [first + timedelta(days=day) for day in range(30)] + \
+                   [first + timedelta(days=30, minutes=10 * index) for index in range(60)]
+        mailbox = [{"id": str(index), "receivedDateTime": value.strftime("%Y-%m-%dT%H:%M:%SZ")}
+                   for index, value in enumerate(received)]
+        counted = []
+
+        def list_mails(url, **kwargs):
+            mails = list(mailbox)
+            for constrain in (url.query.get("$filter") or "").split(" and "):
+                if constrain:
+                    attribute, operator, value = constrain.split(" ")
+                    if operator == "ge":
+                        mails = [mail for mail in mails if mail["receivedDateTime"] >= value]
+                    else:
+                        mails = [mail for mail in mails if mail["receivedDateTime"] < value]
+            if url.query.get("$orderby"):
+                mails.sort(key=lambda mail: mail["receivedDateTime"], reverse=url.query["$orderby"].endswith("desc"))
+            payload = {"value": mails[:int(url.query.get("$top", 1000))]}
+            if url.query.get("$count"):
+                counted.append(len(mails))
+                payload[COUNT_KEY] = len(mails)
+            return CallbackResult(status=200, payload=payload)
+
+        mocked_res.get(re.compile(rf"^{mocked_base_url}/v1.0/users/uid/messages(\?.*)?$"), callback=list_mails,
+                       repeat=True)
+
+        mails = [mail async for mail in i.list_all_user_mails_sharded(
+            "uid", max_window_items=20, min_window_sec=600, concurrency=3, token=TestClient._token)]
+        self.assertEqual(sorted(mails, key=lambda mail: int(mail["id"])), mailbox)
+        self.assertGreater(len(counted), 3)
+
+        mails = [mail async for mail in i.list_all_user_mails_sharded(
+            "uid", max_window_items=20, min_window_sec=600, concurrency=3, ordered=True, token=TestClient._token)]
+        self.assertEqual(mails, mailbox)
+
+        mails = [mail async for mail in i.list_all_user_mails_sharded(
+            "uid", start=first + timedelta(days=30), max_window_items=20, token=TestClient._token)]
+        self.assertEqual(len(mails), 60)
+
+        # a single open window is listed without an empty query in its url
+        mails = [mail async for mail in i.list_all_user_mails_sharded("uid", token=TestClient._token)]
+        self.assertEqual(sorted(mails, key=lambda mail: int(mail["id"])), mailbox)
+        mailbox.reverse()
+        mails = [mail async for mail in i.list_all_user_mails_sharded("uid", ordered=True, token=TestClient._token)]
+        mailbox.reverse()
+        self.assertEqual(mails, mailbox)
+        self.assertTrue(all("EMPTY" not in str(url) for method, url in mocked_res.requests))
+        await i.close()
+
+    @aioresponses()
+    async def test_sync_users_mocked_graph_url(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        i = self.get_instance(mocked_graph_url=mocked_base_url)
+        store = MemoryDeltaStateStore()
+
+        delta_url = f"{mocked_base_url}/v1.0/users/delta"
+        next_url = f"{delta_url}?$skiptoken=1"
+        new_delta_url = f"{delta_url}?$deltatoken=1"
+        mocked_res.get(delta_url, status=200, payload={"value": [{"id": "1"}], NEXT_KEY: next_url})
+        mocked_res.get(next_url, status=500, body="error", content_type="text/plain")
+        mocked_res.get(next_url, status=200, payload={"value": [{"id": "2"}], DELTA_KEY: new_delta_url})
+        mocked_res.get(new_delta_url, status=200, payload={
+            "value": [{"id": "2", "@removed": {"reason": "changed"}}], DELTA_KEY: f"{delta_url}?$deltatoken=2"})
+
+        users = []
+        sync = i.sync_users(store, token=TestClient._token)
+        with self.assertRaises(BaseHttpError):
+            async for user in sync:
+                users.append(user)
+        # the sync resumes from the page that failed
+        self.assertEqual(await store.get("users"), next_url)
+        sync = i.sync_users(store, token=TestClient._token)
+        async for user in sync:
+            users.append(user)
+        self.assertEqual(users, [{"id": "1"}, {"id": "2"}])
+        self.assertEqual(sync.delta_link, new_delta_url)
+        self.assertEqual(await store.get("users"), new_delta_url)
+
+        sync = i.sync_users(store, token=TestClient._token)
+        changes = [user async for user in sync]
+        self.assertFalse(sync.is_initial)
+        self.assertEqual(changes, [{"id": "2", "@removed": {"reason": "changed"}}])
+        self.assertEqual(await store.get("users"), f"{delta_url}?$deltatoken=2")
+        await i.close()
+
+    @aioresponses()
+    async def test_walk_drive_mocked_graph_url(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        i = self.get_instance(mocked_graph_url=mocked_base_url)
+        drive_url = f"{mocked_base_url}/v1.0/drives/d1"
+        tree = {"root": [{"id": "f1", "folder": {"childCount": 2}}, {"id": "a"}],
+                "f1": [{"id": "f2", "folder": {"childCount": 1}}, {"id": "b"}],
+                "f2": [{"id": "c"}]}
+        selects = []
+        forbidden = set()
+
+        def list_children(url, **kwargs):
+            selects.append(url.query.get("$select"))
+            folder = "root" if url.path.endswith("/root/children") else url.path.split("/")[-2]
+            if folder in forbidden:
+                return CallbackResult(status=403, payload={"error": {"code": "accessDenied"}})
+            children = tree[folder]
+            if url.query.get("$skiptoken"):
+                return CallbackResult(status=200, payload={"value": children[1:]})
+            next_link = str(url.update_query({"$skiptoken": "x"}))
+            return CallbackResult(status=200, payload={"value": children[:1], NEXT_KEY: next_link})
+
+        mocked_res.get(re.compile(rf"^{drive_url}/(root|items/\w+)/children(\?.*)?$"), callback=list_children,
+                       repeat=True)
+        q = ODataQuery()
+        q.select = ["name"]
+        items = [item["id"] async for item in i.walk_drive(DRIVES, "d1", concurrency=2, odata_query=q,
+                                                           token=TestClient._token)]
+
+        self.assertEqual(sorted(items), ["a", "b", "c", "f1", "f2"])
+        self.assertLess(items.index("f1"), items.index("b"))
+        self.assertEqual(set(selects), {"name,id,folder"})
+        selects.clear()
+        self.assertEqual(q.select, ["name"])
+
+        shallow = [item["id"] async for item in i.walk_drive(DRIVES, "d1", max_depth=1, token=TestClient._token)]
+        self.assertEqual(shallow, ["f1", "a"])
+        self.assertEqual(selects, [None, None])
+
+        forbidden.add("f2")
+        with self.assertRaises(Forbidden):
+            [item async for item in i.walk_drive(DRIVES, "d1", token=TestClient._token)]
+        errors = []
+        items = [item["id"] async for item in i.walk_drive(DRIVES, "d1", concurrency=2, token=TestClient._token,
+                                                           on_error=lambda folder_id, e: errors.append(folder_id))]
+        self.assertEqual(sorted(items), ["a", "b", "f1", "f2"])
+        self.assertEqual(errors, ["f2"])
+        await i.close()
+
+    @aioresponses()
+    async def test_download_drive_item_content_skip_if_unchanged_mocked_graph_url(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        i = self.get_instance(mocked_graph_url=mocked_base_url)
+
+        item_url = f"{mocked_base_url}/v1.0/users/uid/drive/items/iid"
+        content_url = f"{item_url}/content"
+        download_url = "http://my-mocked-download-host.com/file"
+        content = os.urandom(10000)
+        item = {"id": "iid", "size": len(content), "cTag": "ctag1",
+                "file": {"hashes": {"quickXorHash": quick_xor_hash(content)}}}
+        mocked_res.get(re.compile(rf"^{item_url}\?.*$"), payload=item, repeat=True)
+        mocked_res.get(content_url, status=302, headers={"Location": download_url}, repeat=True)
+        mocked_res.get(download_url, status=200, body=content, content_type="application/octet-stream", repeat=True)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "downloaded_unchanged_drive_item")
+            with open(file_path, "wb") as fp:
+                fp.write(content)
+            written = await i.download_drive_item_content(USERS, "uid", "iid", file_path, skip_if_unchanged=True,
+                                                          token=TestClient._token)
+            self.assertEqual(written, 0)
+            self.assertNotIn(("GET", URL(content_url)), mocked_res.requests)
+
+            with open(file_path, "wb") as fp:
+                fp.write(content[:-1] + b"x")
+            written = await i.download_drive_item_content(USERS, "uid", "iid", file_path, skip_if_unchanged=True,
+                                                          token=TestClient._token)
+            self.assertEqual(written, len(content))
+            with open(file_path, "rb") as fp:
+                self.assertEqual(fp.read(), content)
+
+        res, status = await i.get_drive_item_content(USERS, "uid", "iid", local_ctag="ctag1", token=TestClient._token)
+        self.assertEqual((res, status), (None, HTTPStatus.NOT_MODIFIED))
+        res, status = await i.get_drive_item_content(USERS, "uid", "iid", local_ctag="ctag0", token=TestClient._token)
+        self.assertEqual((res, status), (content, HTTPStatus.OK))
+        await i.close()
+
+    @aioresponses()
+    async def test_subscription_manager_renew_due_mocked_graph_url(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        i = self.get_instance(mocked_graph_url=mocked_base_url)
+        renewed_until = "2030-01-01T00:00:00.0000000Z"
+        batch_sizes = []
+
+        def renew(url, **kwargs):
+            requests = json.loads(kwargs["data"])["requests"]
+            batch_sizes.append(len(requests))
+            responses = []
+            for request in requests:
+                self.assertEqual(request["method"], "PATCH")
+                if request["url"] == "/subscriptions/lost":
+                    responses.append({"id": request["id"], "status": 404, "body": {"error": "not found"},
+                                      "headers": {"Content-Type": "application/json"}})
+                else:
+                    body = {"id": request["url"].split("/")[-1], "expirationDateTime": renewed_until}
+                    responses.append({"id": request["id"], "status": 200, "body": body,
+                                      "headers": {"Content-Type": "application/json"}})
+            return CallbackResult(status=200, payload={"responses": responses})
+
+        mocked_res.post(f"{mocked_base_url}/v1.0/$batch", callback=renew, repeat=True)
+        mocked_res.post(f"{mocked_base_url}/v1.0/subscriptions", status=201,
+                        payload={"id": "recreated", "expirationDateTime": renewed_until})
+
+        store = MemorySubscriptionStore()
+        soon = datetime.utcnow() + timedelta(minutes=10)
+        later = datetime.utcnow() + timedelta(days=2)
+        for subscription_id in [f"s{index}" for index in range(21)] + ["lost"]:
+            await store.set(SubscriptionRecord(subscription_id, SubscriptionResources.Mailbox, "created",
+                                               "https://hook/notify", 4230, soon, user_id="uid"))
+        await store.set(SubscriptionRecord("not-due", SubscriptionResources.Mailbox, "created", "https://hook/notify",
+                                           4230, later, user_id="uid"))
+
+        manager = SubscriptionManager(i, store, renew_ahead_sec=3600, spread_sec=60, token=TestClient._token)
+        self.assertEqual(await manager.load(), 23)
+        self.assertEqual(await manager.renew_due(), 22)
+        self.assertEqual(sorted(batch_sizes), [2, 20])
+
+        records = {record.id: record for record in await store.list()}
+        self.assertNotIn("lost", records)
+        self.assertEqual(records["recreated"].user_id, "uid")
+        self.assertEqual(records["s0"].expiration.year, 2030)
+        self.assertEqual(records["not-due"].expiration, later.replace(tzinfo=timezone.utc))
+        self.assertEqual(await manager.renew_due(), 0)
+        await i.close()
+
+    @aioresponses()
+    async def test_subscription_manager_run_survives_store_failure_mocked_graph_url(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        i = self.get_instance(mocked_graph_url=mocked_base_url)
+        renewed_until = "2030-01-01T00:00:00.0000000Z"
+
+        def renew(url, **kwargs):
+            requests = json.loads(kwargs["data"])["requests"]
+            responses = [{"id": request["id"], "status": 200,
+                          "body": {"id": request["url"].split("/")[-1], "expirationDateTime": renewed_until},
+                          "headers": {"Content-Type": "application/json"}} for request in requests]
+            return CallbackResult(status=200, payload={"responses": responses})
+
+        mocked_res.post(f"{mocked_base_url}/v1.0/$batch", callback=renew, repeat=True)
+
+        class FlakyStore(MemorySubscriptionStore):
+            failures = 1
+
+            async def set(self, record):
+                if self.failures and record.expiration.year == 2030:
+                    self.failures -= 1
+                    raise OSError("store is unavailable")
+                await super().set(record)
+
+        store = FlakyStore()
+        soon = datetime.utcnow() + timedelta(minutes=10)
+        await store.set(SubscriptionRecord("s0", SubscriptionResources.Mailbox, "created", "https://hook/notify", 4230,
+                                           soon, user_id="uid"))
+        manager = SubscriptionManager(i, store, renew_ahead_sec=3600, spread_sec=60, retry_interval_sec=0.05,
+                                      token=TestClient._token)
+        await manager.load()
+        async with manager:
+            for _ in range(100):
+                if (await store.get("s0")).expiration.year == 2030:
+                    break
+                await asyncio.sleep(0.02)
+            self.assertFalse(manager._task.done())
+        self.assertEqual(store.failures, 0)
+        self.assertEqual((await store.get("s0")).expiration.year, 2030)
+        await i.close()
+
+    @aioresponses()
+    async def test_subscription_manager_provision_mocked_graph_url(self, mocked_res):
+        mocked_base_url = "http://my-mocked-msgraph-service.com"
+        i = self.get_instance(mocked_graph_url=mocked_base_url)
+        hook = "https://hook/notify"
+        expiration = "2030-01-01T00:00:00.0000000Z"
+        existing = [
+            {"id": "kept", "resource": "Users/u1/Messages", "changeType": "created", "notificationUrl": hook,
+             "expirationDateTime": expiration},
+            {"id": "orphan", "resource": "users('gone')/messages", "changeType": "created", "notificationUrl": hook,
+             "expirationDateTime": expiration},
+            {"id": "foreign", "resource": "users('u9')/messages", "changeType": "created",
+             "notificationUrl": "https://other/notify", "expirationDateTime": expiration},
+        ]
+        mocked_res.get(f"{mocked_base_url}/v1.0/subscriptions", payload={"value": existing}, repeat=True)
+        created = []
+
+        def create(url, **kwargs):
+            body = json.loads(kwargs["data"])
+            created.append(body["resource"])
+            if "u3" in body["resource"]:
+                return CallbackResult(status=400, payload={"error": "invalid user"})
+            return CallbackResult(status=201, payload={"id": f"new-{len(created)}", "expirationDateTime": expiration})
+
+        def delete(url, **kwargs):
+            requests = json.loads(kwargs["data"])["requests"]
+            self.assertEqual([(r["method"], r["url"]) for r in requests], [("DELETE", "/subscriptions/orphan")])
+            return CallbackResult(status=200, payload={"responses": [{"id": "1", "status": 204}]})
+
+        mocked_res.post(f"{mocked_base_url}/v1.0/subscriptions", callback=create, repeat=True)
+        mocked_res.post(f"{mocked_base_url}/v1.0/$batch", callback=delete)
+
+        store = MemorySubscriptionStore()
+        manager = SubscriptionManager(i, store, token=TestClient._token)
+        desired = [SubscriptionSpec(SubscriptionResources.Mailbox, user_id) for user_id in ("u1", "u2", "u3", "u2")]
+        summary = await manager.provision(desired, hook, 4230, client_state="secret")
+
+        self.assertEqual(summary.existing, 1)
+        self.assertEqual(sorted(created), ["users('u2')/messages", "users('u3')/messages"])
+        self.assertEqual(len(summary.created), 1)
+        self.assertEqual(summary.deleted, ["orphan"])
+        self.assertEqual(len(summary.failed), 1)
+        self.assertEqual(summary.failed[0][0].user_id, "u3")
+        self.assertEqual(sorted(record.id for record in await store.list()), sorted(["kept"] + summary.created))
+        await i.close()
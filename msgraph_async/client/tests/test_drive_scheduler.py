@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import unittest
+from msgraph_async.common.constants import NEXT_KEY, DELTA_KEY, USERS, SITES
+from msgraph_async.common.exceptions import GraphClientException, Gone
+from msgraph_async.common.delta_state import MemoryDeltaStateStore
+from msgraph_async.client.paginator import Paginator, Page
+from msgraph_async.client.drive_scheduler import DriveDeltaScheduler
+
+
+class FakeClient:
+    """Serves the changes of each drive from a list of pages, the delta link of a drive is '{root}/delta?{index}'"""
+
+    def __init__(self):
+        self.changes = {}
+        self.requested = []
+        self.gone = set()
+
+    def _log(self, level, msg):
+        logging.log(level, msg)
+
+    def _get_drive_root_url(self, resource, id):
+        return f"{resource}/{id}"
+
+    async def get_latest_delta_link(self, resource, id, **kwargs):
+        return f"{resource}/{id}/delta?{len(self.changes.get(f'{resource}/{id}', []))}"
+
+    def list_drive_changes(self, state_link, **kwargs):
+        async def get_page(url):
+            self.requested.append(url)
+            root, _, index = url.partition("/delta")
+            if root in self.gone:
+                self.gone.discard(root)
+                raise Gone(410, url, {"error": {"code": "resyncRequired"}}, {})
+            index = int(index.lstrip("?") or 0)
+            pages = self.changes.get(root, [])
+            items = pages[index] if index < len(pages) else []
+            metadata = {NEXT_KEY: f"{root}/delta?{index + 1}"} if index + 1 < len(pages) \
+                else {DELTA_KEY: f"{root}/delta?{min(index + 1, len(pages))}"}
+            return Page(items, url, metadata)
+        return Paginator(state_link, get_page, require_delta_link=True)
+
+
+class TestDriveDeltaScheduler(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.client = FakeClient()
+        self.store = MemoryDeltaStateStore()
+
+    async def take(self, scheduler, count):
+        changes = []
+        async for change in scheduler.changes():
+            changes.append(change)
+            if len(changes) == count:
+                break
+        return changes
+
+    async def test_full_initial_sync_and_links(self):
+        self.client.changes = {"/users/1": [["a", "b"], ["c"]], "/sites/2": [["d"]]}
+        async with DriveDeltaScheduler(self.client, self.store, concurrency=2, poll_interval_sec=60,
+                                       initial_sync="full") as scheduler:
+            user_key = scheduler.add_drive(USERS, "1")
+            site_key = scheduler.add_drive(SITES, "2")
+            stream = scheduler.changes()
+            changes = [await asyncio.wait_for(stream.__anext__(), 1) for _ in range(4)]
+            # the last page is acknowledged once the consumer asks for the next change
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(stream.__anext__(), 0.05)
+            await stream.aclose()
+        self.assertEqual(sorted(changes), [(site_key, "d"), (user_key, "a"), (user_key, "b"), (user_key, "c")])
+        self.assertEqual([item for key, item in changes if key == user_key], ["a", "b", "c"])
+        self.assertEqual(await self.store.get(user_key), "/users/1/delta?2")
+        self.assertEqual(await self.store.get(site_key), "/sites/2/delta?1")
+
+    async def test_latest_initial_sync_then_changes(self):
+        self.client.changes = {"/users/1": [["old"]]}
+        async with DriveDeltaScheduler(self.client, self.store, poll_interval_sec=0.01) as scheduler:
+            key = scheduler.add_drive(USERS, "1")
+            while not await self.store.get(key):
+                await asyncio.sleep(0.01)
+            self.client.changes["/users/1"].append(["new"])
+            changes = await asyncio.wait_for(self.take(scheduler, 1), 1)
+        self.assertEqual(changes, [(key, "new")])
+
+    async def test_saved_link_is_resumed_per_tenant(self):
+        self.client.changes = {"/users/1": [["a"], ["b"], ["c"]]}
+        await self.store.set("tenant:users/1", "/users/1/delta?2")
+        async with DriveDeltaScheduler(self.client, self.store, tenant_id="tenant") as scheduler:
+            key = scheduler.add_drive(USERS, "1")
+            changes = await asyncio.wait_for(self.take(scheduler, 1), 1)
+        self.assertEqual(changes, [(key, "c")])
+        self.assertEqual(self.client.requested, ["/users/1/delta?2"])
+
+    async def test_partly_consumed_page_is_not_acknowledged(self):
+        self.client.changes = {"/users/1": [["a", "b", "c"]]}
+        await self.store.set("users/1", "/users/1/delta?0")
+        async with DriveDeltaScheduler(self.client, self.store, poll_interval_sec=0.01) as scheduler:
+            key = scheduler.add_drive(USERS, "1")
+            changes = await asyncio.wait_for(self.take(scheduler, 1), 1)
+            await asyncio.sleep(0.01)
+            self.assertEqual(await self.store.get(key), "/users/1/delta?0")
+            # the page is delivered again, whole
+            changes += await asyncio.wait_for(self.take(scheduler, 3), 1)
+        self.assertEqual(changes, [(key, "a"), (key, "a"), (key, "b"), (key, "c")])
+
+    async def test_notified_drive_is_polled_first(self):
+        self.client.changes = {"/users/1": [], "/users/2": []}
+        scheduler = DriveDeltaScheduler(self.client, self.store, concurrency=1, poll_interval_sec=3600,
+                                        initial_sync="full")
+        first, second = scheduler.add_drive(USERS, "1"), scheduler.add_drive(USERS, "2")
+        scheduler.notify(second)
+        async with scheduler:
+            while len(self.client.requested) < 2:
+                await asyncio.sleep(0.01)
+        self.assertEqual(self.client.requested, ["/users/2/delta", "/users/1/delta"])
+
+    async def test_idle_drive_is_backed_off(self):
+        self.client.changes = {"/users/1": []}
+        async with DriveDeltaScheduler(self.client, self.store, poll_interval_sec=0.01, max_idle_interval_sec=0.04,
+                                       initial_sync="full") as scheduler:
+            scheduler.add_drive(USERS, "1")
+            await asyncio.sleep(0.3)
+        # 0, 0.01, 0.03, 0.07 and every 0.04 from then on
+        self.assertLess(len(self.client.requested), 12)
+        self.assertGreater(len(self.client.requested), 3)
+
+    async def test_gone_link_is_reset(self):
+        self.client.changes = {"/users/1": [["a"]]}
+        await self.store.set("users/1", "/users/1/delta?5")
+        self.client.gone.add("/users/1")
+        async with DriveDeltaScheduler(self.client, self.store, poll_interval_sec=0.01,
+                                       initial_sync="full") as scheduler:
+            key = scheduler.add_drive(USERS, "1")
+            changes = await asyncio.wait_for(self.take(scheduler, 1), 1)
+        self.assertEqual(changes, [(key, "a")])
+        self.assertEqual(self.client.requested[:2], ["/users/1/delta?5", "/users/1/delta"])
+
+    async def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            DriveDeltaScheduler(self.client, self.store, concurrency=0)
+        with self.assertRaises(ValueError):
+            DriveDeltaScheduler(self.client, self.store, poll_interval_sec=10, max_idle_interval_sec=5)
+        with self.assertRaises(ValueError):
+            DriveDeltaScheduler(self.client, self.store, initial_sync="none")
+        with self.assertRaises(GraphClientException):
+            DriveDeltaScheduler(self.client, self.store).add_drive("/me", "1")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from msgraph_async.common.constants import NEXT_KEY, DELTA_KEY
+from msgraph_async.common.exceptions import GraphClientException
+from msgraph_async.common.delta_state import MemoryDeltaStateStore, SqliteDeltaStateStore
+from msgraph_async.client.paginator import Paginator, Page, merge_pages
+from msgraph_async.client.delta import DeltaSync
+
+
+class TestPaginator(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.requested = []
+
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    def get_instance(self, cursor="0", pages_count=3, page_size=2, delta_link="delta", fail_at=None, **kwargs):
+        async def get_page(url):
+            self.requested.append(url)
+            index = int(url)
+            if index == fail_at:
+                raise GraphClientException(f"page {index} failed")
+            metadata = {NEXT_KEY: str(index + 1)} if index + 1 < pages_count else {DELTA_KEY: delta_link}
+            return Page([f"{index}-{item}" for item in range(page_size)], url, metadata)
+
+        async def stream_page(url, metadata):
+            page = await get_page(url)
+            for item in page:
+                yield item
+            metadata.update(page.metadata)
+
+        return Paginator(cursor, get_page, stream_page, **kwargs)
+
+    async def test_items(self):
+        for kwargs in ({}, {"prefetch": 1}, {"stream_items": True}):
+            i = self.get_instance(**kwargs)
+            items = [item async for item in i]
+            self.assertEqual(items, ["0-0", "0-1", "1-0", "1-1", "2-0", "2-1"])
+            self.assertEqual(i.delta_link, "delta")
+            self.assertIsNone(i.cursor)
+            self.assertEqual(i.pages_count, 3)
+
+    async def test_pages(self):
+        i = self.get_instance(prefetch=2)
+        pages = [page async for page in i.pages()]
+        self.assertEqual([page.url for page in pages], ["0", "1", "2"])
+        self.assertEqual(pages[0], ["0-0", "0-1"])
+        self.assertEqual(pages[0].next_link, "1")
+        self.assertEqual(pages[-1].delta_link, "delta")
+
+    async def test_max_items(self):
+        i = self.get_instance(max_items=3)
+        self.assertEqual([item async for item in i], ["0-0", "0-1", "1-0"])
+        # the second page was only partly consumed, so it will be read again
+        self.assertEqual(i.cursor, "1")
+
+        i = self.get_instance(max_items=3)
+        pages = [page async for page in i.pages()]
+        self.assertEqual(pages, [["0-0", "0-1"], ["1-0"]])
+        self.assertEqual(i.cursor, "1")
+
+        i = self.get_instance(max_items=4)
+        self.assertEqual(len([item async for item in i]), 4)
+        self.assertEqual(i.cursor, "2")
+        self.assertEqual(self.requested[-1], "1")
+
+    async def test_max_pages(self):
+        i = self.get_instance(max_pages=2, prefetch=5)
+        self.assertEqual(len([page async for page in i.pages()]), 2)
+        await asyncio.sleep(0)
+        self.assertEqual(i.cursor, "2")
+        self.assertNotIn("2", self.requested)
+
+    async def test_resume_from_cursor(self):
+        i = self.get_instance(fail_at=1)
+        items = []
+        with self.assertRaises(GraphClientException):
+            async for item in i:
+                items.append(item)
+        self.assertEqual(i.cursor, "1")
+
+        i = self.get_instance(cursor=i.cursor)
+        async for item in i:
+            items.append(item)
+        self.assertEqual(items, ["0-0", "0-1", "1-0", "1-1", "2-0", "2-1"])
+
+    async def test_prefetch_error(self):
+        i = self.get_instance(prefetch=2, fail_at=2)
+        items = []
+        with self.assertRaises(GraphClientException):
+            async for item in i:
+                items.append(item)
+        self.assertEqual(items, ["0-0", "0-1", "1-0", "1-1"])
+        self.assertEqual(i.cursor, "2")
+
+    async def test_missing_delta_link(self):
+        i = self.get_instance(delta_link=None, require_delta_link=True)
+        with self.assertRaises(GraphClientException):
+            async for _ in i:
+                pass
+        i = self.get_instance(delta_link=None)
+        self.assertEqual(len([item async for item in i]), 6)
+
+    async def test_merge_pages(self):
+        paginators = [self.get_instance(), self.get_instance(cursor="1"), self.get_instance(cursor="2")]
+        pages = [page async for page in merge_pages(paginators, concurrency=2)]
+        self.assertEqual(sorted(page.url for page in pages), ["0", "1", "1", "2", "2", "2"])
+
+        paginators = [self.get_instance(), self.get_instance(cursor="1"), self.get_instance(cursor="2")]
+        pages = [page async for page in merge_pages(paginators, concurrency=2, ordered=True)]
+        self.assertEqual([page.url for page in pages], ["0", "1", "2", "1", "2", "2"])
+
+    async def test_merge_pages_error(self):
+        paginators = [self.get_instance(), self.get_instance(fail_at=1)]
+        with self.assertRaises(GraphClientException):
+            async for _ in merge_pages(paginators, ordered=True):
+                pass
+
+    def test_bad_limits(self):
+        self.assertRaises(ValueError, Paginator, "0", None, max_items=-1)
+        self.assertRaises(ValueError, Paginator, "0", None, max_pages=-1)
+        self.assertRaises(ValueError, Paginator, "0", None, prefetch=-1)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+    async def test_delta_sync_stopped_early_keeps_link(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for store in (MemoryDeltaStateStore(), SqliteDeltaStateStore(os.path.join(temp_dir, "state.db"))):
+                await store.set("users", "0")
+                sync = DeltaSync(lambda link: self.get_instance(link, max_pages=1), "0", store, "users")
+                items = [item async for item in sync]
+                self.assertEqual(items, ["0-0", "0-1"])
+                self.assertIsNone(sync.delta_link)
+                self.assertEqual(await store.get("users"), "1")
+
+                sync = DeltaSync(lambda link: self.get_instance(link), "0", store, "users")
+                self.assertEqual(len([item async for item in sync]), 4)
+                self.assertEqual(await store.get("users"), "delta")
+                await store.close()
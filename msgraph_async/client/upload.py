@@ -0,0 +1,87 @@
+import os
+import asyncio
+from msgraph_async.common.exceptions import GraphClientException
+
+UPLOAD_CHUNK_MULTIPLE = 320 * 1024
+MAX_UPLOAD_CHUNK_SIZE = 60 * 1024 * 1024
+DEFAULT_UPLOAD_CHUNK_SIZE = 10 * UPLOAD_CHUNK_MULTIPLE
+
+
+def validate_chunk_size(chunk_size: int):
+    if chunk_size <= 0 or chunk_size % UPLOAD_CHUNK_MULTIPLE or chunk_size > MAX_UPLOAD_CHUNK_SIZE:
+        raise ValueError(f"chunk size must be a multiple of {UPLOAD_CHUNK_MULTIPLE} bytes "
+                         f"and at most {MAX_UPLOAD_CHUNK_SIZE} bytes")
+
+
+class ChunkSource:
+    """
+    Reads an upload source by offset, without holding all of it in memory.
+    The source can be a file path, a binary file object, bytes, or an async iterable of bytes.
+    Files and bytes can be read from any offset, async iterables are read forward and only the data that was not
+    released yet (see release_before) is kept, so an upload can resume from the last acknowledged offset.
+    """
+    def __init__(self, source, size: int = None):
+        self._path = None
+        self._fp = None
+        self._data = None
+        self._iterator = None
+        self._buffer = bytearray()
+        self._buffer_start = 0
+        self._start = 0
+
+        if isinstance(source, (str, os.PathLike)):
+            self._path = source
+            size = os.path.getsize(source) if size is None else size
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            self._data = memoryview(source)
+            size = len(source) if size is None else size
+        elif hasattr(source, "__aiter__"):
+            if size is None:
+                raise GraphClientException("size must be specified when uploading from an async source")
+            self._iterator = source.__aiter__()
+        elif hasattr(source, "read") and hasattr(source, "seek"):
+            # a file object is uploaded from its current position
+            self._fp = source
+            self._start = source.tell()
+            if size is None:
+                size = source.seek(0, os.SEEK_END) - self._start
+                source.seek(self._start)
+        else:
+            raise GraphClientException("upload source must be a path, bytes, a binary file or an async iterable")
+        self.size = size
+
+    async def open(self):
+        if self._path:
+            self._fp = await asyncio.get_event_loop().run_in_executor(None, open, self._path, "rb")
+
+    async def close(self):
+        if self._path and self._fp:
+            await asyncio.get_event_loop().run_in_executor(None, self._fp.close)
+            self._fp = None
+
+    def _read_file(self, offset: int, length: int) -> bytes:
+        self._fp.seek(self._start + offset)
+        return self._fp.read(length)
+
+    async def read(self, offset: int, length: int) -> bytes:
+        if self._data is not None:
+            return bytes(self._data[offset:offset + length])
+        if self._fp is not None:
+            return await asyncio.get_event_loop().run_in_executor(None, self._read_file, offset, length)
+
+        if offset < self._buffer_start:
+            raise GraphClientException(
+                f"can't read offset {offset} of an async source that was already released up to {self._buffer_start}")
+        while self._buffer_start + len(self._buffer) < offset + length:
+            try:
+                self._buffer += await self._iterator.__anext__()
+            except StopAsyncIteration:
+                break
+        start = offset - self._buffer_start
+        return bytes(self._buffer[start:start + length])
+
+    def release_before(self, offset: int):
+        """Data before offset was acknowledged and will not be read again"""
+        if self._iterator is not None and offset > self._buffer_start:
+            del self._buffer[:offset - self._buffer_start]
+            self._buffer_start = offset
@@ -1,3 +1,8 @@
 from .constants import *
 from .exceptions import *
 from .odata_query import *
+from .batch import *
+from .retry import *
+from .rate_limiter import *
+from .delta_state import *
+from .subscription_store import *
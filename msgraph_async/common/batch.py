@@ -0,0 +1,78 @@
+import typing
+from http import HTTPStatus
+from msgraph_async.common.constants import V1_EP, BETA_EP
+
+
+class BatchRequest:
+    """
+    A single sub-request of a JSON batch ($batch) call.
+    The url of the sub-request is built from 'resources' exactly like the client builds urls for its own calls,
+    so any ODataQuery can be passed as key-word argument (e.g. BatchRequest("GET", [(USERS, uid)], odata_query=q)).
+    'depends_on' holds the ids of sub-requests in the same batch that must complete before this one is executed.
+    """
+    def __init__(self, method: str, resources: typing.List[typing.Tuple], request_id: str = None,
+                 version: str = V1_EP, body: dict = None, headers: dict = None,
+                 depends_on: typing.List[str] = None, expected_statuses: typing.List[HTTPStatus] = None, **kwargs):
+        self.method = method
+        self.resources = resources
+        self.request_id = request_id
+        self.version = version
+        self.body = body
+        self.headers = headers
+        self.depends_on = depends_on
+        self.expected_statuses = expected_statuses
+        self.url_kwargs = kwargs
+
+    @property
+    def method(self) -> str:
+        return self._method
+
+    @method.setter
+    def method(self, value: str):
+        if type(value) is not str:
+            raise ValueError("method must be string")
+        self._method = value.upper()
+
+    @property
+    def resources(self) -> typing.List[typing.Tuple]:
+        return self._resources
+
+    @resources.setter
+    def resources(self, value: typing.List[typing.Tuple]):
+        if type(value) is not list:
+            raise ValueError("resources must be list of (resource, resource id) tuples")
+        self._resources = value
+
+    @property
+    def request_id(self) -> str:
+        return self._request_id
+
+    @request_id.setter
+    def request_id(self, value: str):
+        if value is not None and type(value) is not str:
+            raise ValueError("request id must be string")
+        self._request_id = value
+
+    @property
+    def version(self) -> str:
+        return self._version
+
+    @version.setter
+    def version(self, value: str):
+        if value not in (V1_EP, BETA_EP):
+            raise ValueError(f"version must be one of: {[V1_EP, BETA_EP]}")
+        self._version = value
+
+    @property
+    def depends_on(self) -> typing.List[str]:
+        return self._depends_on
+
+    @depends_on.setter
+    def depends_on(self, value: typing.List[str]):
+        if value is not None:
+            if type(value) is not list:
+                raise ValueError("depends on must be list of request ids")
+            for val in value:
+                if type(val) is not str:
+                    raise ValueError("all request ids must be strings")
+        self._depends_on = value
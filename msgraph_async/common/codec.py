@@ -0,0 +1,63 @@
+import json
+import typing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JsonCodec:
+    """
+    Serializes request bodies into bytes and parses response bodies from bytes, with the standard json module.
+    Subclass it to plug in another json library (see OrjsonCodec).
+    """
+    name = "json"
+
+    def dumps(self, obj) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+    def loads(self, data: bytes or str):
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """
+    JsonCodec backed by orjson (an optional dependency), which encodes and decodes several times faster than the
+    standard json module and works on bytes directly
+    """
+    name = "orjson"
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("orjson is not installed")
+
+    def dumps(self, obj) -> bytes:
+        return orjson.dumps(obj)
+
+    def loads(self, data: bytes or str):
+        return orjson.loads(data)
+
+
+CODECS = {
+    JsonCodec.name: JsonCodec,
+    OrjsonCodec.name: OrjsonCodec,
+}
+
+
+def get_codec(codec: typing.Union[str, JsonCodec] = None) -> JsonCodec:
+    """
+    Get a json codec by its name ('json' or 'orjson'), codec instances are returned as is.
+    A codec whose library is not installed falls back to the standard json module (compare the 'name' of the
+    returned codec to tell), nothing is logged here so the caller decides whether to report it.
+    """
+    if isinstance(codec, JsonCodec):
+        return codec
+    if codec is None:
+        return JsonCodec()
+    if codec not in CODECS:
+        raise ValueError(f"unknown json codec '{codec}', expected one of: {list(CODECS)}")
+    try:
+        return CODECS[codec]()
+    except ImportError:
+        return JsonCodec()
@@ -20,6 +20,7 @@ GROUPS = "/groups"
 SITES = "/sites"
 DRIVE = "/drive"
 DRIVES = "/drives"
+DRIVE_ROOT = "/root"
 TEAMS = "/teams"
 CHANNELS = "/channels"
 EXTENSIONS = "/extensions"
@@ -30,10 +31,28 @@ SERVICE_PRINCIPALS = "/servicePrincipals"
 
 # Properties
 USER_PURPOSE = "userPurpose"
+RECEIVED_DATE_TIME = "receivedDateTime"
 
 # operations
 SENDMAIL = "/sendmail"
+SEND = "/send"
 MOVE_MAIL = "/move"
+BATCH = "/$batch"
+CREATE_UPLOAD_SESSION = "/createUploadSession"
+DELTA = "/delta"
+
+# JSON batching limits
+MAX_BATCH_REQUESTS = 20
+
+# attachments larger than this must be uploaded through an upload session
+MAX_INLINE_ATTACHMENT_SIZE = 3 * 1024 * 1024
+
+# drive item download url key
+DOWNLOAD_URL_KEY = "@microsoft.graph.downloadUrl"
+
+# drive item version keys
+CTAG_KEY = "cTag"
+QUICK_XOR_HASH_KEY = "quickXorHash"
 
 # next_key
 NEXT_KEY = "@odata.nextLink"
@@ -41,6 +60,15 @@ NEXT_KEY = "@odata.nextLink"
 # delta_key
 DELTA_KEY = "@odata.deltaLink"
 
+# most windows a time window is split into at once, when partitioning a listing by time
+MAX_WINDOW_SPLIT = 16
+
+# count_key
+COUNT_KEY = "@odata.count"
+
+# advanced directory queries (e.g. $count) must be sent with this header
+CONSISTENCY_LEVEL_HEADER = "ConsistencyLevel"
+
 
 # Subscription Resources
 class SubscriptionResources(str, Enum):
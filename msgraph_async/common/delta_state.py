@@ -0,0 +1,157 @@
+import abc
+import os
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import tempfile
+import threading
+import typing
+
+
+# table names can't be bound as query parameters, so they are validated before being written into queries
+_TABLE_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class DeltaStateStore(abc.ABC):
+    """
+    Persists the state link of delta queries (a deltaLink, or the nextLink of a sync that is still in progress)
+    by key, e.g. one key per resource and tenant.
+    Subclasses implement get, set, delete and keys.
+    """
+    @abc.abstractmethod
+    async def get(self, key: str) -> typing.Optional[str]:
+        pass
+
+    @abc.abstractmethod
+    async def set(self, key: str, link: str):
+        pass
+
+    @abc.abstractmethod
+    async def delete(self, key: str):
+        pass
+
+    @abc.abstractmethod
+    async def keys(self) -> typing.List[str]:
+        pass
+
+    async def close(self):
+        pass
+
+
+class MemoryDeltaStateStore(DeltaStateStore):
+    """Keeps the links in memory, so they are lost when the process exits"""
+    def __init__(self):
+        self._links = {}
+
+    async def get(self, key: str) -> typing.Optional[str]:
+        return self._links.get(key)
+
+    async def set(self, key: str, link: str):
+        self._links[key] = link
+
+    async def delete(self, key: str):
+        self._links.pop(key, None)
+
+    async def keys(self) -> typing.List[str]:
+        return list(self._links)
+
+
+class FileDeltaStateStore(DeltaStateStore):
+    """
+    Keeps the links in a json file, which is rewritten atomically on every change.
+    Fits a moderate number of keys, use SqliteDeltaStateStore for many of them.
+    """
+    def __init__(self, path: str):
+        self._path = path
+        self._links = None
+        self._lock = asyncio.Lock()
+
+    def _load(self) -> dict:
+        if not os.path.exists(self._path):
+            return {}
+        with open(self._path, "r", encoding="utf-8") as fp:
+            return json.load(fp)
+
+    def _dump(self, links: dict):
+        directory = os.path.dirname(os.path.abspath(self._path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".delta-state-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fp:
+                json.dump(links, fp)
+            os.replace(temp_path, self._path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    async def _get_links(self) -> dict:
+        if self._links is None:
+            self._links = await asyncio.get_event_loop().run_in_executor(None, self._load)
+        return self._links
+
+    async def get(self, key: str) -> typing.Optional[str]:
+        async with self._lock:
+            return (await self._get_links()).get(key)
+
+    async def set(self, key: str, link: str):
+        async with self._lock:
+            links = await self._get_links()
+            links[key] = link
+            await asyncio.get_event_loop().run_in_executor(None, self._dump, dict(links))
+
+    async def delete(self, key: str):
+        async with self._lock:
+            links = await self._get_links()
+            if links.pop(key, None) is not None:
+                await asyncio.get_event_loop().run_in_executor(None, self._dump, dict(links))
+
+    async def keys(self) -> typing.List[str]:
+        async with self._lock:
+            return list(await self._get_links())
+
+
+class SqliteDeltaStateStore(DeltaStateStore):
+    """Keeps the links in a SQLite database (table 'delta_links'), queries run in the default executor"""
+    def __init__(self, path: str, table: str = "delta_links"):
+        if not _TABLE_NAME.match(table):
+            raise ValueError(f"invalid table name '{table}', expected letters, digits and underscores")
+        self._path = path
+        self._table = table
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _execute(self, query: str, parameters: tuple = ()) -> list:
+        with self._lock:
+            if not self._connection:
+                self._connection = sqlite3.connect(self._path, check_same_thread=False)
+                self._connection.execute(f"CREATE TABLE IF NOT EXISTS {self._table} "
+                                         f"(key TEXT PRIMARY KEY, link TEXT NOT NULL, updated_at REAL NOT NULL)")
+            with self._connection:
+                return self._connection.execute(query, parameters).fetchall()
+
+    async def _run(self, query: str, parameters: tuple = ()) -> list:
+        return await asyncio.get_event_loop().run_in_executor(None, self._execute, query, parameters)
+
+    async def get(self, key: str) -> typing.Optional[str]:
+        rows = await self._run(f"SELECT link FROM {self._table} WHERE key = ?", (key,))
+        return rows[0][0] if rows else None
+
+    async def set(self, key: str, link: str):
+        await self._run(f"INSERT OR REPLACE INTO {self._table} (key, link, updated_at) VALUES (?, ?, ?)",
+                        (key, link, time.time()))
+
+    async def delete(self, key: str):
+        await self._run(f"DELETE FROM {self._table} WHERE key = ?", (key,))
+
+    async def keys(self) -> typing.List[str]:
+        return [row[0] for row in await self._run(f"SELECT key FROM {self._table}")]
+
+    def _close(self):
+        with self._lock:
+            if self._connection:
+                self._connection.close()
+                self._connection = None
+
+    async def close(self):
+        await asyncio.get_event_loop().run_in_executor(None, self._close)
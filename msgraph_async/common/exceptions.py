@@ -80,6 +80,10 @@ class UnprocessableEntity(BaseHttpError):
     pass
 
 
+class FailedDependency(BaseHttpError):
+    pass
+
+
 class TooManyRequests(BaseHttpError):
     pass
 
@@ -119,6 +123,7 @@ status2exception = {
     HTTPStatus.UNSUPPORTED_MEDIA_TYPE: UnsupportedMediaType,
     HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE: RequestedRangeNotSatisfiable,
     HTTPStatus.UNPROCESSABLE_ENTITY: UnprocessableEntity,
+    HTTPStatus.FAILED_DEPENDENCY: FailedDependency,
     HTTPStatus.TOO_MANY_REQUESTS: TooManyRequests,
     HTTPStatus.INTERNAL_SERVER_ERROR: InternalServerError,
     HTTPStatus.NOT_IMPLEMENTED: NotImplemented,
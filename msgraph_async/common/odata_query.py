@@ -240,8 +240,14 @@ class ODataQuery:
             res += str(constrain)
         return res
 
+    @property
+    def is_empty(self) -> bool:
+        """Whether the query has no parameter to add to a url"""
+        return not self.count and not self.expand and not (self.filter and self.filter.constrains) \
+            and not self.select and not self.top and not self.order_by
+
     def __str__(self):
-        if not self.count and not self.expand and not self.filter and not self.select and not self.top:
+        if self.is_empty:
             return "EMPTY OPEN DATA QUERY"
         res = []
         if self.count:
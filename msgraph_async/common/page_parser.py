@@ -0,0 +1,205 @@
+import re
+import typing
+from msgraph_async.common.exceptions import GraphClientException
+from msgraph_async.common.codec import JsonCodec
+
+_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+# the bytes that change the nesting of a value outside of its strings
+_STRUCTURAL = re.compile(rb'["\[\]{}]')
+_SCALAR_END = re.compile(rb"[,\]} \t\n\r]")
+
+
+def _count_backslashes(buffer: bytes, end: int, start: int) -> int:
+    """Length of the run of backslashes that ends right before 'end' (and starts no earlier than 'start')"""
+    count = 0
+    while end - count > start and buffer[end - count - 1] == 0x5C:
+        count += 1
+    return count
+
+
+def _find_string_end(buffer: bytes, pos: int) -> int:
+    """Index of the quote that closes the string that continues at pos, -1 if it's not in buffer"""
+    while True:
+        quote = buffer.find(b'"', pos)
+        if quote < 0 or _count_backslashes(buffer, quote, pos) % 2 == 0:
+            return quote
+        pos = quote + 1
+
+
+# parser states
+_START, _KEY, _COLON, _VALUE, _AFTER_VALUE, _FIRST_ITEM, _ITEM, _AFTER_ITEM, _DONE = range(9)
+
+
+class PageParser:
+    """
+    Incremental parser of a single collection page ({"@odata.context": ..., "value": [...], "@odata.nextLink": ...}).
+    Response bytes are fed as they arrive and every item of the 'value' array is returned as soon as it is complete,
+    so only a single item is held in memory at a time (instead of the whole page).
+    The bytes of a value are scanned once (tracking its nesting and strings across chunks) and kept as a list of
+    chunks until the value closes, then it is decoded once with 'codec'. JSON structural characters are ASCII, so the
+    bytes are scanned without decoding them.
+    All the other top-level keys of the page (next link, delta link, count...) are kept in 'metadata'.
+    """
+    def __init__(self, items_key: str = "value", codec: JsonCodec = None):
+        self._items_key = items_key
+        self._codec = codec or JsonCodec()
+        self._buffer = b""
+        self._pos = 0
+        self._state = _START
+        self._key = None
+        # the value that is being scanned: its bytes of previous chunks, nesting depth and string state
+        self._scanning = False
+        self._scalar = False
+        self._parts = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.metadata = {}
+
+    @property
+    def done(self) -> bool:
+        return self._state == _DONE
+
+    def feed(self, data: bytes) -> typing.List:
+        """
+        Feed the next bytes of the page
+        :return: the items that were completed by data
+        """
+        self._buffer = bytes(data)
+        self._pos = 0
+        return self._parse(final=False)
+
+    def close(self) -> typing.List:
+        """
+        Signal the end of the page
+        :return: the items that were not returned yet
+        """
+        self._buffer = b""
+        self._pos = 0
+        items = self._parse(final=True)
+        if self._state != _DONE:
+            raise GraphClientException("page ended before its json was complete")
+        return items
+
+    def _skip_whitespace(self) -> bool:
+        self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+        return self._pos < len(self._buffer)
+
+    def _scan(self, final: bool) -> typing.Optional[int]:
+        """Scan the current value from the current position, returns where it ends or None if it continues"""
+        buffer, pos = self._buffer, self._pos
+        if self._scalar:
+            match = _SCALAR_END.search(buffer, pos)
+            if match:
+                return match.start()
+            return len(buffer) if final else None
+        while True:
+            if self._escape:
+                if pos >= len(buffer):
+                    return None
+                pos += 1
+                self._escape = False
+            if self._in_string:
+                end = _find_string_end(buffer, pos)
+                if end < 0:
+                    # an odd run of backslashes at the end of the chunk escapes the first byte of the next one
+                    self._escape = _count_backslashes(buffer, len(buffer), pos) % 2 == 1
+                    return None
+                pos = end + 1
+                self._in_string = False
+                if not self._depth:
+                    return pos
+                continue
+            match = _STRUCTURAL.search(buffer, pos)
+            if not match:
+                return None
+            pos = match.end()
+            char = buffer[match.start()]
+            if char == 0x22:  # quote
+                self._in_string = True
+            elif char in b"[{":
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if not self._depth:
+                    return pos
+
+    def _decode_value(self, final: bool):
+        """Decode a json value at the current position, returns (False, None) when more data is needed"""
+        if not self._scanning:
+            self._scanning = True
+            self._scalar = self._buffer[self._pos] not in b'"[{'
+        end = self._scan(final)
+        if end is None:
+            self._parts.append(self._buffer[self._pos:])
+            self._pos = len(self._buffer)
+            return False, None
+        self._parts.append(self._buffer[self._pos:end])
+        data = b"".join(self._parts)
+        self._pos = end
+        self._parts = []
+        self._scanning = False
+        try:
+            return True, self._codec.loads(data)
+        except ValueError as e:
+            raise GraphClientException(f"invalid json in page: {str(e)}")
+
+    def _expect(self, chars: bytes) -> bytes:
+        char = self._buffer[self._pos:self._pos + 1]
+        if char not in chars:
+            raise GraphClientException(f"invalid json in page: unexpected '{char.decode(errors='replace')}' "
+                                       f"at state {self._state}")
+        self._pos += 1
+        return char
+
+    def _parse(self, final: bool) -> typing.List:
+        items = []
+        while self._state != _DONE:
+            if self._scanning:
+                # a value that continues from the previous chunk
+                if self._pos >= len(self._buffer) and not final:
+                    break
+            elif not self._skip_whitespace():
+                break
+            if self._state == _START:
+                self._expect(b"{")
+                self._state = _KEY
+            elif self._state == _KEY:
+                if not self._scanning and self._buffer[self._pos] == 0x7D:  # }
+                    self._pos += 1
+                    self._state = _DONE
+                    continue
+                complete, self._key = self._decode_value(final)
+                if not complete:
+                    break
+                if not isinstance(self._key, str):
+                    raise GraphClientException("invalid json in page: object key is not a string")
+                self._state = _COLON
+            elif self._state == _COLON:
+                self._expect(b":")
+                self._state = _VALUE
+            elif self._state == _VALUE:
+                if not self._scanning and self._key == self._items_key and self._buffer[self._pos] == 0x5B:  # [
+                    self._pos += 1
+                    self._state = _FIRST_ITEM
+                    continue
+                complete, value = self._decode_value(final)
+                if not complete:
+                    break
+                self.metadata[self._key] = value
+                self._state = _AFTER_VALUE
+            elif self._state == _AFTER_VALUE:
+                self._state = _KEY if self._expect(b",}") == b"," else _DONE
+            elif self._state in (_FIRST_ITEM, _ITEM):
+                if not self._scanning and self._state == _FIRST_ITEM and self._buffer[self._pos] == 0x5D:  # ]
+                    self._pos += 1
+                    self._state = _AFTER_VALUE
+                    continue
+                complete, item = self._decode_value(final)
+                if not complete:
+                    break
+                items.append(item)
+                self._state = _AFTER_ITEM
+            elif self._state == _AFTER_ITEM:
+                self._state = _ITEM if self._expect(b",]") == b"," else _AFTER_VALUE
+        return items
@@ -0,0 +1,113 @@
+import copy
+import math
+import typing
+import string
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+from msgraph_async.common.odata_query import *
+from msgraph_async.common.exceptions import GraphClientException
+
+# characters a userPrincipalName can start with (its local part is limited to letters, digits and ' - _ ! # ^ ~)
+USER_PARTITION_PREFIXES = list(string.digits + string.ascii_lowercase + "'-_!#^~")
+
+# characters a group mailNickname can start with (ascii, except for @ ( ) \ [ ] " ; : < > , and space)
+GROUP_PARTITION_PREFIXES = list(string.digits + string.ascii_lowercase + "!#$%&'*+-./=?^_`{|}~")
+
+
+def quote_filter_value(value: str) -> str:
+    """Escape a string literal of a $filter expression, so it can be placed in a url"""
+    return urllib.parse.quote(value.replace("'", "''"), safe="")
+
+
+def with_constrains(odata_query: typing.Optional[ODataQuery], constrains: typing.List[Constrain],
+                    prepend: bool = False) -> ODataQuery:
+    """
+    A copy of odata_query (or a new query) whose filter also requires all of constrains.
+    Constrains can only be added to a filter of a single constrain or of constrains connected with 'and'.
+    :param prepend: put constrains before those of odata_query (properties used by $orderby must come first)
+    """
+    query = copy.copy(odata_query) if odata_query else ODataQuery()
+    current = query.filter.constrains if query.filter else []
+    if len(current) > 1 and query.filter.logical_connector != LogicalConnector.AND:
+        raise GraphClientException("can't partition a query whose filter is connected with 'or'")
+    all_constrains = list(constrains) + list(current) if prepend else list(current) + list(constrains)
+    if all_constrains:
+        query.filter = Filter(all_constrains, LogicalConnector.AND if len(all_constrains) > 1 else None)
+    return query
+
+
+def build_prefix_partitions(odata_query: typing.Optional[ODataQuery], attribute: str,
+                            prefixes: typing.List[str]) -> typing.List[ODataQuery]:
+    """
+    Split a query into disjoint partitions, one per prefix (i.e. startswith(attribute, prefix)).
+    Prefixes are matched case-insensitively by the service, so no prefix may start with another one (ignoring case).
+    """
+    lowered = sorted(prefix.lower() for prefix in prefixes)
+    if not all(lowered) or any(b.startswith(a) for a, b in zip(lowered, lowered[1:])):
+        raise GraphClientException("partition prefixes must be non-empty and disjoint (case-insensitively)")
+    partitions = []
+    for prefix in prefixes:
+        constrain = Constrain(attribute, LogicalOperator.STARTS_WITH, quote_filter_value(prefix))
+        partitions.append(with_constrains(odata_query, [constrain]))
+    return partitions
+
+
+def as_utc(value: datetime) -> datetime:
+    """Convert a datetime to UTC, naive datetimes are taken as UTC"""
+    return value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def format_filter_datetime(value: datetime) -> str:
+    """Format a datetime as a $filter literal (in UTC)"""
+    return as_utc(value).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def parse_graph_datetime(value: str) -> datetime:
+    """Parse a datetime property of a resource (e.g. '2021-01-01T10:00:00Z'), to the second"""
+    return datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+
+
+class TimeWindow:
+    """
+    A [start, end) window of a datetime property, used to partition a listing by time.
+    An open start (or end) window also includes everything before its start (or from its end on), so the first and
+    last windows of a partitioning cover items that fall outside of the known range.
+    """
+    def __init__(self, start: datetime, end: datetime, open_start: bool = False, open_end: bool = False):
+        start, end = as_utc(start), as_utc(end)
+        if end <= start:
+            raise ValueError("window end must be after its start")
+        self.start = start
+        self.end = end
+        self.open_start = open_start
+        self.open_end = open_end
+
+    @property
+    def duration(self) -> timedelta:
+        return self.end - self.start
+
+    def __repr__(self):
+        return (f"TimeWindow({'..' if self.open_start else ''}{format_filter_datetime(self.start)}, "
+                f"{format_filter_datetime(self.end)}{'..' if self.open_end else ''})")
+
+    def split(self, parts: int, min_duration: timedelta = timedelta(seconds=1)) -> typing.List["TimeWindow"]:
+        """
+        Split into (up to) parts consecutive windows of equal duration, whole seconds and at least min_duration each
+        """
+        parts = max(1, min(parts, int(self.duration / max(min_duration, timedelta(seconds=1)))))
+        bounds = [self.start]
+        for index in range(1, parts):
+            bound = self.start + timedelta(seconds=math.floor((self.duration * index / parts).total_seconds()))
+            if bound > bounds[-1]:
+                bounds.append(bound)
+        bounds.append(self.end)
+        return [TimeWindow(start, end, self.open_start and index == 0, self.open_end and index == len(bounds) - 2)
+                for index, (start, end) in enumerate(zip(bounds, bounds[1:]))]
+
+    def get_constrains(self, attribute: str) -> typing.List[Constrain]:
+        constrains = []
+        if not self.open_start:
+            constrains.append(Constrain(attribute, LogicalOperator.GE, format_filter_datetime(self.start)))
+        if not self.open_end:
+            constrains.append(Constrain(attribute, LogicalOperator.LT, format_filter_datetime(self.end)))
+        return constrains
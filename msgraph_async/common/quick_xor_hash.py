@@ -0,0 +1,89 @@
+import base64
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+WIDTH_IN_BITS = 160
+SHIFT = 11
+# bytes whose offsets are equal modulo WIDTH_IN_BITS are shifted by the same amount, so they can be xor-ed together
+# first, and the shifts are applied once per residue when the hash is finalized
+_PERIOD = WIDTH_IN_BITS
+_MASK = (1 << WIDTH_IN_BITS) - 1
+_MIN_NUMPY_SIZE = 4 * _PERIOD
+
+
+def _fold_rows(data: memoryview) -> int:
+    """Xor all the _PERIOD sized rows of data together, as a little endian integer"""
+    if numpy is not None and len(data) >= _MIN_NUMPY_SIZE:
+        rows = numpy.frombuffer(data, dtype=numpy.uint64).reshape(-1, _PERIOD // 8)
+        return int.from_bytes(numpy.bitwise_xor.reduce(rows, axis=0).tobytes(), "little")
+    folded = 0
+    for offset in range(0, len(data), _PERIOD):
+        folded ^= int.from_bytes(data[offset:offset + _PERIOD], "little")
+    return folded
+
+
+class QuickXorHash:
+    """
+    The quickXorHash of OneDrive and SharePoint (file.hashes.quickXorHash), computed incrementally with update().
+    The content is folded into _PERIOD bytes with numpy when available (a pure python fold is used otherwise),
+    so hashing runs at memory speed rather than byte by byte.
+    """
+    def __init__(self, data: bytes = None):
+        self._folded = 0
+        self._length = 0
+        if data:
+            self.update(data)
+
+    @property
+    def length(self) -> int:
+        return self._length
+
+    def update(self, data: bytes or bytearray or memoryview):
+        view = memoryview(data).cast("B")
+        offset = self._length % _PERIOD
+        head = min((_PERIOD - offset) % _PERIOD, len(view))
+        if head:
+            self._folded ^= int.from_bytes(view[:head], "little") << (8 * offset)
+        body = (len(view) - head) // _PERIOD * _PERIOD
+        if body:
+            self._folded ^= _fold_rows(view[head:head + body])
+        tail = view[head + body:]
+        if len(tail):
+            self._folded ^= int.from_bytes(tail, "little")
+        self._length += len(view)
+
+    def digest(self) -> bytes:
+        value = 0
+        folded = self._folded.to_bytes(_PERIOD, "little")
+        for index, byte in enumerate(folded):
+            if byte:
+                shift = index * SHIFT % WIDTH_IN_BITS
+                value ^= ((byte << shift) | (byte >> (WIDTH_IN_BITS - shift))) & _MASK
+        value ^= self._length << (WIDTH_IN_BITS - 64)
+        return (value & _MASK).to_bytes(WIDTH_IN_BITS // 8, "little")
+
+    def b64digest(self) -> str:
+        """The hash as it appears in the metadata of drive items"""
+        return base64.b64encode(self.digest()).decode()
+
+
+def quick_xor_hash_file(path: str, chunk_size: int = 4 * 1024 * 1024) -> str:
+    """The quickXorHash (base64) of a local file, read chunk by chunk (blocking, run it in an executor)"""
+    hasher = QuickXorHash()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, "rb") as fp:
+        while True:
+            read = fp.readinto(buffer)
+            if not read:
+                break
+            hasher.update(view[:read])
+    return hasher.b64digest()
+
+
+def quick_xor_hash(data: bytes) -> str:
+    """The quickXorHash (base64) of data"""
+    return QuickXorHash(data).b64digest()
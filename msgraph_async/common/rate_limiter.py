@@ -0,0 +1,202 @@
+import re
+import json
+import time
+import base64
+import hashlib
+import asyncio
+import typing
+from collections import deque
+from functools import lru_cache
+from http import HTTPStatus
+
+THROTTLING_STATUSES = (HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.SERVICE_UNAVAILABLE)
+
+_MAILBOX_PATTERN = re.compile(r"/users/([^/?]+)", re.IGNORECASE)
+# segments after /users/ that are functions or collection operations rather than a mailbox
+_NON_MAILBOX_SEGMENTS = ("delta", "delta()", "getbyids", "validateproperties")
+
+
+def _is_mailbox_segment(segment: str) -> bool:
+    segment = segment.lower()
+    return not (segment.startswith("$") or segment.startswith("microsoft.graph.")
+                or segment in _NON_MAILBOX_SEGMENTS)
+
+
+@lru_cache(maxsize=4096)
+def get_tenant_key(authorization: str) -> str:
+    """
+    Extract the tenant id ('tid' claim) from a bearer token, tokens that can't be decoded are keyed by their digest
+    """
+    token = authorization.split(" ")[-1]
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload))["tid"]
+    except (IndexError, KeyError, TypeError, ValueError):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+
+class AimdWindow:
+    """
+    Concurrency window of a single key, grows additively on success and shrinks multiplicatively on throttling
+    """
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.last_decrease = 0.0
+        self.last_used = time.monotonic()
+        self.waiters = deque()
+
+    @property
+    def has_capacity(self) -> bool:
+        return self.has_room(1)
+
+    def has_room(self, weight: int) -> bool:
+        # a request heavier than the whole window (e.g. a large $batch) is let through when nothing else is in flight
+        return not self.in_flight or self.in_flight + weight <= max(1, int(self.limit))
+
+    def is_idle(self, now: float, idle_ttl_sec: float) -> bool:
+        return not self.in_flight and not self.waiters and now - self.last_used >= idle_ttl_sec
+
+    def wake_up(self):
+        while self.waiters:
+            waiter, weight = self.waiters[0]
+            if not waiter.done() and not self.has_room(weight):
+                return
+            self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+
+class AdaptiveRateLimiter:
+    """
+    Client side limiter that keeps the number of concurrent requests per tenant (and optionally per mailbox)
+    just under the service limit.
+    Each key has an AIMD concurrency window: every successful response grows the window by increase_step / window
+    (i.e. about increase_step per window of requests), and a throttling response (429/503) multiplies it by
+    decrease_factor, at most once per decrease_cooldown_sec. A Retry-After header blocks the key until it passes.
+    Windows that were not used for idle_ttl_sec (and aren't blocked) are dropped, so a long running process doesn't
+    keep a window for every tenant and mailbox it has ever seen.
+    A request can take several slots of a window ('weight'), e.g. a $batch takes one per sub-request.
+    A single limiter can be shared by several clients.
+    """
+    def __init__(self, initial_concurrency: int = 16, min_concurrency: int = 1, max_concurrency: int = 256,
+                 increase_step: float = 1, decrease_factor: float = 0.5, decrease_cooldown_sec: float = 1,
+                 per_mailbox: bool = False, mailbox_initial_concurrency: int = 4, mailbox_max_concurrency: int = 16,
+                 idle_ttl_sec: float = 600):
+        if not 0 < min_concurrency <= initial_concurrency <= max_concurrency:
+            raise ValueError("concurrency limits must satisfy 0 < min <= initial <= max")
+        if not 0 < decrease_factor < 1:
+            raise ValueError("decrease factor must be between 0 and 1")
+        if idle_ttl_sec <= 0:
+            raise ValueError("idle ttl must be positive")
+        self._initial_concurrency = initial_concurrency
+        self._min_concurrency = min_concurrency
+        self._max_concurrency = max_concurrency
+        self._increase_step = increase_step
+        self._decrease_factor = decrease_factor
+        self._decrease_cooldown_sec = decrease_cooldown_sec
+        self._per_mailbox = per_mailbox
+        self._mailbox_initial_concurrency = mailbox_initial_concurrency
+        self._mailbox_max_concurrency = mailbox_max_concurrency
+        self._idle_ttl_sec = idle_ttl_sec
+        self._windows = {}
+        self._last_eviction = time.monotonic()
+
+    def get_keys(self, headers: dict, url: str) -> typing.List[typing.Tuple]:
+        """Keys the request is limited by, mailbox key (if any) first and then the tenant key"""
+        authorization = (headers or {}).get("authorization")
+        if not authorization:
+            return []
+        tenant = get_tenant_key(authorization)
+        keys = [(tenant,)]
+        if self._per_mailbox:
+            match = _MAILBOX_PATTERN.search(url)
+            if match and _is_mailbox_segment(match.group(1)):
+                keys.insert(0, (tenant, match.group(1).lower()))
+        return keys
+
+    def get_limit(self, key: typing.Tuple) -> float:
+        return self._get_window(key).limit
+
+    def _get_window(self, key: typing.Tuple) -> AimdWindow:
+        window = self._windows.get(key)
+        if not window:
+            initial = self._initial_concurrency if len(key) == 1 else self._mailbox_initial_concurrency
+            window = self._windows[key] = AimdWindow(initial)
+        return window
+
+    @property
+    def window_count(self) -> int:
+        return len(self._windows)
+
+    def _evict_idle(self, loop_now: float):
+        now = time.monotonic()
+        if now - self._last_eviction < self._idle_ttl_sec / 2:
+            return
+        self._last_eviction = now
+        for key in [key for key, window in self._windows.items()
+                    if window.is_idle(now, self._idle_ttl_sec) and window.blocked_until <= loop_now]:
+            del self._windows[key]
+
+    def _get_max(self, key: typing.Tuple) -> float:
+        return self._max_concurrency if len(key) == 1 else self._mailbox_max_concurrency
+
+    async def _acquire_one(self, key: typing.Tuple, weight: int):
+        loop = asyncio.get_event_loop()
+        self._evict_idle(loop.time())
+        window = self._get_window(key)
+        while True:
+            now = loop.time()
+            if window.blocked_until > now:
+                await asyncio.sleep(window.blocked_until - now)
+                continue
+            if window.has_room(weight):
+                window.in_flight += weight
+                # a release of several slots wakes a single waiter, which passes the remaining room on
+                window.wake_up()
+                return
+            waiter = loop.create_future()
+            window.waiters.append((waiter, weight))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    window.wake_up()
+                raise
+
+    async def acquire(self, keys: typing.List[typing.Tuple], weight: int = 1):
+        """Take 'weight' slots of the window of every key, waiting for them to be free"""
+        acquired = []
+        try:
+            for key in keys:
+                await self._acquire_one(key, weight)
+                acquired.append(key)
+        except BaseException:
+            self.release(acquired, weight)
+            raise
+
+    def release(self, keys: typing.List[typing.Tuple], weight: int = 1):
+        for key in keys:
+            window = self._get_window(key)
+            window.in_flight -= weight
+            window.last_used = time.monotonic()
+            window.wake_up()
+
+    def on_response(self, keys: typing.List[typing.Tuple], status: int, retry_after: float = None):
+        """Adapt the windows of keys according to a response status (and its Retry-After, if any)"""
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        for key in keys:
+            window = self._get_window(key)
+            if status in THROTTLING_STATUSES:
+                if retry_after:
+                    window.blocked_until = max(window.blocked_until, now + retry_after)
+                if now - window.last_decrease >= self._decrease_cooldown_sec:
+                    window.limit = max(self._min_concurrency, window.limit * self._decrease_factor)
+                    window.last_decrease = now
+            elif status < 500:
+                window.limit = min(self._get_max(key), window.limit + self._increase_step / window.limit)
+                window.wake_up()
@@ -0,0 +1,140 @@
+import time
+import random
+import asyncio
+import typing
+import aiohttp
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from http import HTTPStatus
+from msgraph_async.common.exceptions import BaseHttpError
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+
+class RetryBudget:
+    """
+    Limits retries to a ratio of the requests that were sent during the last ttl_sec seconds (plus a minimum of
+    min_retries_per_sec), so retries can't multiply the load on the service during an outage
+    """
+    def __init__(self, ratio: float = 0.2, min_retries_per_sec: float = 1, ttl_sec: float = 10):
+        if ratio < 0:
+            raise ValueError("ratio must not be negative")
+        if ttl_sec <= 0:
+            raise ValueError("ttl must be positive")
+        self._ratio = ratio
+        self._min_retries_per_sec = min_retries_per_sec
+        self._ttl_sec = ttl_sec
+        self._requests = deque()
+        self._retries = deque()
+
+    def _expire(self, now: float):
+        for timestamps in (self._requests, self._retries):
+            while timestamps and timestamps[0] <= now - self._ttl_sec:
+                timestamps.popleft()
+
+    def record_request(self):
+        now = time.monotonic()
+        self._expire(now)
+        self._requests.append(now)
+
+    def try_spend(self) -> bool:
+        """Take one retry out of the budget, returns False if the budget is exhausted"""
+        now = time.monotonic()
+        self._expire(now)
+        allowed = self._ratio * len(self._requests) + self._min_retries_per_sec * self._ttl_sec
+        if len(self._retries) + 1 > allowed:
+            return False
+        self._retries.append(now)
+        return True
+
+
+class RetryPolicy:
+    """
+    Decides whether a failed request should be retried and how long to wait before retrying it.
+    Throttling responses (429, 503, 504) are retried after their Retry-After header when it's present,
+    other retryable failures (5xx responses and connection errors) are retried with exponential backoff and full
+    jitter.
+    Requests with non idempotent methods (e.g. POST) are retried only if retry_unsafe_methods is set, or if the call
+    explicitly allows it.
+    Every client keeps its own RetryBudget (see create_budget) so retries can't amplify load during an outage.
+    """
+    def __init__(self, max_retries: int = 3, backoff_base_sec: float = 0.5, backoff_max_sec: float = 30,
+                 max_retry_after_sec: float = 120,
+                 retry_statuses: typing.Tuple[HTTPStatus] = (
+                         HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.INTERNAL_SERVER_ERROR, HTTPStatus.BAD_GATEWAY,
+                         HTTPStatus.SERVICE_UNAVAILABLE, HTTPStatus.GATEWAY_TIMEOUT),
+                 retry_exceptions: typing.Tuple[typing.Type[Exception]] = (
+                         aiohttp.ClientConnectionError, asyncio.TimeoutError),
+                 retry_unsafe_methods: bool = False, budget_ratio: float = 0.2,
+                 budget_min_retries_per_sec: float = 1, budget_ttl_sec: float = 10):
+        if max_retries < 0:
+            raise ValueError("max retries must not be negative")
+        self.max_retries = max_retries
+        self.backoff_base_sec = backoff_base_sec
+        self.backoff_max_sec = backoff_max_sec
+        self.max_retry_after_sec = max_retry_after_sec
+        self.retry_statuses = retry_statuses
+        self.retry_exceptions = retry_exceptions
+        self.retry_unsafe_methods = retry_unsafe_methods
+        self.budget_ratio = budget_ratio
+        self.budget_min_retries_per_sec = budget_min_retries_per_sec
+        self.budget_ttl_sec = budget_ttl_sec
+
+    def create_budget(self) -> RetryBudget:
+        return RetryBudget(self.budget_ratio, self.budget_min_retries_per_sec, self.budget_ttl_sec)
+
+    @staticmethod
+    def get_retry_after(headers) -> typing.Optional[float]:
+        """Parse Retry-After header (either delay in seconds or http date) into seconds to wait"""
+        if not headers:
+            return None
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+    def get_backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max_sec, self.backoff_base_sec * (2 ** attempt)))
+
+    def get_retry_delay(self, method: str, exception: Exception, attempt: int, budget: RetryBudget = None,
+                        allow_unsafe: bool = False) -> typing.Optional[float]:
+        """
+        :param method: http method of the failed request
+        :param exception: the exception the request failed with
+        :param attempt: number of retries that were already made for this request
+        :param budget: retry budget to spend the retry from
+        :param allow_unsafe: allow retrying this request even if its method is not idempotent
+        :return: seconds to wait before retrying, or None if the request should not be retried
+        """
+        if attempt >= self.max_retries:
+            return None
+        if method.upper() not in IDEMPOTENT_METHODS and not (self.retry_unsafe_methods or allow_unsafe):
+            return None
+
+        if isinstance(exception, BaseHttpError):
+            if exception.status not in self.retry_statuses:
+                return None
+            delay = self.get_retry_after(exception.response_headers)
+            if delay is None:
+                delay = self.get_backoff(attempt)
+            elif delay > self.max_retry_after_sec:
+                return None
+        elif isinstance(exception, self.retry_exceptions):
+            delay = self.get_backoff(attempt)
+        else:
+            return None
+
+        if budget and not budget.try_spend():
+            return None
+        return delay
@@ -0,0 +1,147 @@
+import abc
+import re
+import json
+import asyncio
+import sqlite3
+import threading
+import typing
+from datetime import datetime, timezone
+from msgraph_async.common.constants import SubscriptionResources
+
+
+# the table name is formatted into the queries of SqliteSubscriptionStore
+_TABLE_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class SubscriptionRecord:
+    """
+    A subscription that is kept alive by SubscriptionManager, along with everything needed to renew it
+    (minutes_to_expiration) or to create it again if it was lost (the rest of the create_subscription arguments).
+    """
+    def __init__(self, id: str, resource: SubscriptionResources, change_type: str, notification_url: str,
+                 minutes_to_expiration: int, expiration: datetime, user_id: str = None, client_state: str = None,
+                 life_cycle_url: str = None, latest_supported_tls_version: str = None):
+        self.id = id
+        self.resource = resource
+        self.change_type = change_type
+        self.notification_url = notification_url
+        self.minutes_to_expiration = minutes_to_expiration
+        self.expiration = expiration if expiration.tzinfo else expiration.replace(tzinfo=timezone.utc)
+        self.user_id = user_id
+        self.client_state = client_state
+        self.life_cycle_url = life_cycle_url
+        self.latest_supported_tls_version = latest_supported_tls_version
+
+    def __repr__(self):
+        return f"SubscriptionRecord({self.id}, {self.resource.name}, {self.user_id}, {self.expiration.isoformat()})"
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "resource": self.resource.name,
+            "change_type": self.change_type,
+            "notification_url": self.notification_url,
+            "minutes_to_expiration": self.minutes_to_expiration,
+            "expiration": self.expiration.timestamp(),
+            "user_id": self.user_id,
+            "client_state": self.client_state,
+            "life_cycle_url": self.life_cycle_url,
+            "latest_supported_tls_version": self.latest_supported_tls_version,
+        }
+
+    @classmethod
+    def from_dict(cls, value: dict) -> "SubscriptionRecord":
+        value = dict(value)
+        value["resource"] = SubscriptionResources[value["resource"]]
+        value["expiration"] = datetime.fromtimestamp(value["expiration"], timezone.utc)
+        return cls(**value)
+
+
+class SubscriptionStore(abc.ABC):
+    """
+    Persists the subscriptions managed by SubscriptionManager by their id.
+    Subclasses implement get, set, delete and list.
+    """
+    @abc.abstractmethod
+    async def get(self, subscription_id: str) -> typing.Optional[SubscriptionRecord]:
+        pass
+
+    @abc.abstractmethod
+    async def set(self, record: SubscriptionRecord):
+        pass
+
+    @abc.abstractmethod
+    async def delete(self, subscription_id: str):
+        pass
+
+    @abc.abstractmethod
+    async def list(self) -> typing.List[SubscriptionRecord]:
+        pass
+
+    async def close(self):
+        pass
+
+
+class MemorySubscriptionStore(SubscriptionStore):
+    """Keeps the subscriptions in memory, so they are lost when the process exits"""
+    def __init__(self):
+        self._records = {}
+
+    async def get(self, subscription_id: str) -> typing.Optional[SubscriptionRecord]:
+        return self._records.get(subscription_id)
+
+    async def set(self, record: SubscriptionRecord):
+        self._records[record.id] = record
+
+    async def delete(self, subscription_id: str):
+        self._records.pop(subscription_id, None)
+
+    async def list(self) -> typing.List[SubscriptionRecord]:
+        return list(self._records.values())
+
+
+class SqliteSubscriptionStore(SubscriptionStore):
+    """Keeps the subscriptions in a SQLite database (table 'subscriptions'), queries run in the default executor"""
+    def __init__(self, path: str, table: str = "subscriptions"):
+        if not _TABLE_NAME.match(table):
+            raise ValueError(f"invalid table name '{table}', expected letters, digits and underscores")
+        self._path = path
+        self._table = table
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _execute(self, query: str, parameters: tuple = ()) -> list:
+        with self._lock:
+            if not self._connection:
+                self._connection = sqlite3.connect(self._path, check_same_thread=False)
+                self._connection.execute(f"CREATE TABLE IF NOT EXISTS {self._table} "
+                                         f"(id TEXT PRIMARY KEY, expiration REAL NOT NULL, record TEXT NOT NULL)")
+            with self._connection:
+                return self._connection.execute(query, parameters).fetchall()
+
+    async def _run(self, query: str, parameters: tuple = ()) -> list:
+        return await asyncio.get_event_loop().run_in_executor(None, self._execute, query, parameters)
+
+    async def get(self, subscription_id: str) -> typing.Optional[SubscriptionRecord]:
+        rows = await self._run(f"SELECT record FROM {self._table} WHERE id = ?", (subscription_id,))
+        return SubscriptionRecord.from_dict(json.loads(rows[0][0])) if rows else None
+
+    async def set(self, record: SubscriptionRecord):
+        await self._run(f"INSERT OR REPLACE INTO {self._table} (id, expiration, record) VALUES (?, ?, ?)",
+                        (record.id, record.expiration.timestamp(), json.dumps(record.to_dict())))
+
+    async def delete(self, subscription_id: str):
+        await self._run(f"DELETE FROM {self._table} WHERE id = ?", (subscription_id,))
+
+    async def list(self) -> typing.List[SubscriptionRecord]:
+        rows = await self._run(f"SELECT record FROM {self._table} ORDER BY expiration")
+        return [SubscriptionRecord.from_dict(json.loads(row[0])) for row in rows]
+
+    def _close(self):
+        with self._lock:
+            if self._connection:
+                self._connection.close()
+                self._connection = None
+
+    async def close(self):
+        await asyncio.get_event_loop().run_in_executor(None, self._close)
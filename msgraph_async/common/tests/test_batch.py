@@ -0,0 +1,54 @@
+import unittest
+from msgraph_async.common.batch import BatchRequest
+from msgraph_async.common.constants import *
+
+
+class TestBatchRequest(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    def test_method_is_upper_cased(self):
+        i = BatchRequest("get", [(USERS, "uid")])
+        self.assertEqual(i.method, "GET")
+
+    def test_url_kwargs_are_kept(self):
+        i = BatchRequest("GET", [(USERS, "uid")], odata_query="q")
+        self.assertEqual(i.url_kwargs, {"odata_query": "q"})
+
+    def test_resources_bad_value(self):
+        try:
+            BatchRequest("GET", (USERS, "uid"))
+            self.fail()
+        except ValueError:
+            pass
+
+    def test_version_bad_value(self):
+        try:
+            BatchRequest("GET", [(USERS, "uid")], version="/v2.0")
+            self.fail()
+        except ValueError:
+            pass
+
+    def test_depends_on_bad_value(self):
+        try:
+            BatchRequest("GET", [(USERS, "uid")], depends_on="1")
+            self.fail()
+        except ValueError:
+            pass
+        try:
+            BatchRequest("GET", [(USERS, "uid")], depends_on=[1])
+            self.fail()
+        except ValueError:
+            pass
+
+    def test_request_id_bad_value(self):
+        try:
+            BatchRequest("GET", [(USERS, "uid")], request_id=1)
+            self.fail()
+        except ValueError:
+            pass
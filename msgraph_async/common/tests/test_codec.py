@@ -0,0 +1,47 @@
+import unittest
+from unittest import mock
+from msgraph_async.common import codec
+from msgraph_async.common.codec import JsonCodec, OrjsonCodec, get_codec
+
+
+class TestCodec(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    def test_json_codec_round_trip(self):
+        i = JsonCodec()
+        obj = {"subject": "שלום", "toRecipients": [{"emailAddress": {"address": "a@b.com"}}], "size": 1.5}
+        data = i.dumps(obj)
+        self.assertIsInstance(data, bytes)
+        self.assertEqual(i.loads(data), obj)
+        self.assertEqual(i.loads(data.decode()), obj)
+
+    @unittest.skipIf(codec.orjson is None, "orjson is not installed")
+    def test_orjson_codec_round_trip(self):
+        i = get_codec("orjson")
+        self.assertIsInstance(i, OrjsonCodec)
+        obj = {"value": [{"id": "1", "isRead": False, "body": None}]}
+        self.assertEqual(i.loads(i.dumps(obj)), obj)
+        self.assertEqual(JsonCodec().loads(i.dumps(obj)), obj)
+
+    def test_get_codec(self):
+        self.assertIsInstance(get_codec(), JsonCodec)
+        instance = JsonCodec()
+        self.assertIs(get_codec(instance), instance)
+        self.assertRaises(ValueError, get_codec, "yaml")
+
+    def test_fallback_when_not_installed(self):
+        with mock.patch.object(codec, "orjson", None), mock.patch("logging.log") as log:
+            i = get_codec("orjson")
+        self.assertEqual(type(i), JsonCodec)
+        # the client that asked for the codec logs the fallback, only if its logging is enabled
+        log.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+from msgraph_async.common.delta_state import *
+
+
+class TestDeltaStateStore(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    def get_instances(self):
+        return [
+            MemoryDeltaStateStore(),
+            FileDeltaStateStore(os.path.join(self._directory.name, "state.json")),
+            SqliteDeltaStateStore(os.path.join(self._directory.name, "state.db")),
+        ]
+
+    async def test_set_get_delete(self):
+        for i in self.get_instances():
+            self.assertIsNone(await i.get("users"))
+            await i.set("users", "https://graph.microsoft.com/v1.0/users/delta?$deltatoken=1")
+            await i.set("groups", "https://graph.microsoft.com/v1.0/groups/delta?$deltatoken=1")
+            await i.set("users", "https://graph.microsoft.com/v1.0/users/delta?$deltatoken=2")
+            self.assertEqual(await i.get("users"), "https://graph.microsoft.com/v1.0/users/delta?$deltatoken=2")
+            self.assertEqual(sorted(await i.keys()), ["groups", "users"])
+            await i.delete("groups")
+            await i.delete("missing")
+            self.assertEqual(await i.keys(), ["users"])
+            await i.close()
+
+    async def test_persisted_stores(self):
+        file_path = os.path.join(self._directory.name, "state.json")
+        sqlite_path = os.path.join(self._directory.name, "state.db")
+        for i in (FileDeltaStateStore(file_path), SqliteDeltaStateStore(sqlite_path)):
+            await i.set("users", "link")
+            await i.close()
+        for i in (FileDeltaStateStore(file_path), SqliteDeltaStateStore(sqlite_path)):
+            self.assertEqual(await i.get("users"), "link")
+            await i.close()
+        self.assertEqual(os.listdir(self._directory.name).count("state.json"), 1)
+        self.assertFalse([name for name in os.listdir(self._directory.name) if name.startswith(".delta-state-")])
+
+    def test_sqlite_table_name_is_validated(self):
+        path = os.path.join(self._directory.name, "state.db")
+        SqliteDeltaStateStore(path, table="tenant_1_links")
+        for table in ("links; DROP TABLE users", "1links", "", "delta-links"):
+            self.assertRaises(ValueError, SqliteDeltaStateStore, path, table)
+
+
+if __name__ == '__main__':
+    unittest.main()
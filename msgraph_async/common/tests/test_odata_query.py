@@ -17,6 +17,13 @@ class TestODataQuery(unittest.TestCase):
     def test_empty_odata(self):
         i = self.get_instance()
         self.assertEqual("EMPTY OPEN DATA QUERY", str(i))
+        self.assertTrue(i.is_empty)
+
+    def test_order_by_only(self):
+        i = self.get_instance()
+        i.order_by = OrderBy("receivedDateTime", Order.asc)
+        self.assertFalse(i.is_empty)
+        self.assertEqual("?$orderby=receivedDateTime asc", str(i))
 
     def test_count_set_bad_value(self):
         i = self.get_instance()
@@ -0,0 +1,91 @@
+import json
+import unittest
+from msgraph_async.common.exceptions import GraphClientException
+from msgraph_async.common.codec import JsonCodec
+from msgraph_async.common.page_parser import PageParser
+
+
+class CountingCodec(JsonCodec):
+
+    def __init__(self):
+        self.decoded = []
+
+    def loads(self, data: bytes or str):
+        self.decoded.append(data)
+        return super().loads(data)
+
+
+class TestPageParser(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    @staticmethod
+    def parse(data: bytes, chunk_size: int):
+        i = PageParser()
+        items = []
+        for index in range(0, len(data), chunk_size):
+            items.extend(i.feed(data[index:index + chunk_size]))
+        items.extend(i.close())
+        return items, i.metadata
+
+    def test_parse_page_in_chunks(self):
+        page = {
+            "@odata.context": "https://graph.microsoft.com/v1.0/$metadata#users",
+            "@odata.count": 12345,
+            "value": [{"id": str(index), "displayName": "שלום é \"quoted\" [x] {y}", "n": [index, 1.5, None]}
+                      for index in range(50)],
+            "@odata.nextLink": "https://graph.microsoft.com/v1.0/users?$skiptoken=abc"
+        }
+        data = json.dumps(page, ensure_ascii=False, indent=1).encode()
+        for chunk_size in (1, 7, 64, len(data)):
+            items, metadata = self.parse(data, chunk_size)
+            self.assertEqual(items, page["value"])
+            self.assertEqual(metadata, {key: value for key, value in page.items() if key != "value"})
+
+    def test_items_are_returned_as_soon_as_complete(self):
+        i = PageParser()
+        self.assertEqual(i.feed(b'{"value": [{"id": "1"}, {"id": '), [{"id": "1"}])
+        self.assertEqual(i.feed(b'"2"}'), [{"id": "2"}])
+        self.assertEqual(i.feed(b'], "@odata.deltaLink": "https://delta"}'), [])
+        self.assertTrue(i.done)
+        self.assertEqual(i.close(), [])
+        self.assertEqual(i.metadata, {"@odata.deltaLink": "https://delta"})
+
+    def test_items_are_decoded_once_with_the_codec(self):
+        item = {"id": "1", "body": "\\\"]}" * 10000, "nested": [{"a": "["}, 2.5e3, True]}
+        data = json.dumps({"value": [item, item], "@odata.deltaLink": "https://delta"}).encode()
+        for chunk_size in (1, 3, 1000):
+            codec = CountingCodec()
+            i = PageParser(codec=codec)
+            items = []
+            for index in range(0, len(data), chunk_size):
+                items.extend(i.feed(data[index:index + chunk_size]))
+            items.extend(i.close())
+            self.assertEqual(items, [item, item])
+            # two keys, two items and the value of the delta link
+            self.assertEqual(len(codec.decoded), 5)
+
+    def test_empty_page(self):
+        items, metadata = self.parse(b'{"value": []}', 3)
+        self.assertEqual(items, [])
+        self.assertEqual(metadata, {})
+
+    def test_truncated_page(self):
+        i = PageParser()
+        i.feed(b'{"value": [{"id": "1"}, {"id"')
+        self.assertRaises(GraphClientException, i.close)
+
+    def test_invalid_page(self):
+        i = PageParser()
+        self.assertRaises(GraphClientException, i.feed, b'["value"]')
+        i = PageParser()
+        self.assertRaises(GraphClientException, i.feed, b'{"value": [{"id": "1"} {"id": "2"}]}')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from msgraph_async.common.odata_query import *
+from msgraph_async.common.exceptions import GraphClientException
+from msgraph_async.common.partitions import *
+
+
+class TestPartitions(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    def test_build_prefix_partitions(self):
+        queries = build_prefix_partitions(None, "userPrincipalName", ["a", "'", "#"])
+        self.assertEqual([str(query) for query in queries], [
+            "?$filter=startswith(userPrincipalName, 'a')",
+            "?$filter=startswith(userPrincipalName, '%27%27')",
+            "?$filter=startswith(userPrincipalName, '%23')",
+        ])
+
+    def test_partitions_keep_query(self):
+        query = ODataQuery()
+        query.top = 999
+        query.select = ["id", "userPrincipalName"]
+        query.filter = Filter([Constrain("accountEnabled", LogicalOperator.EQ, "true")])
+        queries = build_prefix_partitions(query, "userPrincipalName", ["a", "b"])
+        self.assertEqual(str(queries[1]), "?$filter=accountEnabled eq true and startswith(userPrincipalName, 'b')"
+                                          "&$select=id,userPrincipalName&$top=999")
+        # the original query is not changed
+        self.assertEqual(len(query.filter.constrains), 1)
+
+    def test_partitions_of_or_filter(self):
+        query = ODataQuery()
+        query.filter = Filter([Constrain("city", LogicalOperator.EQ, "'a'"), Constrain("city", LogicalOperator.EQ, "'b'")],
+                              LogicalConnector.OR)
+        self.assertRaises(GraphClientException, build_prefix_partitions, query, "userPrincipalName", ["a"])
+
+    def test_overlapping_prefixes(self):
+        self.assertRaises(GraphClientException, build_prefix_partitions, None, "mailNickname", ["a", "A"])
+        self.assertRaises(GraphClientException, build_prefix_partitions, None, "mailNickname", ["a", "ab"])
+        self.assertRaises(GraphClientException, build_prefix_partitions, None, "mailNickname", ["a", ""])
+
+    def test_default_prefixes_are_disjoint(self):
+        for prefixes in (USER_PARTITION_PREFIXES, GROUP_PARTITION_PREFIXES):
+            self.assertEqual(len(build_prefix_partitions(None, "mailNickname", prefixes)), len(prefixes))
+
+    def test_time_window_split(self):
+        start = datetime(2021, 1, 1, tzinfo=timezone.utc)
+        i = TimeWindow(start, start + timedelta(hours=1), open_start=True)
+        parts = i.split(4)
+        self.assertEqual([part.start for part in parts], [start + timedelta(minutes=15 * index) for index in range(4)])
+        self.assertEqual(parts[-1].end, i.end)
+        self.assertEqual([part.open_start for part in parts], [True, False, False, False])
+        self.assertFalse(any(part.open_end for part in parts))
+        # parts are never shorter than the minimal duration
+        self.assertEqual(len(i.split(16, timedelta(minutes=20))), 3)
+        self.assertEqual(len(TimeWindow(start, start + timedelta(seconds=2)).split(16)), 2)
+
+    def test_time_window_constrains(self):
+        start = datetime(2021, 1, 1)
+        i = TimeWindow(start, start + timedelta(days=1))
+        query = with_constrains(None, i.get_constrains("receivedDateTime"))
+        self.assertEqual(str(query), "?$filter=receivedDateTime ge 2021-01-01T00:00:00Z "
+                                     "and receivedDateTime lt 2021-01-02T00:00:00Z")
+        i = TimeWindow(start, start + timedelta(days=1), open_start=True, open_end=True)
+        self.assertEqual(i.get_constrains("receivedDateTime"), [])
+        self.assertIsNone(with_constrains(None, []).filter)
+
+    def test_parse_graph_datetime(self):
+        self.assertEqual(parse_graph_datetime("2021-01-01T10:00:00.123Z"),
+                         datetime(2021, 1, 1, 10, tzinfo=timezone.utc))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import base64
+import tempfile
+import unittest
+from unittest import mock
+from msgraph_async.common import quick_xor_hash
+from msgraph_async.common.quick_xor_hash import QuickXorHash, quick_xor_hash_file
+
+
+def reference_quick_xor_hash(data: bytes) -> str:
+    """A direct port of the reference implementation, byte by byte over three 64 bit cells (the last one of 32 bits)"""
+    cells = [0, 0, 0]
+    for index, byte in enumerate(data):
+        shift = index * 11 % 160
+        cell, offset = divmod(shift, 64)
+        bits_in_cell = 32 if cell == 2 else 64
+        cells[cell] ^= (byte << offset) & ((1 << 64) - 1)
+        if offset > bits_in_cell - 8:
+            cells[0 if cell == 2 else cell + 1] ^= byte >> (bits_in_cell - offset)
+    digest = bytearray(cells[0].to_bytes(8, "little") + cells[1].to_bytes(8, "little") +
+                       (cells[2] & 0xffffffff).to_bytes(4, "little"))
+    for index, byte in enumerate(len(data).to_bytes(8, "little")):
+        digest[12 + index] ^= byte
+    return base64.b64encode(bytes(digest)).decode()
+
+
+class TestQuickXorHash(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data = os.urandom(5000)
+
+    def test_empty(self):
+        self.assertEqual(QuickXorHash().b64digest(), "AAAAAAAAAAAAAAAAAAAAAAAAAAA=")
+
+    def test_matches_reference(self):
+        for size in (1, 7, 159, 160, 161, 640, 1000, 5000):
+            self.assertEqual(quick_xor_hash.quick_xor_hash(self.data[:size]),
+                             reference_quick_xor_hash(self.data[:size]), size)
+
+    def test_incremental_updates(self):
+        expected = reference_quick_xor_hash(self.data)
+        for chunk_size in (1, 13, 160, 333, 1024):
+            hasher = QuickXorHash()
+            for offset in range(0, len(self.data), chunk_size):
+                hasher.update(self.data[offset:offset + chunk_size])
+            self.assertEqual(hasher.b64digest(), expected, chunk_size)
+            self.assertEqual(hasher.length, len(self.data))
+
+    def test_without_numpy(self):
+        with mock.patch.object(quick_xor_hash, "numpy", None):
+            self.assertEqual(quick_xor_hash.quick_xor_hash(self.data), reference_quick_xor_hash(self.data))
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "file")
+            with open(path, "wb") as fp:
+                fp.write(self.data)
+            self.assertEqual(quick_xor_hash_file(path, chunk_size=999), reference_quick_xor_hash(self.data))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import json
+import base64
+import hashlib
+import asyncio
+import unittest
+from http import HTTPStatus
+from msgraph_async.common.rate_limiter import AdaptiveRateLimiter, get_tenant_key
+
+
+def make_token(tenant_id):
+    payload = base64.urlsafe_b64encode(json.dumps({"tid": tenant_id}).encode()).decode().rstrip("=")
+    return f"bearer header.{payload}.signature"
+
+
+class TestAdaptiveRateLimiter(unittest.IsolatedAsyncioTestCase):
+
+    def test_tenant_key(self):
+        self.assertEqual(get_tenant_key(make_token("tid1")), "tid1")
+        self.assertEqual(get_tenant_key("bearer opaque"), hashlib.sha256(b"opaque").hexdigest())
+
+    def test_keys(self):
+        i = AdaptiveRateLimiter(per_mailbox=True)
+        headers = {"authorization": make_token("tid1")}
+        keys = i.get_keys(headers, "https://graph.microsoft.com/v1.0/users/UID/messages?$top=5")
+        self.assertEqual(keys, [("tid1", "uid"), ("tid1",)])
+        self.assertEqual(i.get_keys(headers, "https://graph.microsoft.com/v1.0/sites/sid"), [("tid1",)])
+        self.assertEqual(i.get_keys(headers, "https://graph.microsoft.com/v1.0/users/delta"), [("tid1",)])
+        self.assertEqual(i.get_keys(headers, "https://graph.microsoft.com/v1.0/users/$count"), [("tid1",)])
+        self.assertEqual(i.get_keys({}, "https://login.microsoftonline.com/tid1/oauth2/v2.0/token"), [])
+
+    async def test_aimd(self):
+        i = AdaptiveRateLimiter(initial_concurrency=8, decrease_cooldown_sec=0)
+        key = ("tid1",)
+        i.on_response([key], HTTPStatus.TOO_MANY_REQUESTS)
+        self.assertEqual(i.get_limit(key), 4)
+        for _ in range(4):
+            i.on_response([key], HTTPStatus.OK)
+        self.assertTrue(4.9 < i.get_limit(key) < 5.1)
+
+    async def test_decrease_cooldown(self):
+        i = AdaptiveRateLimiter(initial_concurrency=8, decrease_cooldown_sec=60)
+        key = ("tid1",)
+        i.on_response([key], HTTPStatus.TOO_MANY_REQUESTS)
+        i.on_response([key], HTTPStatus.TOO_MANY_REQUESTS)
+        self.assertEqual(i.get_limit(key), 4)
+
+    async def test_concurrency_is_bounded(self):
+        i = AdaptiveRateLimiter(initial_concurrency=2)
+        keys = [("tid1",)]
+        in_flight = 0
+        max_in_flight = 0
+
+        async def request():
+            nonlocal in_flight, max_in_flight
+            await i.acquire(keys)
+            try:
+                in_flight += 1
+                max_in_flight = max(max_in_flight, in_flight)
+                await asyncio.sleep(0.01)
+                in_flight -= 1
+            finally:
+                i.release(keys)
+
+        await asyncio.gather(*(request() for _ in range(10)))
+        self.assertEqual(max_in_flight, 2)
+
+    async def test_weighted_requests_share_the_window(self):
+        i = AdaptiveRateLimiter(initial_concurrency=4)
+        keys = [("tid1",)]
+        in_flight = 0
+        max_in_flight = 0
+
+        async def request(weight):
+            nonlocal in_flight, max_in_flight
+            await i.acquire(keys, weight)
+            try:
+                in_flight += weight
+                max_in_flight = max(max_in_flight, in_flight)
+                await asyncio.sleep(0.01)
+                in_flight -= weight
+            finally:
+                i.release(keys, weight)
+
+        # e.g. a batch of 3 sub-requests leaves room for a single request
+        await asyncio.gather(*(request(weight) for weight in (3, 1, 1, 3, 2, 2, 1)))
+        self.assertEqual(max_in_flight, 4)
+        # a batch larger than the window runs alone
+        max_in_flight = 0
+        await asyncio.gather(*(request(weight) for weight in (1, 6, 1)))
+        self.assertEqual(max_in_flight, 6)
+
+    async def test_retry_after_blocks_key(self):
+        i = AdaptiveRateLimiter()
+        keys = [("tid1",)]
+        i.on_response(keys, HTTPStatus.TOO_MANY_REQUESTS, retry_after=0.2)
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        await i.acquire(keys)
+        i.release(keys)
+        self.assertGreaterEqual(loop.time() - start, 0.15)
+
+    async def test_idle_windows_are_evicted(self):
+        i = AdaptiveRateLimiter(idle_ttl_sec=0.05)
+        for index in range(5):
+            await i.acquire([(f"tid{index}",)])
+            i.release([(f"tid{index}",)])
+        busy = [("busy",)]
+        await i.acquire(busy)
+        self.assertEqual(i.window_count, 6)
+        await asyncio.sleep(0.06)
+        await i.acquire([("tid0",)])
+        i.release([("tid0",)])
+        self.assertEqual(i.window_count, 2)
+        i.release(busy)
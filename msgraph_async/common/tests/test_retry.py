@@ -0,0 +1,78 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from msgraph_async.common.exceptions import *
+from msgraph_async.common.retry import RetryPolicy, RetryBudget
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    @staticmethod
+    def get_error(status, headers=None):
+        return status2exception[status](status, "https://graph.microsoft.com/v1.0/users", {}, headers or {})
+
+    def test_retry_after_seconds(self):
+        i = RetryPolicy()
+        delay = i.get_retry_delay("GET", self.get_error(HTTPStatus.TOO_MANY_REQUESTS, {"Retry-After": "7"}), 0)
+        self.assertEqual(delay, 7)
+
+    def test_retry_after_http_date(self):
+        i = RetryPolicy()
+        retry_at = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+        delay = i.get_retry_delay("GET", self.get_error(HTTPStatus.SERVICE_UNAVAILABLE, {"Retry-After": retry_at}), 0)
+        self.assertTrue(25 < delay <= 30)
+
+    def test_retry_after_too_long(self):
+        i = RetryPolicy(max_retry_after_sec=10)
+        delay = i.get_retry_delay("GET", self.get_error(HTTPStatus.TOO_MANY_REQUESTS, {"Retry-After": "11"}), 0)
+        self.assertIsNone(delay)
+
+    def test_backoff_with_jitter(self):
+        i = RetryPolicy(backoff_base_sec=1, backoff_max_sec=5)
+        for attempt in range(3):
+            delay = i.get_retry_delay("GET", self.get_error(HTTPStatus.INTERNAL_SERVER_ERROR), attempt)
+            self.assertTrue(0 <= delay <= min(5, 2 ** attempt))
+
+    def test_connection_error(self):
+        i = RetryPolicy()
+        self.assertIsNotNone(i.get_retry_delay("GET", asyncio.TimeoutError(), 0))
+        self.assertIsNone(i.get_retry_delay("GET", ValueError(), 0))
+
+    def test_not_retryable_status(self):
+        i = RetryPolicy()
+        self.assertIsNone(i.get_retry_delay("GET", self.get_error(HTTPStatus.NOT_FOUND), 0))
+
+    def test_max_retries(self):
+        i = RetryPolicy(max_retries=2)
+        self.assertIsNotNone(i.get_retry_delay("GET", self.get_error(HTTPStatus.GATEWAY_TIMEOUT), 1))
+        self.assertIsNone(i.get_retry_delay("GET", self.get_error(HTTPStatus.GATEWAY_TIMEOUT), 2))
+
+    def test_unsafe_method(self):
+        i = RetryPolicy()
+        error = self.get_error(HTTPStatus.TOO_MANY_REQUESTS)
+        self.assertIsNone(i.get_retry_delay("POST", error, 0))
+        self.assertIsNotNone(i.get_retry_delay("POST", error, 0, allow_unsafe=True))
+        self.assertIsNotNone(RetryPolicy(retry_unsafe_methods=True).get_retry_delay("POST", error, 0))
+
+    def test_budget(self):
+        i = RetryBudget(ratio=0.5, min_retries_per_sec=0, ttl_sec=10)
+        for _ in range(4):
+            i.record_request()
+        self.assertTrue(i.try_spend())
+        self.assertTrue(i.try_spend())
+        self.assertFalse(i.try_spend())
+
+    def test_budget_exhausted_stops_retries(self):
+        i = RetryPolicy(budget_ratio=0, budget_min_retries_per_sec=0.1, budget_ttl_sec=10)
+        budget = i.create_budget()
+        error = self.get_error(HTTPStatus.SERVICE_UNAVAILABLE)
+        self.assertIsNotNone(i.get_retry_delay("GET", error, 0, budget))
+        self.assertIsNone(i.get_retry_delay("GET", error, 0, budget))
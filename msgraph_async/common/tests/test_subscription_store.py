@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from msgraph_async.common.constants import SubscriptionResources
+from msgraph_async.common.subscription_store import *
+
+
+class TestSubscriptionStore(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    def get_instances(self):
+        return [
+            MemorySubscriptionStore(),
+            SqliteSubscriptionStore(os.path.join(self._directory.name, "subscriptions.db")),
+        ]
+
+    @staticmethod
+    def get_record(subscription_id, day=1):
+        return SubscriptionRecord(subscription_id, SubscriptionResources.Inbox, "created", "https://hook/notify",
+                                  4230, datetime(2021, 1, day, 10, 30), user_id="uid", client_state="secret")
+
+    async def test_set_get_delete_list(self):
+        for i in self.get_instances():
+            self.assertIsNone(await i.get("s1"))
+            await i.set(self.get_record("s1", day=3))
+            await i.set(self.get_record("s2", day=2))
+            await i.set(self.get_record("s1", day=4))
+            record = await i.get("s1")
+            self.assertEqual(record.resource, SubscriptionResources.Inbox)
+            self.assertEqual(record.expiration, datetime(2021, 1, 4, 10, 30, tzinfo=timezone.utc))
+            self.assertEqual((record.user_id, record.client_state, record.minutes_to_expiration),
+                             ("uid", "secret", 4230))
+            self.assertEqual(sorted(record.id for record in await i.list()), ["s1", "s2"])
+            await i.delete("s2")
+            await i.delete("missing")
+            self.assertEqual([record.id for record in await i.list()], ["s1"])
+            await i.close()
+
+    async def test_persisted_store(self):
+        path = os.path.join(self._directory.name, "subscriptions.db")
+        i = SqliteSubscriptionStore(path)
+        await i.set(self.get_record("s1"))
+        await i.close()
+        i = SqliteSubscriptionStore(path)
+        self.assertEqual(repr(await i.get("s1")), repr(self.get_record("s1")))
+        await i.close()
+
+    def test_sqlite_table_name_is_validated(self):
+        path = os.path.join(self._directory.name, "subscriptions.db")
+        SqliteSubscriptionStore(path, table="Subscriptions_2")
+        for table in ("subscriptions WHERE 1=1 --", "2subscriptions", ""):
+            self.assertRaises(ValueError, SqliteSubscriptionStore, path, table)
+
+
+if __name__ == '__main__':
+    unittest.main()
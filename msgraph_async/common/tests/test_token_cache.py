@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+from msgraph_async.common.exceptions import GraphClientException
+from msgraph_async.common.token_cache import TokenCache
+
+
+class TestTokenCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self._calls = []
+        self._expires_in = 3600
+        self._fail = False
+
+    async def acquire(self, app_id, app_secret, tenant_id):
+        self._calls.append((app_id, app_secret, tenant_id))
+        await asyncio.sleep(0.01)
+        if self._fail:
+            raise GraphClientException("token endpoint is down")
+        return {"access_token": f"{tenant_id}-{len(self._calls)}", "expires_in": self._expires_in}, 200
+
+    def get_instance(self, refresh_ahead_sec=300, refresh_retry_sec=30):
+        i = TokenCache(self.acquire, refresh_ahead_sec, refresh_retry_sec=refresh_retry_sec)
+        i.add_app("app", "secret")
+        return i
+
+    async def test_single_flight(self):
+        i = self.get_instance()
+        tokens = await asyncio.gather(*(i.get_token("app", "tid") for _ in range(10)))
+        self.assertEqual(set(tokens), {"tid-1"})
+        self.assertEqual(self._calls, [("app", "secret", "tid")])
+
+    async def test_keyed_by_tenant(self):
+        i = self.get_instance()
+        self.assertEqual(await i.get_token("app", "tid1"), "tid1-1")
+        self.assertEqual(await i.get_token("app", "tid2"), "tid2-2")
+        self.assertEqual(await i.get_token("app", "tid1"), "tid1-1")
+
+    async def test_refresh_ahead_of_expiry_in_background(self):
+        self._expires_in = 1
+        i = self.get_instance(refresh_ahead_sec=0.9)
+        self.assertEqual(await i.get_token("app", "tid"), "tid-1")
+        await asyncio.sleep(0.6)
+        # inside the refresh window the current token is returned while a new one is acquired
+        self.assertEqual(await i.get_token("app", "tid"), "tid-1")
+        await asyncio.sleep(0.05)
+        self.assertEqual(await i.get_token("app", "tid"), "tid-2")
+
+    async def test_failed_background_refresh_backs_off(self):
+        self._expires_in = 1
+        i = self.get_instance(refresh_ahead_sec=0.9, refresh_retry_sec=0.2)
+        self.assertEqual(await i.get_token("app", "tid"), "tid-1")
+        await asyncio.sleep(0.6)
+        self._fail = True
+        self.assertEqual(await i.get_token("app", "tid"), "tid-1")
+        await asyncio.sleep(0.05)
+        # the refresh failed, the token endpoint isn't called again until the backoff passes
+        tokens = await asyncio.gather(*(i.get_token("app", "tid") for _ in range(10)))
+        self.assertEqual(set(tokens), {"tid-1"})
+        self.assertEqual(len(self._calls), 2)
+        self._fail = False
+        await asyncio.sleep(0.2)
+        self.assertEqual(await i.get_token("app", "tid"), "tid-1")
+        await asyncio.sleep(0.05)
+        self.assertEqual(await i.get_token("app", "tid"), "tid-3")
+
+    async def test_expired_token_waits_for_refresh(self):
+        self._expires_in = 0.1
+        i = self.get_instance(refresh_ahead_sec=0)
+        self.assertEqual(await i.get_token("app", "tid"), "tid-1")
+        await asyncio.sleep(0.15)
+        self.assertEqual(await i.get_token("app", "tid"), "tid-2")
+
+    async def test_unknown_app(self):
+        i = self.get_instance()
+        with self.assertRaises(GraphClientException):
+            await i.get_token("other-app", "tid")
@@ -0,0 +1,102 @@
+import time
+import asyncio
+import logging
+import typing
+from msgraph_async.common.exceptions import GraphClientException
+
+
+class CachedToken:
+
+    def __init__(self, access_token: str, expires_in: float, refresh_ahead_sec: float):
+        now = time.monotonic()
+        self.access_token = access_token
+        self.expires_at = now + expires_in
+        # refresh ahead of the real expiry, but never in the first half of the token lifetime
+        self.refresh_at = now + max(expires_in / 2, expires_in - refresh_ahead_sec)
+
+    @property
+    def is_expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    @property
+    def should_refresh(self) -> bool:
+        return time.monotonic() >= self.refresh_at
+
+
+class TokenCache:
+    """
+    Access tokens of many tenants, keyed by (app id, tenant id).
+    Tokens are refreshed lazily: the first use after the refresh window (refresh_ahead_sec before the real expiry,
+    as reported by the token endpoint in 'expires_in') starts a refresh in the background and keeps using the
+    current token until it expires.
+    Concurrent callers that need the same token share a single in-flight request to the token endpoint.
+    A background refresh that failed is not tried again for refresh_retry_sec (the current token is used meanwhile),
+    so a failing token endpoint isn't called on every use of the token.
+    :param acquire: coroutine function (app_id, app_secret, tenant_id) -> (token content, status)
+    """
+    def __init__(self, acquire: typing.Callable, refresh_ahead_sec: float = 300, enable_logging: bool = False,
+                 refresh_retry_sec: float = 30):
+        self._acquire = acquire
+        self.refresh_ahead_sec = refresh_ahead_sec
+        self.refresh_retry_sec = refresh_retry_sec
+        self._enable_logging = enable_logging
+        self._credentials = {}
+        self._tokens = {}
+        self._in_flight = {}
+        self._failed_at = {}
+
+    @property
+    def app_ids(self) -> typing.List[str]:
+        return list(self._credentials)
+
+    def add_app(self, app_id: str, app_secret: str):
+        self._credentials[app_id] = app_secret
+
+    def invalidate(self, app_id: str, tenant_id: str):
+        self._tokens.pop((app_id, tenant_id), None)
+
+    def peek(self, app_id: str, tenant_id: str) -> typing.Optional[str]:
+        """The cached token (if any) without refreshing it"""
+        cached = self._tokens.get((app_id, tenant_id))
+        return cached.access_token if cached else None
+
+    async def get_token(self, app_id: str, tenant_id: str) -> str:
+        key = (app_id, tenant_id)
+        cached: CachedToken = self._tokens.get(key)
+        if cached and not cached.should_refresh:
+            return cached.access_token
+
+        background = cached is not None and not cached.is_expired
+        task = self._in_flight.get(key)
+        if not task:
+            failed_at = self._failed_at.get(key)
+            if background and failed_at is not None and time.monotonic() - failed_at < self.refresh_retry_sec:
+                return cached.access_token
+            task = self._in_flight[key] = asyncio.ensure_future(self._refresh(app_id, tenant_id))
+            task.add_done_callback(lambda done: self._on_refresh_done(key, done, background))
+
+        if background:
+            # refresh ahead in the background, the current token is still valid
+            return cached.access_token
+        return await asyncio.shield(task)
+
+    def _on_refresh_done(self, key: typing.Tuple[str, str], task: asyncio.Task, background: bool):
+        self._in_flight.pop(key, None)
+        if task.cancelled():
+            return
+        if task.exception():
+            self._failed_at[key] = time.monotonic()
+            if background and self._enable_logging:
+                logging.log(logging.ERROR, f"exception while refreshing token ahead of expiry: {str(task.exception())}")
+        else:
+            self._failed_at.pop(key, None)
+
+    async def _refresh(self, app_id: str, tenant_id: str) -> str:
+        if app_id not in self._credentials:
+            raise GraphClientException(f"app '{app_id}' was not added to the token cache")
+        content, status = await self._acquire(app_id, self._credentials[app_id], tenant_id)
+        cached = CachedToken(content["access_token"], float(content.get("expires_in", 3599)), self.refresh_ahead_sec)
+        self._tokens[(app_id, tenant_id)] = cached
+        if self._enable_logging:
+            logging.log(logging.INFO, f"token of tenant {tenant_id} has been refreshed")
+        return cached.access_token
@@ -0,0 +1,4 @@
+from .notification import *
+from .receiver import NotificationReceiver, ReceiverMetrics
+from .decryption import NotificationDecryptor
+from .coalescer import NotificationCoalescer, EnrichedNotification
@@ -0,0 +1,212 @@
+import re
+import asyncio
+import logging
+import typing
+from collections import deque
+from msgraph_async.common.constants import USERS, MAILS, MAX_BATCH_REQUESTS
+from msgraph_async.common.exceptions import GraphClientException
+from msgraph_async.common.odata_query import ODataQuery
+from msgraph_async.common.batch import BatchRequest
+from msgraph_async.notifications.notification import Notification
+
+DELETED = "deleted"
+
+
+def parse_mail_resource(notification: Notification) -> typing.Tuple[str, str]:
+    """The (user id, message id) a mail notification is of, e.g. of resource 'Users/{id}/Messages/{id}'"""
+    parts = re.sub(r"\('([^']*)'\)", r"/\1", notification.resource or "").strip("/").split("/")
+    lowered = [part.lower() for part in parts]
+    if USERS.strip("/") not in lowered[:-1]:
+        raise GraphClientException(f"notification resource '{notification.resource}' is not of a user's mailbox")
+    user_id = parts[lowered.index(USERS.strip("/")) + 1]
+    return user_id, notification.resource_id or parts[-1]
+
+
+class EnrichedNotification:
+    """
+    The notifications of a single message that were received within the same window, along with the message as
+    fetched once after them ('resource', None if it was deleted or couldn't be fetched, see 'error')
+    """
+    def __init__(self, user_id: str, resource_id: str, notifications: typing.List[Notification]):
+        self.user_id = user_id
+        self.resource_id = resource_id
+        self.notifications = notifications
+        self.resource = None
+        self.error = None
+
+    def __repr__(self):
+        return f"EnrichedNotification({self.user_id}, {self.resource_id}, {self.change_types})"
+
+    @property
+    def change_types(self) -> typing.List[str]:
+        """The change types of the notifications, by the order they were received"""
+        return [notification.change_type for notification in self.notifications]
+
+    @property
+    def is_deleted(self) -> bool:
+        return self.notifications[-1].change_type == DELETED
+
+
+class NotificationCoalescer:
+    """
+    Turns a stream of mail notifications into a stream of fetched messages, with a single GET per message however
+    many notifications it had.
+    Notifications are held per mailbox for up to window_sec after the first pending one: notifications of a message
+    that is already pending are merged into it, and once the window ends (or max_pending messages of the mailbox are
+    pending) the pending messages are fetched together in $batch calls, with the $select of 'select'.
+    Messages whose last notification is 'deleted' are handed on without being fetched.
+    Consume the results (EnrichedNotification) with get() or by iterating the coalescer.
+    Up to max_flushes flushed mailboxes are fetched (and wait to hand on their results) at a time, further flushes
+    wait for one of them to end. put() and consume() wait while max_flushes flushes are waiting too, so a slow
+    consumer of the results slows down the source of the notifications (e.g. the queue of a NotificationReceiver
+    fills up and its requests are answered with 503) instead of piling up fetched messages.
+    :param client: GraphAdminClient
+    :param max_pending: most messages of a mailbox that are held before they are fetched (at most MAX_BATCH_REQUESTS)
+    :param concurrency: how many fetches are sent at the same time
+    :param max_flushes: how many flushed mailboxes are in flight (being fetched or handed on) at the same time
+    :param max_output: how many results can wait to be consumed, fetching waits while they are not
+    :param kwargs: key-word arguments of every call (e.g. token or tenant_id)
+    """
+    def __init__(self, client, window_sec: float = 2.0, max_pending: int = MAX_BATCH_REQUESTS,
+                 select: typing.List[str] = None, concurrency: int = 4, max_flushes: int = 16,
+                 max_output: int = 1000, **kwargs):
+        if not 0 < max_pending <= MAX_BATCH_REQUESTS:
+            raise ValueError(f"max pending must be between 1 and {MAX_BATCH_REQUESTS}")
+        if concurrency < 1 or max_flushes < 1:
+            raise ValueError("concurrency and max flushes must be positive")
+        self._client = client
+        self._window_sec = window_sec
+        self._max_pending = max_pending
+        self._query = None
+        if select:
+            self._query = ODataQuery()
+            self._query.select = list(select)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._max_flushes = max_flushes
+        self._kwargs = kwargs
+        self._pending = {}
+        self._timers = {}
+        self._flushed = deque()
+        self._room = asyncio.Event()
+        self._room.set()
+        self._tasks = set()
+        self._output = asyncio.Queue(maxsize=max_output)
+        self.received = 0
+        self.coalesced = 0
+        self.fetched = 0
+
+    def _log(self, level, msg):
+        self._client._log(level, msg)
+
+    def add(self, notification: Notification or dict):
+        """Hold a notification until its mailbox is fetched, without waiting for room (see put)"""
+        if not isinstance(notification, Notification):
+            notification = Notification(notification)
+        self.received += 1
+        user_id, resource_id = parse_mail_resource(notification)
+        pending = self._pending.setdefault(user_id, {})
+        if resource_id in pending:
+            self.coalesced += 1
+            pending[resource_id].notifications.append(notification)
+            return
+        pending[resource_id] = EnrichedNotification(user_id, resource_id, [notification])
+        if len(pending) >= self._max_pending:
+            self._flush(user_id)
+        elif len(pending) == 1:
+            self._timers[user_id] = asyncio.get_event_loop().call_later(self._window_sec, self._flush, user_id)
+
+    async def put(self, notification: Notification or dict):
+        """Hold a notification, once there is room for it (max_flushes flushes at most are waiting to start)"""
+        await self._room.wait()
+        self.add(notification)
+
+    async def consume(self, notifications: typing.AsyncIterable[Notification]):
+        """
+        Add all the notifications of a source, e.g. a NotificationReceiver (until it ends or this is cancelled).
+        The source is read only while there is room for its notifications.
+        """
+        async for notification in notifications:
+            try:
+                await self.put(notification)
+            except GraphClientException as e:
+                self._log(logging.WARNING, f"skipping notification: {e.message}")
+
+    def _flush(self, user_id: str):
+        timer = self._timers.pop(user_id, None)
+        if timer:
+            timer.cancel()
+        pending = self._pending.pop(user_id, None)
+        if pending:
+            self._flushed.append((user_id, list(pending.values())))
+            self._start_flushes()
+
+    def _start_flushes(self):
+        while self._flushed and len(self._tasks) < self._max_flushes:
+            user_id, entries = self._flushed.popleft()
+            task = asyncio.ensure_future(self._fetch(user_id, entries))
+            self._tasks.add(task)
+            task.add_done_callback(self._on_flush_done)
+        if len(self._flushed) < self._max_flushes:
+            self._room.set()
+        else:
+            self._room.clear()
+
+    def _on_flush_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        self._start_flushes()
+
+    async def _fetch(self, user_id: str, entries: typing.List[EnrichedNotification]):
+        to_fetch = [entry for entry in entries if not entry.is_deleted]
+        if to_fetch:
+            async with self._semaphore:
+                await self._fetch_resources(user_id, to_fetch)
+        for entry in entries:
+            await self._output.put(entry)
+
+    async def _fetch_resources(self, user_id: str, entries: typing.List[EnrichedNotification]):
+        try:
+            if len(entries) == 1:
+                results = [await self._client.get_mail(user_id, entries[0].resource_id, odata_query=self._query,
+                                                       **self._kwargs)]
+            else:
+                requests = [BatchRequest("GET", [(USERS, user_id), (MAILS, entry.resource_id)],
+                                         odata_query=self._query) for entry in entries]
+                results = await self._client.batch(requests, **self._kwargs)
+        except Exception as e:
+            self._log(logging.ERROR, f"exception while fetching {len(entries)} messages of {user_id}: {str(e)}")
+            results = [e] * len(entries)
+        for entry, result in zip(entries, results):
+            if isinstance(result, Exception):
+                entry.error = result
+            else:
+                entry.resource, status = result
+                self.fetched += 1
+
+    async def flush(self):
+        """
+        Fetch everything that is currently held, without waiting for the window to end, and wait until all of it was
+        handed on. Results wait in the output until they are consumed, so unless they fit in max_output, consume them
+        concurrently (e.g. from another task) or this never returns.
+        """
+        for user_id in list(self._pending):
+            self._flush(user_id)
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def get(self) -> EnrichedNotification:
+        return await self._output.get()
+
+    async def __aiter__(self) -> typing.AsyncIterator[EnrichedNotification]:
+        while True:
+            yield await self.get()
+
+    async def close(self):
+        """Drop what is held and cancel in-flight fetches"""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        self._pending.clear()
+        self._flushed.clear()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
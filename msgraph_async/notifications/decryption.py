@@ -0,0 +1,134 @@
+import os
+import hmac
+import json
+import base64
+import hashlib
+import asyncio
+import threading
+import typing
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from msgraph_async.common.exceptions import GraphClientException
+from msgraph_async.notifications.notification import Notification
+
+try:
+    from cryptography.hazmat.primitives import hashes, serialization, padding as symmetric_padding
+    from cryptography.hazmat.primitives.asymmetric import padding
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    serialization = None
+
+# the id create_subscription gives the encryption certificate
+DEFAULT_CERTIFICATE_ID = "CertificateId"
+
+# private keys loaded by this process (a worker of a process pool loads each key once), by the digest of their pem
+_loaded_keys = {}
+_loaded_keys_lock = threading.Lock()
+
+
+def _load_private_key(private_key_pem: bytes, password: typing.Optional[bytes]):
+    digest = hashlib.sha256(private_key_pem).digest()
+    with _loaded_keys_lock:
+        key = _loaded_keys.get(digest)
+    if key is None:
+        key = serialization.load_pem_private_key(private_key_pem, password)
+        with _loaded_keys_lock:
+            _loaded_keys[digest] = key
+    return key
+
+
+def decrypt_content(encrypted_content: dict, private_key_pem: bytes = None, password: bytes = None,
+                    symmetric_key: bytes = None) -> typing.Tuple[bytes, dict]:
+    """
+    Decrypt the encryptedContent of a notification: unwrap its symmetric key with the private key (RSA-OAEP), unless
+    symmetric_key is given, verify the HMAC-SHA256 signature of the data and decrypt it (AES-CBC, the iv is the
+    first 16 bytes of the key).
+    It is a module level function, so it can run in a process pool.
+    :return: (symmetric key, decrypted resource data)
+    """
+    if serialization is None:
+        raise ImportError("cryptography is not installed")
+    if symmetric_key is None:
+        private_key = _load_private_key(private_key_pem, password)
+        symmetric_key = private_key.decrypt(base64.b64decode(encrypted_content["dataKey"]), padding.OAEP(
+            mgf=padding.MGF1(algorithm=hashes.SHA1()), algorithm=hashes.SHA1(), label=None))
+    data = base64.b64decode(encrypted_content["data"])
+    signature = hmac.new(symmetric_key, data, hashlib.sha256).digest()
+    if not hmac.compare_digest(signature, base64.b64decode(encrypted_content["dataSignature"])):
+        raise GraphClientException("signature of the encrypted content doesn't match, it may have been tampered with")
+    decryptor = Cipher(algorithms.AES(symmetric_key), modes.CBC(symmetric_key[:16])).decryptor()
+    padded = decryptor.update(data) + decryptor.finalize()
+    unpadder = symmetric_padding.PKCS7(128).unpadder()
+    return symmetric_key, json.loads(unpadder.update(padded) + unpadder.finalize())
+
+
+class NotificationDecryptor:
+    """
+    Decrypts the resource data of notifications of subscriptions that include it (e.g. TenantChats), off the event
+    loop: the RSA and AES work runs in 'executor', a thread pool by default (the cryptography library releases the
+    GIL while it works), or e.g. a ProcessPoolExecutor to spread a burst of notifications over all cores.
+    Unwrapped symmetric keys are cached (by their wrapped value), so a key that is sent again is unwrapped once.
+    Requires the cryptography package.
+    :param private_keys: the pem of the private key of every encryption certificate, by the certificate id
+    :param password: password of the private keys, if they are encrypted
+    :param key_cache_size: how many symmetric keys are cached
+    """
+    def __init__(self, private_keys: typing.Dict[str, bytes or str], password: bytes = None,
+                 executor: Executor = None, key_cache_size: int = 1024):
+        if serialization is None:
+            raise ImportError("cryptography is not installed, it is required for decrypting notifications")
+        self._private_keys = {certificate_id: key.encode() if isinstance(key, str) else key
+                              for certificate_id, key in private_keys.items()}
+        self._password = password
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=os.cpu_count() or 4)
+        self._key_cache_size = key_cache_size
+        self._symmetric_keys = OrderedDict()
+
+    def _get_cached_key(self, data_key: str) -> typing.Optional[bytes]:
+        key = self._symmetric_keys.get(data_key)
+        if key is not None:
+            self._symmetric_keys.move_to_end(data_key)
+        return key
+
+    def _cache_key(self, data_key: str, key: bytes):
+        self._symmetric_keys[data_key] = key
+        self._symmetric_keys.move_to_end(data_key)
+        while len(self._symmetric_keys) > self._key_cache_size:
+            self._symmetric_keys.popitem(last=False)
+
+    async def decrypt(self, notification: Notification or dict) -> dict:
+        """:return: the decrypted resource data of a notification (raw, or of its encryptedContent)"""
+        if not isinstance(notification, Notification):
+            notification = Notification({"encryptedContent": notification} if "dataKey" in notification
+                                        else notification)
+        encrypted_content = notification.encrypted_content
+        if not encrypted_content:
+            raise GraphClientException("notification has no encrypted content")
+        certificate_id = encrypted_content.get("encryptionCertificateId", DEFAULT_CERTIFICATE_ID)
+        private_key_pem = self._private_keys.get(certificate_id)
+        if private_key_pem is None:
+            raise GraphClientException(f"no private key of encryption certificate '{certificate_id}'")
+        data_key = encrypted_content["dataKey"]
+        cached_key = self._get_cached_key(data_key)
+        symmetric_key, resource_data = await asyncio.get_event_loop().run_in_executor(
+            self._executor, decrypt_content, encrypted_content, None if cached_key else private_key_pem,
+            self._password, cached_key)
+        if cached_key is None:
+            self._cache_key(data_key, symmetric_key)
+        return resource_data
+
+    async def decrypt_many(self, notifications: typing.List[Notification or dict]) -> typing.List[dict or Exception]:
+        """Decrypt notifications concurrently, each item is the resource data or the exception of its notification"""
+        return await asyncio.gather(*[self.decrypt(notification) for notification in notifications],
+                                    return_exceptions=True)
+
+    def close(self):
+        if self._own_executor:
+            self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
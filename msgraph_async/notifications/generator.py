@@ -0,0 +1,67 @@
+import uuid
+import asyncio
+import typing
+import aiohttp
+from datetime import datetime, timedelta
+
+
+def build_notification(subscription_id: str, client_state: str = None, change_type: str = "created",
+                       user_id: str = None, resource_id: str = None, tenant_id: str = None,
+                       lifecycle_event: str = None) -> dict:
+    """A notification shaped like the ones the service sends for a Mailbox subscription (for local testing)"""
+    resource_id = resource_id or str(uuid.uuid4())
+    user_id = user_id or str(uuid.uuid4())
+    expiration = datetime.utcnow() + timedelta(days=2)
+    notification = {
+        "subscriptionId": subscription_id,
+        "subscriptionExpirationDateTime": expiration.strftime("%Y-%m-%dT%H:%M:%S.0000000Z"),
+        "changeType": change_type,
+        "resource": f"Users/{user_id}/Messages/{resource_id}",
+        "resourceData": {
+            "@odata.type": "#Microsoft.Graph.Message",
+            "@odata.id": f"Users/{user_id}/Messages/{resource_id}",
+            "id": resource_id,
+        },
+        "tenantId": tenant_id or str(uuid.uuid4()),
+    }
+    if client_state is not None:
+        notification["clientState"] = client_state
+    if lifecycle_event:
+        notification["lifecycleEvent"] = lifecycle_event
+    return notification
+
+
+async def post_notifications(url: str, notifications: typing.List[dict], per_request: int = 1,
+                             concurrency: int = 16, session: aiohttp.ClientSession = None) -> typing.List[int]:
+    """
+    Post notifications to a receiver the way the service does (up to per_request notifications per request),
+    up to 'concurrency' requests at a time, e.g. to load test a NotificationReceiver locally
+    :return: the status of every request, by their order
+    """
+    own_session = session is None
+    session = session or aiohttp.ClientSession()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def post(chunk):
+        async with semaphore:
+            async with session.post(url, json={"value": chunk}) as resp:
+                return resp.status
+
+    try:
+        return await asyncio.gather(*[post(notifications[index:index + per_request])
+                                      for index in range(0, len(notifications), per_request)])
+    finally:
+        if own_session:
+            await session.close()
+
+
+async def validate(url: str, validation_token: str, session: aiohttp.ClientSession = None) -> typing.Tuple[int, str]:
+    """Send the validation request the service sends when a subscription is created, returns (status, body)"""
+    own_session = session is None
+    session = session or aiohttp.ClientSession()
+    try:
+        async with session.post(url, params={"validationToken": validation_token}) as resp:
+            return resp.status, await resp.text()
+    finally:
+        if own_session:
+            await session.close()
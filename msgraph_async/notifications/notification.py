@@ -0,0 +1,65 @@
+import typing
+from datetime import datetime
+from msgraph_async.common.partitions import parse_graph_datetime
+
+# lifecycle events, sent to the lifecycleNotificationUrl of a subscription
+SUBSCRIPTION_REMOVED = "subscriptionRemoved"
+MISSED = "missed"
+REAUTHORIZATION_REQUIRED = "reauthorizationRequired"
+
+
+class Notification:
+    """
+    A single change (or lifecycle) notification, as received from the service.
+    The notification as sent is available as 'raw', its common properties are exposed as attributes.
+    """
+    def __init__(self, raw: dict):
+        self.raw = raw
+
+    def __repr__(self):
+        kind = self.lifecycle_event or self.change_type
+        return f"Notification({self.subscription_id}, {kind}, {self.resource})"
+
+    @property
+    def subscription_id(self) -> str:
+        return self.raw.get("subscriptionId")
+
+    @property
+    def client_state(self) -> typing.Optional[str]:
+        return self.raw.get("clientState")
+
+    @property
+    def tenant_id(self) -> typing.Optional[str]:
+        return self.raw.get("tenantId")
+
+    @property
+    def change_type(self) -> typing.Optional[str]:
+        return self.raw.get("changeType")
+
+    @property
+    def resource(self) -> typing.Optional[str]:
+        return self.raw.get("resource")
+
+    @property
+    def resource_data(self) -> dict:
+        return self.raw.get("resourceData") or {}
+
+    @property
+    def resource_id(self) -> typing.Optional[str]:
+        """Id of the changed resource (e.g. of the message)"""
+        return self.resource_data.get("id")
+
+    @property
+    def subscription_expiration(self) -> typing.Optional[datetime]:
+        value = self.raw.get("subscriptionExpirationDateTime")
+        return parse_graph_datetime(value) if value else None
+
+    @property
+    def lifecycle_event(self) -> typing.Optional[str]:
+        """subscriptionRemoved, missed or reauthorizationRequired, None for a change notification"""
+        return self.raw.get("lifecycleEvent")
+
+    @property
+    def encrypted_content(self) -> typing.Optional[dict]:
+        """Encrypted resource data of subscriptions that include resource data"""
+        return self.raw.get("encryptedContent")
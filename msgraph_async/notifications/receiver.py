@@ -0,0 +1,180 @@
+import hmac
+import time
+import asyncio
+import logging
+import typing
+from http import HTTPStatus
+from aiohttp import web
+from msgraph_async.notifications.notification import Notification
+
+VALIDATION_TOKEN_PARAM = "validationToken"
+DEFAULT_NOTIFICATION_PATH = "/notifications"
+DEFAULT_LIFECYCLE_PATH = "/lifecycle"
+
+
+class ReceiverMetrics:
+    """Counters of a NotificationReceiver, and the state of its queue"""
+    def __init__(self, queue: asyncio.Queue):
+        self._queue = queue
+        self.requests = 0
+        self.validations = 0
+        self.received = 0
+        self.enqueued = 0
+        self.lifecycle_events = 0
+        self.rejected = 0
+        self.throttled_requests = 0
+        self.bad_requests = 0
+        self.max_queue_size_seen = 0
+        self.max_handling_sec = 0.0
+
+    @property
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def queue_capacity(self) -> int:
+        return self._queue.maxsize
+
+    def as_dict(self) -> dict:
+        metrics = {key: value for key, value in vars(self).items() if not key.startswith("_")}
+        metrics.update(queue_size=self.queue_size, queue_capacity=self.queue_capacity)
+        return metrics
+
+
+class NotificationReceiver:
+    """
+    The receiving side of subscriptions: an aiohttp application that answers the validation handshake of new
+    subscriptions, and queues the change and lifecycle notifications it receives.
+    Requests are answered as soon as their notifications were queued (without waiting for them to be handled),
+    so the service gets its response within milliseconds. Consume the notifications with get() or by iterating the
+    receiver (async for notification in receiver).
+    Notifications whose clientState doesn't match (compared in constant time) are dropped. When the queue has no room
+    for all the notifications of a request, the request is answered with 503 and Retry-After, and the service sends
+    it again later.
+    Usage: receiver.add_routes(app) on an existing aiohttp application, or await receiver.start(host, port).
+    :param client_state: the clientState (or the list of clientStates) of the subscriptions, None to accept any
+    :param max_queue_size: how many notifications can wait to be handled
+    :param retry_after_sec: Retry-After of requests that found the queue full
+    """
+    def __init__(self, client_state: str or typing.List[str] = None,
+                 notification_path: str = DEFAULT_NOTIFICATION_PATH, lifecycle_path: str = DEFAULT_LIFECYCLE_PATH,
+                 max_queue_size: int = 10000, retry_after_sec: int = 5, enable_logging: bool = False):
+        if max_queue_size < 1:
+            raise ValueError("max queue size must be positive")
+        states = [client_state] if isinstance(client_state, str) else client_state
+        self._client_states = [state.encode() for state in states] if states is not None else None
+        self._notification_path = notification_path
+        self._lifecycle_path = lifecycle_path
+        self._retry_after_sec = retry_after_sec
+        self._enable_logging = enable_logging
+        self._queue = asyncio.Queue(maxsize=max_queue_size)
+        self._metrics = ReceiverMetrics(self._queue)
+        self._runner = None
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        return self._queue
+
+    @property
+    def metrics(self) -> ReceiverMetrics:
+        return self._metrics
+
+    def _log(self, level, msg):
+        if self._enable_logging:
+            logging.log(level, msg)
+
+    def _is_client_state_valid(self, client_state: typing.Optional[str]) -> bool:
+        if self._client_states is None:
+            return True
+        received = (client_state or "").encode()
+        valid = False
+        # every known state is compared, so the time taken doesn't tell which of them was close
+        for expected in self._client_states:
+            valid |= hmac.compare_digest(received, expected)
+        return valid
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        started = time.monotonic()
+        self._metrics.requests += 1
+        try:
+            return await self._respond(request)
+        finally:
+            self._metrics.max_handling_sec = max(self._metrics.max_handling_sec, time.monotonic() - started)
+
+    async def _respond(self, request: web.Request) -> web.Response:
+        validation_token = request.query.get(VALIDATION_TOKEN_PARAM)
+        if validation_token is not None:
+            self._metrics.validations += 1
+            return web.Response(status=HTTPStatus.OK, text=validation_token, content_type="text/plain")
+
+        try:
+            notifications = (await request.json())["value"]
+            if not isinstance(notifications, list):
+                raise ValueError("value is not a list")
+        except (ValueError, KeyError, TypeError) as e:
+            self._metrics.bad_requests += 1
+            self._log(logging.WARNING, f"bad notifications request: {str(e)}")
+            return web.Response(status=HTTPStatus.BAD_REQUEST)
+
+        self._metrics.received += len(notifications)
+        accepted = []
+        for raw in notifications:
+            notification = Notification(raw)
+            if self._is_client_state_valid(notification.client_state):
+                accepted.append(notification)
+            else:
+                self._metrics.rejected += 1
+                self._log(logging.WARNING, f"dropping notification of subscription {notification.subscription_id} "
+                                           f"with an invalid client state")
+
+        if self._queue.maxsize - self._queue.qsize() < len(accepted):
+            self._metrics.throttled_requests += 1
+            return web.Response(status=HTTPStatus.SERVICE_UNAVAILABLE,
+                                headers={"Retry-After": str(self._retry_after_sec)})
+        for notification in accepted:
+            self._queue.put_nowait(notification)
+            if notification.lifecycle_event:
+                self._metrics.lifecycle_events += 1
+        self._metrics.enqueued += len(accepted)
+        self._metrics.max_queue_size_seen = max(self._metrics.max_queue_size_seen, self._queue.qsize())
+        return web.Response(status=HTTPStatus.ACCEPTED)
+
+    def add_routes(self, app: web.Application):
+        """Route the notification and lifecycle urls of app to the receiver"""
+        app.router.add_post(self._notification_path, self._handle)
+        if self._lifecycle_path and self._lifecycle_path != self._notification_path:
+            app.router.add_post(self._lifecycle_path, self._handle)
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        self.add_routes(app)
+        return app
+
+    async def start(self, host: str = "0.0.0.0", port: int = 8080):
+        """Serve the receiver on host:port, until stop()"""
+        if self._runner:
+            return
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def get(self) -> Notification:
+        """The next notification, once one is received"""
+        notification = await self._queue.get()
+        self._queue.task_done()
+        return notification
+
+    async def __aiter__(self) -> typing.AsyncIterator[Notification]:
+        while True:
+            yield await self.get()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
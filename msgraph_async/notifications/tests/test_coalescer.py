@@ -0,0 +1,117 @@
+import json
+import asyncio
+import unittest
+from aioresponses import aioresponses, CallbackResult
+from msgraph_async.client.client import GraphAdminClient
+from msgraph_async.common.exceptions import GraphClientException, NotFound
+from msgraph_async.notifications.coalescer import NotificationCoalescer, parse_mail_resource
+from msgraph_async.notifications.notification import Notification
+from msgraph_async.notifications.generator import build_notification
+
+
+class TestNotificationCoalescer(unittest.IsolatedAsyncioTestCase):
+    _token = "token"
+    mocked_base_url = "http://my-mocked-msgraph-service.com"
+
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    def get_instance(self, **kwargs):
+        client = GraphAdminClient(enable_logging=True, mocked_graph_url=self.mocked_base_url)
+        self.addAsyncCleanup(client.close)
+        return NotificationCoalescer(client, token=self._token, **kwargs)
+
+    def test_parse_mail_resource(self):
+        self.assertEqual(parse_mail_resource(Notification({"resource": "Users/u1/Messages/m1"})), ("u1", "m1"))
+        self.assertEqual(parse_mail_resource(Notification({"resource": "users('u1')/messages('m1')"})),
+                         ("u1", "m1"))
+        self.assertEqual(parse_mail_resource(Notification({"resource": "Users/u1/Messages/x",
+                                                           "resourceData": {"id": "m1"}})), ("u1", "m1"))
+        with self.assertRaises(GraphClientException):
+            parse_mail_resource(Notification({"resource": "chats/getAllMessages"}))
+
+    @aioresponses()
+    async def test_coalesce_and_fetch(self, mocked_res):
+        batches = []
+
+        def batch(url, **kwargs):
+            requests = json.loads(kwargs["data"])["requests"]
+            batches.append(sorted(request["url"] for request in requests))
+            return CallbackResult(status=200, payload={"responses": [
+                {"id": request["id"], "status": 200, "headers": {"Content-Type": "application/json"},
+                 "body": {"id": request["url"].split("/")[-1].split("?")[0], "subject": "hi"}}
+                for request in requests]})
+
+        mocked_res.post(f"{self.mocked_base_url}/v1.0/$batch", callback=batch)
+        mocked_res.get(f"{self.mocked_base_url}/v1.0/users/u2/messages/m4?$select=id,subject", status=404,
+                       payload={"error": "not found"})
+
+        i = self.get_instance(window_sec=0.05, select=["id", "subject"])
+        for change_type, user_id, message_id in [("created", "u1", "m1"), ("updated", "u1", "m1"),
+                                                 ("created", "u1", "m2"), ("updated", "u1", "m1"),
+                                                 ("deleted", "u1", "m3"), ("created", "u2", "m4")]:
+            i.add(build_notification("s1", change_type=change_type, user_id=user_id, resource_id=message_id))
+
+        results = {}
+        for _ in range(4):
+            entry = await asyncio.wait_for(i.get(), 1)
+            results[entry.resource_id] = entry
+        self.assertEqual(batches, [["/users/u1/messages/m1?$select=id,subject",
+                                    "/users/u1/messages/m2?$select=id,subject"]])
+        self.assertEqual(results["m1"].change_types, ["created", "updated", "updated"])
+        self.assertEqual(results["m1"].resource, {"id": "m1", "subject": "hi"})
+        self.assertEqual(results["m2"].resource["id"], "m2")
+        self.assertTrue(results["m3"].is_deleted)
+        self.assertIsNone(results["m3"].resource)
+        self.assertIsInstance(results["m4"].error, NotFound)
+        self.assertEqual((i.received, i.coalesced, i.fetched), (6, 2, 2))
+        await i.close()
+
+    @aioresponses()
+    async def test_full_mailbox_is_fetched_at_once(self, mocked_res):
+        mocked_res.post(f"{self.mocked_base_url}/v1.0/$batch", payload={"responses": [
+            {"id": str(index + 1), "status": 200, "headers": {"Content-Type": "application/json"}, "body": {}}
+            for index in range(2)]})
+        i = self.get_instance(window_sec=60, max_pending=2)
+        i.add(build_notification("s1", user_id="u1", resource_id="m1"))
+        i.add(build_notification("s1", user_id="u1", resource_id="m2"))
+        entries = [await asyncio.wait_for(i.get(), 1) for _ in range(2)]
+        self.assertEqual(sorted(entry.resource_id for entry in entries), ["m1", "m2"])
+        await i.close()
+
+    async def test_slow_consumer_holds_back_the_source(self):
+        i = self.get_instance(window_sec=60, max_pending=1, max_flushes=2, max_output=1)
+        read = []
+
+        async def source():
+            for index in range(20):
+                read.append(index)
+                yield build_notification("s1", change_type="deleted", user_id="u1", resource_id=f"m{index}")
+
+        consume = asyncio.ensure_future(i.consume(source()))
+        await asyncio.sleep(0.05)
+        # one result waits in the output, two flushes wait to hand on theirs and two more wait to start
+        self.assertLessEqual(len(read), 6)
+        entries = [await asyncio.wait_for(i.get(), 1) for _ in range(20)]
+        await asyncio.wait_for(consume, 1)
+        self.assertEqual(sorted(entry.resource_id for entry in entries), sorted(f"m{index}" for index in range(20)))
+        await i.close()
+
+    async def test_flush_with_a_concurrent_consumer(self):
+        i = self.get_instance(window_sec=60, max_output=1)
+        for index in range(3):
+            i.add(build_notification("s1", change_type="deleted", user_id=f"u{index}", resource_id="m1"))
+        entries = []
+
+        async def consume():
+            for _ in range(3):
+                entries.append(await i.get())
+
+        await asyncio.wait_for(asyncio.gather(i.flush(), consume()), 1)
+        self.assertEqual(sorted(entry.user_id for entry in entries), ["u0", "u1", "u2"])
+        await i.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
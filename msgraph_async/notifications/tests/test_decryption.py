@@ -0,0 +1,84 @@
+import os
+import json
+import base64
+import hmac
+import hashlib
+import unittest
+from unittest import mock
+from concurrent.futures import ProcessPoolExecutor
+from cryptography.hazmat.primitives import hashes, serialization, padding as symmetric_padding
+from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from msgraph_async.common.exceptions import GraphClientException
+from msgraph_async.notifications import decryption
+from msgraph_async.notifications.decryption import NotificationDecryptor
+from msgraph_async.notifications.notification import Notification
+
+
+class TestNotificationDecryptor(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        cls.private_key_pem = cls.private_key.private_bytes(serialization.Encoding.PEM,
+                                                            serialization.PrivateFormat.PKCS8,
+                                                            serialization.NoEncryption())
+
+    def encrypt(self, resource_data: dict, symmetric_key: bytes = None, certificate_id: str = "CertificateId"):
+        """Encrypt resource data the way the service does"""
+        symmetric_key = symmetric_key or os.urandom(32)
+        padder = symmetric_padding.PKCS7(128).padder()
+        padded = padder.update(json.dumps(resource_data).encode()) + padder.finalize()
+        encryptor = Cipher(algorithms.AES(symmetric_key), modes.CBC(symmetric_key[:16])).encryptor()
+        data = encryptor.update(padded) + encryptor.finalize()
+        data_key = self.private_key.public_key().encrypt(symmetric_key, padding.OAEP(
+            mgf=padding.MGF1(algorithm=hashes.SHA1()), algorithm=hashes.SHA1(), label=None))
+        return {"encryptedContent": {
+            "data": base64.b64encode(data).decode(),
+            "dataSignature": base64.b64encode(hmac.new(symmetric_key, data, hashlib.sha256).digest()).decode(),
+            "dataKey": base64.b64encode(data_key).decode(),
+            "encryptionCertificateId": certificate_id,
+        }}
+
+    async def test_decrypt(self):
+        async with NotificationDecryptor({"CertificateId": self.private_key_pem}) as i:
+            message = {"id": "m1", "body": {"content": "hello"}}
+            self.assertEqual(await i.decrypt(Notification(self.encrypt(message))), message)
+            self.assertEqual(await i.decrypt(self.encrypt(message)["encryptedContent"]), message)
+
+    async def test_symmetric_keys_are_cached(self):
+        async with NotificationDecryptor({"CertificateId": self.private_key_pem.decode()}, key_cache_size=1) as i:
+            symmetric_key = os.urandom(32)
+            first = self.encrypt({"id": "m1"}, symmetric_key)
+            second = dict(first, encryptedContent=dict(self.encrypt({"id": "m2"}, symmetric_key)["encryptedContent"],
+                                                       dataKey=first["encryptedContent"]["dataKey"]))
+            await i.decrypt(first)
+            with mock.patch.object(decryption, "_load_private_key", side_effect=AssertionError("not cached")):
+                self.assertEqual(await i.decrypt(second), {"id": "m2"})
+            await i.decrypt(self.encrypt({"id": "m3"}))
+            self.assertEqual(len(i._symmetric_keys), 1)
+
+    async def test_tampered_and_unknown_certificate(self):
+        async with NotificationDecryptor({"CertificateId": self.private_key_pem}) as i:
+            notification = self.encrypt({"id": "m1"})
+            notification["encryptedContent"]["dataSignature"] = base64.b64encode(b"x" * 32).decode()
+            with self.assertRaises(GraphClientException):
+                await i.decrypt(notification)
+            with self.assertRaises(GraphClientException):
+                await i.decrypt(self.encrypt({"id": "m1"}, certificate_id="other"))
+            with self.assertRaises(GraphClientException):
+                await i.decrypt({"subscriptionId": "s1"})
+
+    async def test_decrypt_many_in_process_pool(self):
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            async with NotificationDecryptor({"CertificateId": self.private_key_pem}, executor=executor) as i:
+                notifications = [self.encrypt({"id": str(index)}) for index in range(8)]
+                notifications[3]["encryptedContent"]["encryptionCertificateId"] = "other"
+                results = await i.decrypt_many(notifications)
+        self.assertIsInstance(results[3], GraphClientException)
+        self.assertEqual([result["id"] for index, result in enumerate(results) if index != 3],
+                         [str(index) for index in range(8) if index != 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
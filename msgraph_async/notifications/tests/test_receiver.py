@@ -0,0 +1,91 @@
+import unittest
+import aiohttp
+from aiohttp.test_utils import unused_port
+from msgraph_async.notifications.receiver import NotificationReceiver
+from msgraph_async.notifications.notification import MISSED
+from msgraph_async.notifications.generator import build_notification, post_notifications, validate
+
+
+class TestNotificationReceiver(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.port = unused_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    async def get_instance(self, **kwargs):
+        receiver = NotificationReceiver(**kwargs)
+        await receiver.start("127.0.0.1", self.port)
+        self.addAsyncCleanup(receiver.stop)
+        return receiver
+
+    async def test_validation(self):
+        receiver = await self.get_instance(client_state="secret")
+        self.assertEqual(await validate(f"{self.url}/notifications", "token <with> spaces"),
+                         (200, "token <with> spaces"))
+        self.assertEqual(await validate(f"{self.url}/lifecycle", "token2"), (200, "token2"))
+        self.assertEqual(receiver.metrics.validations, 2)
+        self.assertEqual(receiver.queue.qsize(), 0)
+
+    async def test_notifications_are_queued(self):
+        receiver = await self.get_instance(client_state=["old-secret", "secret"])
+        notifications = [build_notification("s1", "secret", resource_id=str(index)) for index in range(50)]
+        statuses = await post_notifications(f"{self.url}/notifications", notifications, per_request=5)
+        self.assertEqual(statuses, [202] * 10)
+        received = [await receiver.get() for _ in range(50)]
+        self.assertEqual(sorted(notification.resource_id for notification in received),
+                         sorted(str(index) for index in range(50)))
+        self.assertEqual(received[0].subscription_id, "s1")
+        self.assertEqual(received[0].change_type, "created")
+        self.assertIsNotNone(received[0].subscription_expiration)
+        self.assertEqual(receiver.metrics.enqueued, 50)
+        self.assertEqual(receiver.metrics.queue_size, 0)
+
+    async def test_invalid_client_state_is_dropped(self):
+        receiver = await self.get_instance(client_state="secret")
+        notifications = [build_notification("s1", "secret", resource_id="good"),
+                         build_notification("s1", "guess", resource_id="forged"),
+                         build_notification("s1", None, resource_id="missing")]
+        self.assertEqual(await post_notifications(f"{self.url}/notifications", notifications, per_request=3), [202])
+        self.assertEqual((await receiver.get()).resource_id, "good")
+        self.assertEqual(receiver.queue.qsize(), 0)
+        self.assertEqual(receiver.metrics.rejected, 2)
+
+    async def test_lifecycle_events(self):
+        receiver = await self.get_instance(client_state="secret")
+        notification = build_notification("s1", "secret", lifecycle_event=MISSED)
+        self.assertEqual(await post_notifications(f"{self.url}/lifecycle", [notification]), [202])
+        self.assertEqual((await receiver.get()).lifecycle_event, MISSED)
+        self.assertEqual(receiver.metrics.lifecycle_events, 1)
+
+    async def test_full_queue_is_throttled(self):
+        receiver = await self.get_instance(max_queue_size=4, retry_after_sec=7)
+        notifications = [build_notification("s1", resource_id=str(index)) for index in range(9)]
+        statuses = await post_notifications(f"{self.url}/notifications", notifications, per_request=3,
+                                            concurrency=1)
+        self.assertEqual(statuses, [202, 503, 503])
+        self.assertEqual(receiver.metrics.throttled_requests, 2)
+        self.assertEqual(receiver.metrics.max_queue_size_seen, 3)
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f"{self.url}/notifications", json={"value": notifications[:2]}) as resp:
+                self.assertEqual(resp.status, 503)
+                self.assertEqual(resp.headers["Retry-After"], "7")
+            await receiver.get()
+            async with session.post(f"{self.url}/notifications", json={"value": notifications[:2]}) as resp:
+                self.assertEqual(resp.status, 202)
+
+    async def test_bad_request(self):
+        receiver = await self.get_instance()
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f"{self.url}/notifications", data="not json") as resp:
+                self.assertEqual(resp.status, 400)
+            async with session.post(f"{self.url}/notifications", json={"value": "x"}) as resp:
+                self.assertEqual(resp.status, 400)
+        self.assertEqual(receiver.metrics.bad_requests, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()